@@ -35,6 +35,7 @@ def bench(session: nox.Session) -> None:
         "--benchmark-storage",
         storage,
         "--benchmark-only",
+        "--benchmark-autosave",
         "--benchmark-group-by",
         "func",
         *session.posargs,
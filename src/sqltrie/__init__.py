@@ -1,9 +1,15 @@
 from .pygtrie import PyGTrie  # noqa: F401, pylint: disable=unused-import
 from .serialized import (  # noqa: F401, pylint: disable=unused-import
+    CodecTrie,
     JSONTrie,
+    LazyValue,
     SerializedTrie,
 )
-from .sqlite import SQLiteTrie  # noqa: F401, pylint: disable=unused-import
+from .snapshot import SnapshotTrie  # noqa: F401, pylint: disable=unused-import
+from .sqlite import (  # noqa: F401, pylint: disable=unused-import
+    AsyncSQLiteTrie,
+    SQLiteTrie,
+)
 from .trie import (  # noqa: F401, pylint: disable=unused-import
     ADD,
     DELETE,
@@ -0,0 +1,164 @@
+from collections import OrderedDict
+from collections.abc import Hashable, Iterator, MutableMapping
+from typing import Any, Callable, NamedTuple, Optional
+
+_MISSING = object()
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: Optional[int]
+    currsize: int
+
+
+class LRUCache(MutableMapping):
+    """Mapping that evicts least recently used entries once the total size of
+    its entries exceeds maxsize (None means unbounded, 0 disables caching).
+    """
+
+    def __init__(
+        self,
+        maxsize: Optional[int],
+        getsizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        self.maxsize = maxsize
+        self.getsizeof = getsizeof
+        self.currsize = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self._sizes: dict[Hashable, int] = {}
+
+    def __getitem__(self, key):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def set(self, key: Hashable, value: Any, size: Optional[int] = None) -> None:
+        # NOTE: size could be passed explicitly when the caller already knows
+        # it, e.g. the size of the serialized representation of the value.
+        if size is None:
+            size = self.getsizeof(value) if self.getsizeof else 1
+        self.pop(key, None)
+        if self.maxsize is not None and size > self.maxsize:
+            return
+
+        self._data[key] = value
+        self._sizes[key] = size
+        self.currsize += size
+        while self.maxsize is not None and self.currsize > self.maxsize:
+            self._remove(next(iter(self._data)))
+
+    def _remove(self, key):
+        self.currsize -= self._sizes.pop(key)
+        return self._data.pop(key)
+
+    def __delitem__(self, key):
+        if key not in self._data:
+            raise KeyError(key)
+        self._remove(key)
+
+    def pop(self, key, default=_MISSING):
+        # NOTE: bypassing __getitem__, so that it doesn't count as a lookup
+        if key not in self._data:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+        return self._remove(key)
+
+    def __contains__(self, key):
+        # NOTE: affects neither the order nor the stats
+        return key in self._data
+
+    def __iter__(self) -> Iterator[Hashable]:
+        # NOTE: iterating over a copy, so that lookups and deletions could be
+        # done while iterating.
+        return iter(list(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+        self._sizes.clear()
+        self.currsize = 0
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, self.currsize)
+
+
+class PrefixLRUCache(LRUCache):
+    """LRUCache keyed by tuples, that can drop all of the keys starting with
+    a given prefix without scanning the whole cache.
+    """
+
+    def __init__(
+        self,
+        maxsize: Optional[int],
+        getsizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        super().__init__(maxsize, getsizeof=getsizeof)
+        # NOTE: nested dicts by names of the cached keys, each key is marked
+        # by _MISSING in the dict of its last name.
+        self._index: dict = {}
+
+    def set(self, key: Hashable, value: Any, size: Optional[int] = None) -> None:
+        super().set(key, value, size=size)
+        if key not in self._data:
+            return
+        node = self._index
+        for name in key:  # type: ignore[attr-defined]
+            node = node.setdefault(name, {})
+        node[_MISSING] = None
+
+    def _path(self, key):
+        path = [self._index]
+        for name in key:
+            node = path[-1].get(name)
+            if node is None:
+                return None
+            path.append(node)
+        return path
+
+    @staticmethod
+    def _prune(path, key):
+        # NOTE: dropping the dicts that don't lead to any keys anymore
+        for depth in range(len(key), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][key[depth - 1]]
+
+    def _remove(self, key):
+        path = self._path(key)
+        del path[-1][_MISSING]
+        self._prune(path, key)
+        return super()._remove(key)
+
+    def pop_prefix(self, prefix: tuple) -> None:
+        path = self._path(prefix)
+        if path is None:
+            return
+
+        stack = [(prefix, path[-1])]
+        while stack:
+            key, node = stack.pop()
+            for name, child in node.items():
+                if name is _MISSING:
+                    super()._remove(key)
+                else:
+                    stack.append(((*key, name), child))
+        path[-1].clear()
+        self._prune(path, prefix)
+
+    def clear(self):
+        super().clear()
+        self._index.clear()
@@ -0,0 +1,178 @@
+import json
+import lzma
+import pickle
+import zlib
+from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+from typing import Any, Optional
+
+try:
+    import orjson
+
+    def json_loads(value):
+        return orjson.loads(value)  # pylint: disable=no-member
+
+    def json_dumps(value):
+        return orjson.dumps(value)  # pylint: disable=no-member
+
+except ImportError:
+    # NOTE: orjson doesn't support PyPy, see
+    # https://github.com/ijl/orjson/issues/90
+
+    def json_loads(value):
+        return json.loads(value.decode("utf-8"))
+
+    def json_dumps(value):
+        return json.dumps(value).encode("utf-8")
+
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# NOTE: zlib only looks back this far, so there is no point in having a
+# bigger dictionary.
+ZDICT_SIZE = 32 * 1024
+LZMA_DICT_SIZE = 64 * 1024
+
+
+class Codec(ABC):
+    @abstractmethod
+    def dumps(self, value: Any) -> bytes:
+        pass
+
+    @abstractmethod
+    def loads(self, raw: bytes) -> Any:
+        pass
+
+    def dumps_many(self, values: Iterable[Any]) -> Iterator[bytes]:
+        # NOTE: codecs are expected to override these with something smarter
+        # when they could share work between values.
+        return map(self.dumps, values)
+
+    def loads_many(self, raws: Iterable[bytes]) -> Iterator[Any]:
+        return map(self.loads, raws)
+
+
+class JSONCodec(Codec):
+    def dumps(self, value):
+        return json_dumps(value)
+
+    def loads(self, raw):
+        return json_loads(raw)
+
+
+class PickleCodec(Codec):
+    def __init__(self, protocol: int = pickle.HIGHEST_PROTOCOL):
+        self.protocol = protocol
+
+    def dumps(self, value):
+        return pickle.dumps(value, protocol=self.protocol)
+
+    def loads(self, raw):
+        # NOTE: only use this for databases that you trust
+        return pickle.loads(raw)  # noqa: S301
+
+
+class MsgpackCodec(Codec):
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("msgpack is required, install 'sqltrie[msgpack]'")
+
+    def dumps(self, value):
+        return msgpack.packb(value)
+
+    def loads(self, raw):
+        return msgpack.unpackb(raw)
+
+
+class ZlibCodec(Codec):
+    """Compresses values serialized by another codec.
+
+    With a preset dictionary (see train()), small values that share a lot
+    with each other compress much better than they would on their own.
+    """
+
+    def __init__(self, codec: Codec, level: int = -1, zdict: Optional[bytes] = None):
+        self.codec = codec
+        self.level = level
+        self.zdict = zdict
+        # NOTE: priming compressors with a dictionary is not free, so we do
+        # that once and then copy the primed ones for every value.
+        if zdict:
+            self._compressor = zlib.compressobj(level, zdict=zdict)
+            self._decompressor = zlib.decompressobj(zdict=zdict)
+
+    @classmethod
+    def train(
+        cls,
+        codec: Codec,
+        samples: Iterable[Any],
+        level: int = -1,
+        size: int = ZDICT_SIZE,
+    ) -> "ZlibCodec":
+        # NOTE: zlib has no dictionary trainer (unlike zstd), but using the
+        # samples themselves works well for values with a similar structure.
+        # zlib prefers matches that are closer to the end of the dictionary,
+        # so the most common samples go last.
+        counts: dict[bytes, int] = {}
+        for raw in codec.dumps_many(samples):
+            counts[raw] = counts.get(raw, 0) + 1
+        raws = sorted(counts, key=lambda raw: counts[raw])
+        zdict = b"".join(raws)[-size:]
+        return cls(codec, level=level, zdict=zdict or None)
+
+    def _compress(self, raw):
+        if not self.zdict:
+            return zlib.compress(raw, self.level)
+        compressor = self._compressor.copy()
+        return compressor.compress(raw) + compressor.flush()
+
+    def _decompress(self, raw):
+        if not self.zdict:
+            return zlib.decompress(raw)
+        decompressor = self._decompressor.copy()
+        return decompressor.decompress(raw) + decompressor.flush()
+
+    def dumps(self, value):
+        return self._compress(self.codec.dumps(value))
+
+    def loads(self, raw):
+        return self.codec.loads(self._decompress(raw))
+
+    def dumps_many(self, values):
+        return map(self._compress, self.codec.dumps_many(values))
+
+    def loads_many(self, raws):
+        return self.codec.loads_many(map(self._decompress, raws))
+
+
+class LZMACodec(Codec):
+    def __init__(self, codec: Codec, preset: int = 6):
+        self.codec = codec
+        self.preset = preset
+        # NOTE: raw format skips the xz container, which is a lot of overhead
+        # for small values. Same goes for the default dictionary (8MiB for
+        # preset 6), which is allocated for every value that we compress.
+        self._filters = [
+            {"id": lzma.FILTER_LZMA2, "preset": preset, "dict_size": LZMA_DICT_SIZE}
+        ]
+
+    def _compress(self, raw):
+        return lzma.compress(raw, format=lzma.FORMAT_RAW, filters=self._filters)
+
+    def _decompress(self, raw):
+        return lzma.decompress(raw, format=lzma.FORMAT_RAW, filters=self._filters)
+
+    def dumps(self, value):
+        return self._compress(self.codec.dumps(value))
+
+    def loads(self, raw):
+        return self.codec.loads(self._decompress(raw))
+
+    def dumps_many(self, values):
+        return map(self._compress, self.codec.dumps_many(values))
+
+    def loads_many(self, raws):
+        return self.codec.loads_many(map(self._decompress, raws))
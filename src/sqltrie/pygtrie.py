@@ -3,9 +3,6 @@ from typing import Optional
 import pygtrie
 
 from .trie import (
-    ADD,
-    DELETE,
-    MODIFY,
     UNCHANGED,
     AbstractTrie,
     Change,
@@ -13,12 +10,19 @@ from .trie import (
     ShortKeyError,
     TrieKey,
     TrieNode,
+    diff_items,
 )
 
 
 class PyGTrie(AbstractTrie):
     def __init__(self, *args, **kwargs):
         self._trie = pygtrie.Trie()
+        # NOTE: iterating over children in sorted order, so that items come in
+        # key order, same as they do in the other tries.
+        self._trie.enable_sorting()
+        # NOTE: views share self._trie with their parent and only prepend
+        # _root_key to every key they are given.
+        self._root_key: TrieKey = ()
         super().__init__(*args, **kwargs)
 
     @classmethod
@@ -34,68 +38,102 @@ class PyGTrie(AbstractTrie):
     def rollback(self):
         raise NotImplementedError
 
+    def _key(self, key):
+        return (*self._root_key, *key)
+
+    def _strip(self, key):
+        return tuple(key[len(self._root_key) :])
+
     def __setitem__(self, key, value):
-        self._trie[key] = value
+        self._trie[self._key(key)] = value
 
     def __iter__(self):
         yield from (key for key, _ in self.items())
 
     def __getitem__(self, key):
         try:
-            return self._trie[key]
+            return self._trie[self._key(key)]
         except pygtrie.ShortKeyError as exc:
             raise ShortKeyError(key) from exc
 
     def __delitem__(self, key):
-        del self._trie[key]
+        del self._trie[self._key(key)]
 
     def __len__(self):
-        return len(self._trie)
+        if not self._root_key:
+            return len(self._trie)
+        if not self._trie.has_node(self._root_key):
+            return 0
+        return sum(1 for _ in self._trie.iterkeys(prefix=self._root_key))
 
     def has_node(self, key):
-        return bool(self._trie.has_node(key))
+        return bool(self._trie.has_node(self._key(key)))
+
+    def get_many(self, keys, default=None):
+        return [self._trie.get(self._key(key), default) for key in keys]
+
+    def has_nodes(self, keys):
+        return [bool(self._trie.has_node(self._key(key))) for key in keys]
 
     def delete_node(self, key):
         raise NotImplementedError
 
+    def delete_subtree(self, key):
+        # NOTE: pygtrie deletes the whole subtree when given a slice
+        del self._trie[self._key(key) :]
+
     def items(self, prefix=None, shallow=False):
+        if prefix is None and not self._trie.has_node(self._root_key):
+            # NOTE: a view of a key that doesn't exist yet is just empty
+            return
+
         kwargs = {"shallow": shallow}
-        if prefix is not None:
-            kwargs["prefix"] = prefix
+        if prefix is not None or self._root_key:
+            kwargs["prefix"] = self._key(prefix or ())
 
-        yield from self._trie.iteritems(**kwargs)
+        if not self._root_key:
+            yield from self._trie.iteritems(**kwargs)
+            return
+
+        for key, value in self._trie.iteritems(**kwargs):
+            yield self._strip(key), value
 
     def prefixes(self, key):
-        return self._trie.prefixes(key)
+        depth = len(self._root_key)
+        for step in self._trie.prefixes(self._key(key)):
+            pkey, value = step
+            if len(pkey) >= depth:
+                yield self._strip(pkey), value
 
     def shortest_prefix(self, key):
-        return self._trie.shortest_prefix(key)
+        return next(self.prefixes(key), None)
 
     def longest_prefix(self, key):
-        ret = self._trie.longest_prefix(key)
-        if ret == pygtrie.Trie._NONE_STEP:
-            return None
-        return tuple(ret)
+        ret = None
+        for step in self.prefixes(key):
+            ret = step
+        return ret
 
     def traverse(self, node_factory: NodeFactory, prefix: Optional[TrieKey] = None):
         kwargs = {}
-        if prefix is not None:
-            kwargs["prefix"] = prefix
+        if prefix is not None or self._root_key:
+            kwargs["prefix"] = self._key(prefix or ())
 
-        return self._trie.traverse(node_factory, **kwargs)
+        if not self._root_key:
+            return self._trie.traverse(node_factory, **kwargs)
 
-    def view(self, key=None):
-        ret = PyGTrie()
-        kwargs = {}
-        if key is not None:
-            kwargs["prefix"] = key
+        def _node_factory(path_conv, path, *args):
+            return node_factory(path_conv, self._strip(path), *args)
 
-        try:
-            for ikey, value in self._trie.iteritems(**kwargs):
-                ret[ikey[len(key) :]] = value
-        except KeyError:
-            pass
+        return self._trie.traverse(_node_factory, **kwargs)
 
+    def view(self, key=None):
+        if not key:
+            return self
+
+        ret = PyGTrie()
+        ret._trie = self._trie
+        ret._root_key = self._key(key)
         return ret
 
     def ls(self, key, with_values=False):
@@ -110,25 +148,22 @@ class PyGTrie(AbstractTrie):
 
         return self.traverse(node_factory, prefix=key)
 
+    def _subtree_items(self, key):
+        prefix = self._key(key or ())
+        for ikey, value in self._trie.iteritems(prefix=prefix):
+            yield tuple(ikey[len(prefix) :]), value
+
     def diff(self, old, new, with_unchanged=False):
-        # FIXME this is not the most optimal implementation
-        old_keys = {key for key, _ in self.items(old or ())}
-        new_keys = {key for key, _ in self.items(new or ())}
-
-        for key in old_keys | new_keys:
-            old_entry = self.get(key)
-            new_entry = self.get(key)
-
-            typ = UNCHANGED
-            if old_entry and not new_entry:
-                typ = DELETE
-            elif not old_entry and new_entry:
-                typ = ADD
-            elif old_entry != new_entry:
-                typ = MODIFY
-            elif not with_unchanged:
-                continue
-
-            old_node = TrieNode(key[len(old) :], old_entry) if old_entry else None
-            new_node = TrieNode(key[len(new) :], new_entry) if new_entry else None
-            yield Change(typ, old_node, new_node)
+        # NOTE: only using the public API of pygtrie, as its internals change
+        # between releases. Both subtrees come in key order (see __init__), so
+        # changes are found with a single merge-join of the two.
+        old_items = self._subtree_items(old)
+        new_items = self._subtree_items(new)
+        if self._key(old or ()) != self._key(new or ()):
+            yield from diff_items(old_items, new_items, with_unchanged)
+            return
+
+        for key, value in old_items:
+            if key and with_unchanged:
+                entry = TrieNode(key, value)
+                yield Change(UNCHANGED, entry, entry)
@@ -1,45 +1,103 @@
-import json
+import sys
 from abc import abstractmethod
+from collections.abc import Mapping
+from itertools import islice
 from typing import Any, Optional
 
-try:
-    import orjson
+from .cache import CacheInfo, PrefixLRUCache
+from .codecs import (  # noqa: F401, pylint: disable=unused-import
+    Codec,
+    JSONCodec,
+    json_dumps,
+    json_loads,
+)
+from .trie import AbstractTrie, Iterator, NodeFactory, TrieItems, TrieKey
 
-    def json_loads(value):
-        return orjson.loads(value)  # pylint: disable=no-member
+# NOTE: number of values that are encoded/decoded at once
+BATCH_SIZE = 1024
 
-    def json_dumps(value):
-        return orjson.dumps(value)  # pylint: disable=no-member
+_MISSING = object()
 
-except ImportError:
-    # NOTE: orjson doesn't support PyPy, see
-    # https://github.com/ijl/orjson/issues/90
 
-    def json_loads(value):
-        return json.load(value.decode("utf-8"))
+def _batches(entries):
+    it = iter(entries)
+    while batch := list(islice(it, BATCH_SIZE)):
+        yield tuple(zip(*batch))
 
-    def json_dumps(value):
-        return json.dumps(value).encode("utf-8")
 
+class LazyValue:
+    """Raw value that is decoded on first access to .value."""
 
-from .trie import AbstractTrie, Iterator, NodeFactory, TrieKey
+    __slots__ = ("_load", "_value", "key", "raw")
+
+    def __init__(self, load, key: TrieKey, raw: bytes):
+        self._load = load
+        self._value = _MISSING
+        self.key = key
+        self.raw = raw
+
+    @property
+    def value(self) -> Any:
+        if self._value is _MISSING:
+            self._value = self._load(self.key, self.raw)
+        return self._value
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.key!r})"
 
 
 class SerializedTrie(AbstractTrie):
+    # NOTE: optional cache of loaded values by absolute keys, shared with
+    # views. Cached values are returned as is, so they shouldn't be mutated.
+    _values: Optional[PrefixLRUCache] = None
+    _values_prefix: TrieKey = ()
+
+    def __init__(self, *args, value_cache_size: int = 0, **kwargs):
+        if value_cache_size:
+            # NOTE: values are accounted for by the size of their raw form
+            self._values = PrefixLRUCache(value_cache_size)
+        super().__init__(*args, **kwargs)
+
     @property
     @abstractmethod
     def _trie(self):
         pass
 
     def close(self):
+        if self._values is not None:
+            self._values.clear()
         self._trie.close()
 
     def commit(self):
+        in_transaction = self._trie.in_transaction
         self._trie.commit()
+        if in_transaction and self._values is not None:
+            # NOTE: other threads might have cached values that were just
+            # overwritten.
+            self._values.clear()
 
     def rollback(self):
+        if self._values is not None:
+            self._values.clear()
         self._trie.rollback()
 
+    @property
+    def in_transaction(self) -> bool:
+        return self._trie.in_transaction
+
+    def value_cache_info(self) -> Optional[CacheInfo]:
+        if self._values is None:
+            return None
+        return self._values.info()
+
+    def _cache_key(self, key):
+        return (*self._values_prefix, *key)
+
+    def _forget(self, key):
+        if self._values is None:
+            return
+        self._values.pop_prefix(self._cache_key(key))
+
     @abstractmethod
     def _load(self, key: TrieKey, value: Optional[bytes]) -> Optional[Any]:
         pass
@@ -48,14 +106,86 @@ class SerializedTrie(AbstractTrie):
     def _dump(self, key: TrieKey, value: Optional[Any]) -> Optional[bytes]:
         pass
 
+    def _load_many(self, keys, raws) -> Iterator[Optional[Any]]:
+        return map(self._load, keys, raws)
+
+    def _dump_many(self, keys, values) -> Iterator[Optional[bytes]]:
+        return map(self._dump, keys, values)
+
     def __setitem__(self, key, value):
+        # NOTE: not caching the value itself, as the caller might still
+        # mutate it, values are only cached once they are loaded.
+        if self._values is not None:
+            self._values.pop(self._cache_key(key), None)
         self._trie[key] = self._dump(key, value)
 
     def __getitem__(self, key):
+        # NOTE: the cache is shared between threads, while transactions are
+        # not, so it is only used for committed values.
+        if self._values is None or self._trie.in_transaction:
+            return self._load(key, self._trie[key])
+
+        cache_key = self._cache_key(key)
+        try:
+            return self._values[cache_key]
+        except KeyError:
+            pass
+
         raw = self._trie[key]
-        return self._load(key, raw)
+        value = self._load(key, raw)
+        self._values.set(cache_key, value, sys.getsizeof(raw))
+        return value
+
+    def update(self, *args, **kwargs):
+        # NOTE: MutableMapping.update() sets items one by one, while
+        # update_many() encodes them in batches.
+        if len(args) > 1:
+            raise TypeError(f"update expected at most 1 argument, got {len(args)}")
+        if args:
+            self.update_many(args[0])
+        if kwargs:
+            super().update(**kwargs)
+
+    def update_many(self, items: TrieItems) -> None:
+        if isinstance(items, Mapping):
+            items = items.items()
+
+        def _dumped():
+            for keys, values in _batches(items):
+                if self._values is not None:
+                    for key in keys:
+                        self._values.pop(self._cache_key(key), None)
+                yield from zip(keys, self._dump_many(keys, values))
+
+        self._trie.update_many(_dumped())
+
+    def _load_steps(self, steps):
+        # NOTE: decodes (key, raw) steps in batches, None steps are kept as is
+        found = [step for step in steps if step is not None]
+        loaded = (
+            value
+            for keys, raws in _batches(found)
+            for value in self._load_many(keys, raws)
+        )
+        return [None if step is None else (step[0], next(loaded)) for step in steps]
+
+    def get_many(self, keys, default=None):
+        keys = [tuple(key) for key in keys]
+        raws = self._trie.get_many(keys, default=_MISSING)
+        steps = self._load_steps(
+            [None if raw is _MISSING else (key, raw) for key, raw in zip(keys, raws)]
+        )
+        return [default if step is None else step[1] for step in steps]
+
+    def has_nodes(self, keys):
+        return self._trie.has_nodes(keys)
+
+    def longest_prefix_many(self, keys):
+        return self._load_steps(self._trie.longest_prefix_many(keys))
 
     def __delitem__(self, key):
+        if self._values is not None:
+            self._values.pop(self._cache_key(key), None)
         del self._trie[key]
 
     def __len__(self):
@@ -69,25 +199,45 @@ class SerializedTrie(AbstractTrie):
         trie = type(self)()
         # pylint: disable-next=protected-access
         trie._trie = raw_trie  # type: ignore[misc]
+        trie._values = self._values  # pylint: disable=protected-access
+        trie._values_prefix = self._cache_key(key)  # pylint: disable=protected-access
         return trie
 
-    def items(self, *args, **kwargs):
-        yield from (
-            (key, self._load(key, raw))
-            for key, raw in self._trie.items(*args, **kwargs)
-        )
+    def _lazy(self, key, raw):
+        # NOTE: there is nothing to decode for nodes without values
+        if raw is None:
+            return None
+        return LazyValue(self._load, key, raw)
 
-    def ls(self, key, with_values=False):
+    def items(self, *args, lazy: bool = False, **kwargs):
+        entries = self._trie.items(*args, **kwargs)
+        if lazy:
+            yield from ((key, self._lazy(key, raw)) for key, raw in entries)
+            return
+
+        for keys, raws in _batches(entries):
+            yield from zip(keys, self._load_many(keys, raws))
+
+    def ls(self, key, with_values=False, lazy: bool = False):
         entries = self._trie.ls(key, with_values=with_values)
-        if with_values:
-            yield from ((ekey, self._load(ekey, evalue)) for ekey, evalue in entries)
-        else:
+        if not with_values:
             yield from entries
+            return
+
+        load = self._lazy if lazy else self._load
+        yield from ((ekey, load(ekey, evalue)) for ekey, evalue in entries)
+
+    def traverse(
+        self,
+        node_factory: NodeFactory,
+        prefix: Optional[TrieKey] = None,
+        lazy: bool = False,
+    ):
+        load = self._lazy if lazy else self._load
 
-    def traverse(self, node_factory: NodeFactory, prefix: Optional[TrieKey] = None):
         def _node_factory_wrapper(path_conv, path, children, *value):
-            value = value[0] if value else None
-            return node_factory(path_conv, path, children, self._load(path, value))
+            value = load(path, value[0]) if value else None
+            return node_factory(path_conv, path, children, value)
 
         return self._trie.traverse(_node_factory_wrapper, prefix=prefix)
 
@@ -98,8 +248,13 @@ class SerializedTrie(AbstractTrie):
         return self._trie.has_node(key)
 
     def delete_node(self, key):
+        self._forget(key)
         return self._trie.delete_node(key)
 
+    def delete_subtree(self, key):
+        self._forget(key)
+        self._trie.delete_subtree(key)
+
     def shortest_prefix(self, key):
         sprefix = self._trie.shortest_prefix(key)
         if sprefix is None:
@@ -124,13 +279,37 @@ class SerializedTrie(AbstractTrie):
         yield from self._trie
 
 
-class JSONTrie(SerializedTrie):  # pylint: disable=abstract-method
+class CodecTrie(SerializedTrie):  # pylint: disable=abstract-method
+    codec: Codec = JSONCodec()
+
+    def __init__(self, *args, codec: Optional[Codec] = None, **kwargs):
+        if codec is not None:
+            self.codec = codec
+        super().__init__(*args, **kwargs)
+
+    def view(self, key: Optional[TrieKey] = None) -> "CodecTrie":
+        trie = super().view(key)
+        trie.codec = self.codec  # type: ignore[attr-defined]
+        return trie  # type: ignore[return-value]
+
     def _load(self, key: TrieKey, value: Optional[bytes]) -> Optional[Any]:
         if value is None:
             return None
-        return json_loads(value)
+        return self.codec.loads(value)
 
     def _dump(self, key: TrieKey, value: Optional[Any]) -> Optional[bytes]:
         if value is None:
             return None
-        return json_dumps(value)
+        return self.codec.dumps(value)
+
+    def _load_many(self, keys, raws):
+        loaded = self.codec.loads_many(raw for raw in raws if raw is not None)
+        return (None if raw is None else next(loaded) for raw in raws)
+
+    def _dump_many(self, keys, values):
+        dumped = self.codec.dumps_many(value for value in values if value is not None)
+        return (None if value is None else next(dumped) for value in values)
+
+
+class JSONTrie(CodecTrie):  # pylint: disable=abstract-method
+    codec = JSONCodec()
@@ -0,0 +1,363 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterator, Mapping
+from typing import Any, Optional, Union
+
+from .trie import (
+    AbstractTrie,
+    NodeFactory,
+    ShortKeyError,
+    TrieItems,
+    TrieKey,
+    TrieNode,
+    TrieStep,
+    diff_items,
+)
+
+# NOTE: file layout is
+#
+#   header | key offsets | records | keys | values
+#
+# Keys are sorted and every node (including the root and nodes without
+# values) has one, so that has_node() and ls() work the same way as they do
+# in other tries. Key offsets has one more entry than there are nodes, so
+# that key i is keys[offsets[i]:offsets[i + 1]].
+MAGIC = b"SQLTRIE\x01"
+HEADER = struct.Struct("<8sQQ")  # magic, number of nodes, number of values
+# NOTE: flags, value offset, value size and the index of the first node after
+# this node's subtree.
+RECORD = struct.Struct("<IQQQ")
+OFFSET = struct.Struct("<Q")
+
+HAS_VALUE = 1
+NONE_VALUE = 2
+
+# NOTE: keys are stored as names each prefixed with a NUL, which makes byte
+# order of the encoded keys the same as the order of the tuples and puts
+# descendants of a key right after it.
+SEP = b"\x00"
+
+
+def _encode(key: TrieKey) -> bytes:
+    ret = b""
+    for name in key:
+        if "\x00" in name:
+            raise ValueError(f"NUL characters are not supported in {key!r}")
+        ret += SEP + name.encode("utf-8")
+    return ret
+
+
+def _decode(enc: bytes) -> TrieKey:
+    return tuple(name.decode("utf-8") for name in enc.split(SEP)[1:])
+
+
+def _collect(items):
+    values: dict[bytes, Optional[bytes]] = {}
+    nodes = {b""}
+    for key, value in items:
+        key = tuple(key)
+        enc = _encode(key)
+        values[enc] = value
+        for depth in range(1, len(key)):
+            nodes.add(_encode(key[:depth]))
+    nodes.update(values)
+    encs = sorted(nodes)
+
+    # NOTE: computing where the subtree of each node ends, so that we could
+    # skip over subtrees without scanning them.
+    ends = [len(encs)] * len(encs)
+    stack: list[int] = []
+    for idx, enc in enumerate(encs):
+        while stack and not enc.startswith(encs[stack[-1]] + SEP):
+            ends[stack.pop()] = idx
+        stack.append(idx)
+    return values, encs, ends
+
+
+class _Keys:
+    """Sorted sequence of the encoded keys, read straight from the mapping."""
+
+    def __init__(self, mm, offsets):
+        self._mm = mm
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        return self._mm[self._offsets[idx] : self._offsets[idx + 1]]
+
+
+class SnapshotTrie(AbstractTrie):
+    """Read-only trie backed by an immutable, memory-mapped file.
+
+    Values are returned as memoryviews into the mapped file, so they stay
+    valid only as long as the snapshot is open.
+    """
+
+    def __init__(self, *args, **kwargs):
+        if args or kwargs:
+            raise NotImplementedError
+        self._mm: Optional[mmap.mmap] = None
+        self._buf: Optional[memoryview] = None
+        self._keys: Any = _Keys(b"", [0])
+        self._records = 0
+        self._values = 0
+        self._root_key: TrieKey = ()
+        self._root_enc = b""
+        # NOTE: views borrow the mapping of the trie they were created from
+        self._owner = True
+        super().__init__()
+
+    @classmethod
+    def open(cls, path: str) -> "SnapshotTrie":
+        trie = cls()
+        with open(path, "rb") as fobj:
+            trie._mm = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+        trie._buf = memoryview(trie._mm)
+        magic, nodes, trie._values = HEADER.unpack_from(trie._mm)
+        if magic != MAGIC:
+            trie.close()
+            raise ValueError(f"'{path}' is not a trie snapshot")
+
+        end = HEADER.size + OFFSET.size * (nodes + 1)
+        offsets: Any = trie._buf[HEADER.size : end].cast("Q")
+        if sys.byteorder != "little":
+            offsets = array("Q", offsets)
+            offsets.byteswap()
+        trie._keys = _Keys(trie._mm, offsets)
+        trie._records = end
+        return trie
+
+    @classmethod
+    def write(cls, path: str, items: Union[AbstractTrie, TrieItems]) -> None:
+        if isinstance(items, (AbstractTrie, Mapping)):
+            items = items.items()
+
+        values, encs, ends = _collect(items)
+
+        keys_offset = (
+            HEADER.size + OFFSET.size * (len(encs) + 1) + RECORD.size * len(encs)
+        )
+        values_offset = keys_offset + sum(len(enc) for enc in encs)
+
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as fobj:
+            fobj.write(HEADER.pack(MAGIC, len(encs), len(values)))
+
+            pos = keys_offset
+            for enc in encs:
+                fobj.write(OFFSET.pack(pos))
+                pos += len(enc)
+            fobj.write(OFFSET.pack(pos))
+
+            pos = values_offset
+            for enc, end in zip(encs, ends):
+                flags = 0
+                size = 0
+                if enc in values:
+                    flags |= HAS_VALUE
+                    value = values[enc]
+                    if value is None:
+                        flags |= NONE_VALUE
+                    else:
+                        size = len(value)
+                fobj.write(RECORD.pack(flags, pos, size, end))
+                pos += size
+
+            for enc in encs:
+                fobj.write(enc)
+            for enc in encs:
+                value = values.get(enc)
+                if value:
+                    fobj.write(value)
+        os.replace(tmp, path)
+
+    def close(self):
+        self._keys = _Keys(b"", [0])
+        if not self._owner:
+            self._buf = None
+            self._mm = None
+            return
+        if self._buf is not None:
+            self._buf.release()
+            self._buf = None
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # NOTE: some values are still referenced, the mapping is
+                # going to be unmapped once the last of them is gone.
+                pass
+            self._mm = None
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def _record(self, idx):
+        return RECORD.unpack_from(self._mm, self._records + RECORD.size * idx)
+
+    def _value(self, record):
+        flags, offset, size, _ = record
+        if not flags & HAS_VALUE or flags & NONE_VALUE:
+            return None
+        return self._buf[offset : offset + size]
+
+    def _name(self, idx):
+        return self._keys[idx].rsplit(SEP, 1)[1].decode("utf-8")
+
+    def _find(self, key, lo=0, hi=None):
+        enc = self._root_enc + _encode(key)
+        keys = self._keys
+        idx = bisect_left(keys, enc, lo, len(keys) if hi is None else hi)
+        if idx < len(keys) and keys[idx] == enc:
+            return idx
+        return None
+
+    def _get_node(self, key):
+        idx = self._find(key)
+        if idx is None:
+            raise KeyError(key)
+        return idx
+
+    def __setitem__(self, key, value):
+        raise NotImplementedError
+
+    def __delitem__(self, key):
+        raise NotImplementedError
+
+    def delete_node(self, key):
+        raise NotImplementedError
+
+    def delete_subtree(self, key):
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        record = self._record(self._get_node(key))
+        if not record[0] & HAS_VALUE:
+            raise ShortKeyError(key)
+        return self._value(record)
+
+    def __iter__(self):
+        yield from (key for key, _ in self.items())
+
+    def __len__(self):
+        if not self._root_key:
+            return self._values
+        idx = self._find(())
+        if idx is None:
+            return 0
+        return sum(
+            1
+            for pos in range(idx, self._record(idx)[3])
+            if self._record(pos)[0] & HAS_VALUE
+        )
+
+    def has_node(self, key: TrieKey) -> bool:
+        return self._find(key) is not None
+
+    def prefixes(self, key: TrieKey) -> Iterator[TrieStep]:
+        # NOTE: each prefix is looked up only within the subtree of the
+        # previous one, which gets narrower as we go deeper.
+        lo, hi = 0, len(self._keys)
+        for depth in range(1, len(key) + 1):
+            idx = self._find(key[:depth], lo, hi)
+            if idx is None:
+                return
+            record = self._record(idx)
+            if record[0] & HAS_VALUE:
+                yield key[:depth], self._value(record)
+            lo, hi = idx, record[3]
+
+    def shortest_prefix(self, key: TrieKey) -> Optional[TrieStep]:
+        return next(self.prefixes(key), None)
+
+    def longest_prefix(self, key: TrieKey) -> Optional[TrieStep]:
+        ret = None
+        for step in self.prefixes(key):
+            ret = step
+        return ret
+
+    def view(self, key: Optional[TrieKey] = None) -> "SnapshotTrie":
+        if not key:
+            return self
+
+        trie = SnapshotTrie()
+        trie._mm = self._mm
+        trie._buf = self._buf
+        trie._keys = self._keys
+        trie._records = self._records
+        trie._values = self._values
+        trie._root_key = (*self._root_key, *key)
+        trie._root_enc = _encode(trie._root_key)
+        trie._owner = False
+        return trie
+
+    def _iterate(self, idx, shallow=False, strip=0):
+        # NOTE: keys are sorted, so the subtree is a contiguous range of
+        # nodes, which we walk in order.
+        strip += len(self._root_enc)
+        end = self._record(idx)[3]
+        while idx < end:
+            record = self._record(idx)
+            if record[0] & HAS_VALUE:
+                yield _decode(self._keys[idx][strip:]), self._value(record)
+                if shallow:
+                    idx = record[3]
+                    continue
+            idx += 1
+
+    def items(self, prefix=None, shallow=False):
+        key = prefix or ()
+        if not key and not self.has_node(()):
+            # NOTE: a view of a key that doesn't exist is just empty
+            return
+        yield from self._iterate(self._get_node(key), shallow=shallow)
+
+    def ls(
+        self, key: TrieKey, with_values: Optional[bool] = False
+    ) -> Iterator[Union[TrieKey, TrieNode]]:
+        idx = self._get_node(key)
+        end = self._record(idx)[3]
+        idx += 1
+        while idx < end:
+            record = self._record(idx)
+            if with_values:
+                yield (*key, self._name(idx)), self._value(record)  # type: ignore[misc]
+            else:
+                yield (*key, self._name(idx))
+            idx = record[3]
+
+    def _traverse(self, node_factory, key, idx):
+        record = self._record(idx)
+
+        def _children():
+            child = idx + 1
+            while child < record[3]:
+                yield self._traverse(node_factory, (*key, self._name(child)), child)
+                child = self._record(child)[3]
+
+        args: list[Any] = [tuple, key, _children()]
+        if record[0] & HAS_VALUE:
+            args.append(self._value(record))
+        return node_factory(*args)
+
+    def traverse(self, node_factory: NodeFactory, prefix: Optional[TrieKey] = None):
+        key = prefix or ()
+        return self._traverse(node_factory, key, self._get_node(key))
+
+    def diff(self, old, new, with_unchanged=False):
+        # NOTE: both subtrees are contiguous key-ordered ranges, so changes
+        # are found with a single merge-join of the two. Keys are stripped of
+        # the roots being compared.
+        old, new = old or (), new or ()
+        old_items = self._iterate(self._get_node(old), strip=len(_encode(old)))
+        new_items = self._iterate(self._get_node(new), strip=len(_encode(new)))
+        yield from diff_items(old_items, new_items, with_unchanged)
@@ -0,0 +1,628 @@
+import threading
+from collections import defaultdict
+from collections.abc import Iterator, Mapping
+from contextlib import contextmanager
+from functools import lru_cache
+from operator import itemgetter
+from typing import TYPE_CHECKING, NamedTuple, Optional, Union
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Index,
+    Integer,
+    LargeBinary,
+    MetaData,
+    Table,
+    Text,
+    UniqueConstraint,
+    and_,
+    bindparam,
+    cast,
+    create_engine,
+    delete,
+    false,
+    func,
+    insert,
+    inspect,
+    literal,
+    select,
+    update,
+)
+from sqlalchemy.pool import StaticPool
+
+from .cache import CacheInfo, PrefixLRUCache
+from .trie import (
+    AbstractTrie,
+    NodeFactory,
+    ShortKeyError,
+    TrieItems,
+    TrieKey,
+    TrieNode,
+    TrieStep,
+    build_subtree,
+    diff_items,
+)
+
+if TYPE_CHECKING:
+    from .trie import Subtree
+
+ROOT_ID = 1
+ROOT_KEY: TrieKey = ()
+
+# NOTE: max number of node ids to keep cached per trie (and its views)
+NODE_CACHE_SIZE = 65536
+# NOTE: keys are resolved with one join per level, and databases limit the
+# number of tables in a join (e.g. 64 in SQLite), so deeper keys are resolved
+# in several steps.
+STEPS_CHUNK_SIZE = 32
+# NOTE: max number of parameters in "IN (...)" lists
+IN_CHUNK_SIZE = 512
+# NOTE: keys are joined into paths with a separator that sorts before any
+# printable character, so that ordering by path is the same as by key. Names
+# that contain the separator are rejected, see _check_key.
+PATH_SEP = "\x01"
+# NOTE: names and paths have to be ordered by code points, the way Python
+# compares strings, while default collations are usually locale-aware and
+# ignore or reweight control characters and punctuation. SQLite compares
+# text bytewise by default, which is the same for UTF-8.
+BINARY_COLLATIONS = {
+    "postgresql": "C",
+    "mysql": "utf8mb4_bin",
+    "mariadb": "utf8mb4_bin",
+}
+
+metadata = MetaData()
+
+# NOTE: SQLiteTrie could open (and migrate) databases created with this
+# schema, but not the other way around: it maintains extra columns (counts,
+# hashes, paths, deduplicated values) that SQLAlchemyTrie knows nothing about.
+nodes = Table(
+    "nodes",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("pid", Integer),
+    Column("name", Text),
+    Column("has_value", Boolean),
+    Column("value", LargeBinary),
+    UniqueConstraint("pid", "name"),
+    Index("nodes_pid_idx", "pid"),
+    sqlite_autoincrement=True,
+)
+
+GET_STMT = select(nodes.c.id, nodes.c.name, nodes.c.has_value, nodes.c.value).where(
+    nodes.c.id == bindparam("id")
+)
+
+
+def _binary(expr, dialect):
+    collation = BINARY_COLLATIONS.get(dialect)
+    return expr if collation is None else expr.collate(collation)
+
+
+@lru_cache
+def _children_stmt(dialect):
+    return (
+        select(nodes.c.id, nodes.c.pid, nodes.c.name, nodes.c.has_value, nodes.c.value)
+        .where(nodes.c.pid == bindparam("pid"))
+        .order_by(_binary(nodes.c.name, dialect))
+    )
+
+
+CHILDREN_IN_STMT = select(nodes.c.id, nodes.c.pid, nodes.c.name).where(
+    nodes.c.pid.in_(bindparam("pids", expanding=True))
+)
+INSERT_STMT = insert(nodes)
+SET_STMT = (
+    update(nodes)
+    .where(nodes.c.pid == bindparam("b_pid"), nodes.c.name == bindparam("b_name"))
+    .values(has_value=True, value=bindparam("b_value"))
+)
+SET_ID_STMT = (
+    update(nodes)
+    .where(nodes.c.id == bindparam("b_id"))
+    .values(has_value=bindparam("b_has_value"), value=bindparam("b_value"))
+)
+DELETE_STMT = delete(nodes).where(nodes.c.id == bindparam("b_id"))
+
+
+def _subtree_cte(columns, shallow=False):
+    subtree = (
+        select(*(nodes.c[column] for column in columns))
+        .where(nodes.c.id == bindparam("root"))
+        .cte("subtree", recursive=True)
+    )
+    children = nodes.alias("children")
+    step = select(*(children.c[column] for column in columns)).where(
+        children.c.pid == subtree.c.id
+    )
+    if shallow:
+        step = step.where(func.coalesce(subtree.c.has_value, false()) == false())
+    return subtree.union_all(step)
+
+
+SUBTREE_COLUMNS = ("id", "pid", "name", "has_value", "value")
+SUBTREE_STMT = select(_subtree_cte(SUBTREE_COLUMNS))
+# NOTE: not dragging values through the recursion where they are not needed
+_len_subtree = _subtree_cte(("id", "has_value"))
+LEN_STMT = select(func.count()).where(_len_subtree.c.has_value == True)  # noqa: E712
+_clear_subtree = _subtree_cte(("id",))
+CLEAR_STMT = delete(nodes).where(
+    nodes.c.id.in_(
+        select(_clear_subtree.c.id).where(_clear_subtree.c.id != bindparam("root"))
+    )
+)
+
+
+@lru_cache
+def _items_stmt(dialect, shallow=False):
+    # NOTE: carrying the path through the recursion instead of the values, so
+    # that rows come out in key order and could be streamed.
+    subtree = (
+        select(nodes.c.id, nodes.c.has_value, cast(literal(""), Text).label("path"))
+        .where(nodes.c.id == bindparam("root"))
+        .cte("subtree", recursive=True)
+    )
+    children = nodes.alias("children")
+    step = select(
+        children.c.id, children.c.has_value, subtree.c.path + PATH_SEP + children.c.name
+    ).where(children.c.pid == subtree.c.id)
+    if shallow:
+        step = step.where(func.coalesce(subtree.c.has_value, false()) == false())
+    subtree = subtree.union_all(step)
+    return (
+        select(subtree.c.path, nodes.c.value)
+        .join(nodes, nodes.c.id == subtree.c.id)
+        .where(subtree.c.has_value == True)  # noqa: E712
+        .order_by(_binary(subtree.c.path, dialect))
+    )
+
+
+@lru_cache(maxsize=STEPS_CHUNK_SIZE)
+def _steps_stmt(depth):
+    # NOTE: one (outer) join per level, so that a single indexed query
+    # returns every node on the path, even if the key only exists partially.
+    aliases = [nodes.alias(f"n{idx}") for idx in range(depth)]
+    joined = aliases[0]
+    for idx in range(1, depth):
+        parent, child = aliases[idx - 1], aliases[idx]
+        joined = joined.outerjoin(
+            child,
+            and_(
+                child.c.pid == parent.c.id,
+                child.c.name == bindparam(f"name_{idx}"),
+            ),
+        )
+
+    columns = []
+    for alias in aliases:
+        columns.extend([alias.c.id, alias.c.has_value, alias.c.value])
+    return (
+        select(*columns)
+        .select_from(joined)
+        .where(
+            aliases[0].c.pid == bindparam("root"),
+            aliases[0].c.name == bindparam("name_0"),
+        )
+    )
+
+
+def _build_tree(rows, root_id):
+    nodes_by_id: dict[int, Subtree] = {}
+    children = defaultdict(list)
+    for nid, pid, name, has_value, value in rows:
+        nodes_by_id[nid] = (name, bool(has_value), value, [])
+        children[pid].append(nid)
+
+    for pid, ids in children.items():
+        parent = nodes_by_id.get(pid)
+        if parent is None:
+            continue
+        parent[3].extend(sorted((nodes_by_id[nid] for nid in ids), key=itemgetter(0)))
+
+    return nodes_by_id[root_id]
+
+
+def _check_key(key):
+    for name in key:
+        if PATH_SEP in name:
+            raise ValueError(f"{PATH_SEP!r} characters are not supported in {key!r}")
+
+
+class _Node(NamedTuple):
+    id: int
+    name: str
+    has_value: bool
+    value: Optional[bytes]
+
+
+class SQLAlchemyTrie(AbstractTrie):
+    def __init__(self, *args, **kwargs):
+        self._root_key = ROOT_KEY
+        self._root_id = ROOT_ID
+        self._engine = None
+        self._local = threading.local()
+        # NOTE: node ids by absolute keys, shared between the trie and its views
+        self._ids = PrefixLRUCache(NODE_CACHE_SIZE)
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def open(cls, path, node_cache_size=NODE_CACHE_SIZE, **engine_kwargs):
+        # NOTE: path could be either a database URL or a path to SQLite file
+        url = path if "://" in path else f"sqlite:///{path}"
+        trie = cls()
+        trie._engine = create_engine(url, **engine_kwargs)
+        trie._ids = PrefixLRUCache(node_cache_size)
+        return trie
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            # NOTE: in-memory database only lives as long as its connection,
+            # so all threads have to share the same one.
+            self._engine = create_engine(
+                "sqlite://",
+                poolclass=StaticPool,
+                connect_args={"check_same_thread": False},
+            )
+        return self._engine
+
+    def close(self):
+        self._ids.clear()
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+
+        conn.close()
+
+        try:
+            delattr(self._local, "conn")
+        except AttributeError:
+            pass
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+        # NOTE: cached ids might point to nodes that don't exist anymore
+        self._ids.clear()
+
+    def node_cache_info(self) -> CacheInfo:
+        return self._ids.info()
+
+    @property
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self.engine.connect()
+            try:
+                self._init(conn)
+            except BaseException:
+                conn.close()
+                raise
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _init(conn):
+        metadata.create_all(conn)
+        columns = {column["name"] for column in inspect(conn).get_columns("nodes")}
+        unknown = columns - set(nodes.c.keys())
+        if unknown:
+            raise ValueError(
+                f"'{conn.engine.url}' was created by SQLiteTrie "
+                f"(unknown columns: {', '.join(sorted(unknown))}), "
+                "SQLAlchemyTrie can't keep it consistent"
+            )
+        if conn.execute(GET_STMT, {"id": ROOT_ID}).first() is None:
+            conn.execute(
+                INSERT_STMT,
+                {"id": ROOT_ID, "pid": None, "name": "", "has_value": False},
+            )
+        conn.commit()
+
+    @contextmanager
+    def _transaction(self):
+        # NOTE: using a savepoint, so that a failed operation is rolled back
+        # without losing whatever the caller had pending. pysqlite only opens
+        # transactions implicitly before INSERT/UPDATE/DELETE, so without an
+        # explicit BEGIN the savepoint would be the outermost transaction
+        # (committed on release) and "WITH ... DELETE" would autocommit.
+        conn = self._conn
+        dbapi_conn = conn.connection.dbapi_connection
+        if not getattr(dbapi_conn, "in_transaction", True):
+            conn.exec_driver_sql("BEGIN")
+        try:
+            with conn.begin_nested():
+                yield conn
+        except BaseException:
+            # NOTE: cached ids might point to nodes that were rolled back
+            self._ids.clear()
+            raise
+
+    def _abs_key(self, key):
+        return (*self._root_key, *key)
+
+    def _traverse(self, key):
+        steps: list[tuple[int, bool, Optional[bytes]]] = []
+        pid = self._root_id
+        for start in range(0, len(key), STEPS_CHUNK_SIZE):
+            chunk = key[start : start + STEPS_CHUNK_SIZE]
+            params = {f"name_{idx}": name for idx, name in enumerate(chunk)}
+            params["root"] = pid
+            row = self._conn.execute(_steps_stmt(len(chunk)), params).first()
+            if row is None:
+                break
+            for idx in range(len(chunk)):
+                nid, has_value, value = row[3 * idx : 3 * idx + 3]
+                if nid is None:
+                    return steps
+                steps.append((nid, bool(has_value), value))
+            pid = steps[-1][0]
+        return steps
+
+    def _get_node(self, key):
+        if not key:
+            return _Node(*self._conn.execute(GET_STMT, {"id": self._root_id}).one())
+
+        abs_key = self._abs_key(key)
+        nid = self._ids.get(abs_key)
+        if nid is not None:
+            row = self._conn.execute(GET_STMT, {"id": nid}).first()
+            if row is not None and row.name == key[-1]:
+                return _Node(*row)
+            self._ids.pop(abs_key, None)
+
+        steps = self._traverse(key)
+        if len(steps) < len(key):
+            raise KeyError(key)
+        nid, has_value, value = steps[-1]
+        self._ids[abs_key] = nid
+        return _Node(nid, key[-1], has_value, value)
+
+    def _create_node(self, key):
+        try:
+            return self._ids[self._abs_key(key)]
+        except KeyError:
+            pass
+
+        steps = self._traverse(key)
+        pid = steps[-1][0] if steps else self._root_id
+        node_key = key[: len(steps)]
+        self._ids[self._abs_key(node_key)] = pid
+        for name in key[len(steps) :]:
+            node_key = (*node_key, name)
+            result = self._conn.execute(
+                INSERT_STMT, {"pid": pid, "name": name, "has_value": False}
+            )
+            pid = result.inserted_primary_key[0]
+            self._ids[self._abs_key(node_key)] = pid
+
+        return pid
+
+    def _get_children_ids(self, pids):
+        ret = {}
+        pids = list(pids)
+        for start in range(0, len(pids), IN_CHUNK_SIZE):
+            rows = self._conn.execute(
+                CHILDREN_IN_STMT, {"pids": pids[start : start + IN_CHUNK_SIZE]}
+            )
+            for nid, pid, name in rows:
+                ret[(pid, name)] = nid
+        return ret
+
+    def _create_nodes(self, keys):
+        # NOTE: resolving and creating nodes level by level, so that we only
+        # need a few bulk statements per tree level.
+        ids = {(): self._root_id}
+        levels = defaultdict(set)
+        for key in keys:
+            while key not in ids and key not in levels[len(key)]:
+                levels[len(key)].add(key)
+                key = key[:-1]
+
+        for depth in sorted(levels):
+            missing = []
+            for key in levels[depth]:
+                nid = self._ids.get(self._abs_key(key))
+                if nid is None:
+                    missing.append(key)
+                else:
+                    ids[key] = nid
+
+            if not missing:
+                continue
+
+            pids = {ids[key[:-1]] for key in missing}
+            children = self._get_children_ids(pids)
+            new = [
+                {"pid": ids[key[:-1]], "name": key[-1], "has_value": False}
+                for key in missing
+                if (ids[key[:-1]], key[-1]) not in children
+            ]
+            if new:
+                self._conn.execute(INSERT_STMT, new)
+                children = self._get_children_ids(pids)
+
+            for key in missing:
+                nid = children[(ids[key[:-1]], key[-1])]
+                ids[key] = self._ids[self._abs_key(key)] = nid
+
+        return ids
+
+    def update_many(self, items: TrieItems) -> None:
+        if isinstance(items, Mapping):
+            items = items.items()
+        items = {tuple(key): value for key, value in items}
+        for key in items:
+            _check_key(key)
+
+        if () in items:
+            self[()] = items.pop(())
+        if not items:
+            return
+
+        with self._transaction() as conn:
+            ids = self._create_nodes(items)
+            conn.execute(
+                SET_ID_STMT,
+                [
+                    {"b_id": ids[key], "b_has_value": True, "b_value": value}
+                    for key, value in items.items()
+                ],
+            )
+
+    def __setitem__(self, key, value):
+        _check_key(key)
+        if not key:
+            self._conn.execute(
+                SET_ID_STMT,
+                {"b_id": self._root_id, "b_has_value": True, "b_value": value},
+            )
+            return
+
+        pid = self._create_node(key[:-1])
+        result = self._conn.execute(
+            SET_STMT, {"b_pid": pid, "b_name": key[-1], "b_value": value}
+        )
+        if not result.rowcount:
+            self._conn.execute(
+                INSERT_STMT,
+                {"pid": pid, "name": key[-1], "has_value": True, "value": value},
+            )
+
+    def __iter__(self):
+        yield from (key for key, _ in self.items())
+
+    def __getitem__(self, key):
+        row = self._get_node(key)
+        if not row.has_value:
+            raise ShortKeyError(key)
+        return row.value
+
+    def __delitem__(self, key):
+        row = self._get_node(key)
+        self._conn.execute(
+            SET_ID_STMT, {"b_id": row.id, "b_has_value": False, "b_value": None}
+        )
+
+    def __len__(self):
+        return self._conn.execute(LEN_STMT, {"root": self._root_id}).scalar_one()
+
+    def prefixes(self, key: TrieKey) -> Iterator[TrieStep]:
+        for depth, (_, has_value, value) in enumerate(self._traverse(key), 1):
+            if has_value:
+                yield key[:depth], value
+
+    def shortest_prefix(self, key: TrieKey) -> Optional[TrieStep]:
+        return next(self.prefixes(key), None)
+
+    def longest_prefix(self, key: TrieKey) -> Optional[TrieStep]:
+        ret = None
+        for step in self.prefixes(key):
+            ret = step
+        return ret
+
+    def view(
+        self,
+        key: Optional[TrieKey] = None,
+    ) -> "SQLAlchemyTrie":
+        if not key:
+            return self
+
+        try:
+            nid = self._get_node(key).id
+        except KeyError:
+            _check_key(key)
+            nid = self._create_node(key)
+
+        trie = SQLAlchemyTrie()
+        trie._engine = self.engine  # pylint: disable=protected-access
+        trie._local = self._local  # pylint: disable=protected-access
+        trie._ids = self._ids  # pylint: disable=protected-access
+        trie._root_key = self._abs_key(key)  # pylint: disable=protected-access
+        trie._root_id = nid  # pylint: disable=protected-access
+        return trie
+
+    def _get_tree(self, key):
+        row = self._get_node(key)
+        rows = self._conn.execute(SUBTREE_STMT, {"root": row.id})
+        return _build_tree(rows, row.id)
+
+    def _iter_items(self, key, shallow=False):
+        # NOTE: keys are relative to the given key
+        row = self._get_node(key)
+        stmt = _items_stmt(self._conn.dialect.name, shallow=shallow)
+        for path, value in self._conn.execute(stmt, {"root": row.id}):
+            yield tuple(path.split(PATH_SEP)[1:]), value
+
+    def items(self, prefix=None, shallow=False):
+        key = prefix or ()
+        for rel_key, value in self._iter_items(key, shallow=shallow):
+            yield (*key, *rel_key), value
+
+    def clear(self):
+        # NOTE: keeping the root node itself, so that the trie (or the view)
+        # stays usable afterwards.
+        with self._transaction() as conn:
+            conn.execute(CLEAR_STMT, {"root": self._root_id})
+            conn.execute(
+                SET_ID_STMT,
+                {"b_id": self._root_id, "b_has_value": False, "b_value": None},
+            )
+        self._forget(())
+
+    def _forget(self, key):
+        self._ids.pop_prefix(self._abs_key(key))
+
+    def has_node(self, key: TrieKey) -> bool:
+        try:
+            self._get_node(key)
+            return True
+        except KeyError:
+            return False
+
+    def delete_node(self, key: TrieKey):
+        row = self._get_node(key)
+        self._forget(key)
+        self._conn.execute(DELETE_STMT, {"b_id": row.id})
+
+    def delete_subtree(self, key: TrieKey):
+        if not key:
+            self.clear()
+            return
+
+        row = self._get_node(key)
+        with self._transaction() as conn:
+            conn.execute(CLEAR_STMT, {"root": row.id})
+            conn.execute(DELETE_STMT, {"b_id": row.id})
+        self._forget(key)
+
+    def ls(
+        self, key: TrieKey, with_values: Optional[bool] = False
+    ) -> Iterator[Union[TrieKey, TrieNode]]:
+        row = self._get_node(key)
+        stmt = _children_stmt(self._conn.dialect.name)
+        for child in self._conn.execute(stmt, {"pid": row.id}):
+            if with_values:
+                yield (*key, child.name), child.value  # type: ignore[misc]
+            else:
+                yield (*key, child.name)
+
+    def traverse(self, node_factory: NodeFactory, prefix: Optional[TrieKey] = None):
+        key = prefix or ()
+        return build_subtree(node_factory, key, self._get_tree(key))
+
+    def diff(self, old, new, with_unchanged=False):
+        old_id = self._get_node(old or ()).id
+        new_id = self._get_node(new or ()).id
+        if old_id == new_id and not with_unchanged:
+            return
+
+        # NOTE: both subtrees are iterated in key order, so changes could be
+        # found with a single merge-join of the two streams.
+        yield from diff_items(
+            self._iter_items(old or ()), self._iter_items(new or ()), with_unchanged
+        )
@@ -1 +1,2 @@
+from .aio import AsyncSQLiteTrie  # noqa: F401, pylint: disable=unused-import
 from .sqlite import SQLiteTrie  # noqa: F401, pylint: disable=unused-import
@@ -0,0 +1,123 @@
+import asyncio
+from collections.abc import AsyncIterator, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import Any, Optional, Union
+
+from sqltrie.trie import Change, TrieItems, TrieKey, TrieNode, TrieStep
+
+from .sqlite import SQLiteTrie
+
+# NOTE: max number of rows handed over from the worker thread at once
+BATCH_SIZE = 1024
+
+
+class AsyncSQLiteTrie:
+    def __init__(self, trie: Optional[SQLiteTrie] = None, batch_size=BATCH_SIZE):
+        self._trie = trie if trie is not None else SQLiteTrie()
+        self._batch_size = batch_size
+        # NOTE: SQLiteTrie has a connection per thread, so running everything
+        # in one dedicated thread makes all calls use the same connection
+        # (and the same transaction).
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqltrie")
+
+    @classmethod
+    def open(cls, path, batch_size=BATCH_SIZE, **kwargs) -> "AsyncSQLiteTrie":
+        return cls(SQLiteTrie.open(path, **kwargs), batch_size=batch_size)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_args):
+        await self.close()
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, partial(func, *args, **kwargs)
+        )
+
+    async def _iterate(self, func, *args, **kwargs) -> AsyncIterator:
+        # NOTE: rows are fetched in batches, so other calls get a chance to
+        # run in between them instead of waiting for the whole iteration.
+        it = iter(func(*args, **kwargs))
+        try:
+            while batch := await self._run(list, islice(it, self._batch_size)):
+                for entry in batch:
+                    yield entry
+        finally:
+            close = getattr(it, "close", None)
+            if close is not None:
+                await self._run(close)
+
+    async def close(self) -> None:
+        await self._run(self._trie.close)
+        self._executor.shutdown(wait=True)
+
+    async def commit(self) -> None:
+        await self._run(self._trie.commit)
+
+    async def rollback(self) -> None:
+        await self._run(self._trie.rollback)
+
+    async def get(self, key: TrieKey) -> Optional[bytes]:
+        return await self._run(self._trie.__getitem__, key)
+
+    async def set(self, key: TrieKey, value: Optional[bytes]) -> None:
+        await self._run(self._trie.__setitem__, key, value)
+
+    async def delete(self, key: TrieKey) -> None:
+        await self._run(self._trie.__delitem__, key)
+
+    async def delete_subtree(self, key: TrieKey) -> None:
+        await self._run(self._trie.delete_subtree, key)
+
+    async def gc(self) -> int:
+        return await self._run(self._trie.gc)
+
+    async def update_many(self, items: TrieItems) -> None:
+        await self._run(self._trie.update_many, items)
+
+    async def has_node(self, key: TrieKey) -> bool:
+        return await self._run(self._trie.has_node, key)
+
+    async def get_many(
+        self, keys: Iterable[TrieKey], default: Any = None
+    ) -> list[Optional[bytes]]:
+        return await self._run(self._trie.get_many, list(keys), default)
+
+    async def has_nodes(self, keys: Iterable[TrieKey]) -> list[bool]:
+        return await self._run(self._trie.has_nodes, list(keys))
+
+    async def longest_prefix_many(
+        self, keys: Iterable[TrieKey]
+    ) -> list[Optional[TrieStep]]:
+        return await self._run(self._trie.longest_prefix_many, list(keys))
+
+    async def len(self) -> int:
+        return await self._run(len, self._trie)
+
+    async def longest_prefix(self, key: TrieKey) -> Optional[TrieStep]:
+        return await self._run(self._trie.longest_prefix, key)
+
+    async def shortest_prefix(self, key: TrieKey) -> Optional[TrieStep]:
+        return await self._run(self._trie.shortest_prefix, key)
+
+    def items(
+        self, prefix: Optional[TrieKey] = None, shallow: Optional[bool] = False
+    ) -> AsyncIterator[tuple[TrieKey, Any]]:
+        return self._iterate(self._trie.items, prefix=prefix, shallow=shallow)
+
+    def ls(
+        self, key: TrieKey, with_values: Optional[bool] = False
+    ) -> AsyncIterator[Union[TrieKey, TrieNode]]:
+        return self._iterate(self._trie.ls, key, with_values=with_values)
+
+    def prefixes(self, key: TrieKey) -> AsyncIterator[TrieStep]:
+        return self._iterate(self._trie.prefixes, key)
+
+    def diff(
+        self, old: TrieKey, new: TrieKey, with_unchanged: bool = False
+    ) -> AsyncIterator[Change]:
+        return self._iterate(self._trie.diff, old, new, with_unchanged=with_unchanged)
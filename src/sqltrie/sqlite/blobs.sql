@@ -0,0 +1,70 @@
+/* NOTE: values are moved out of nodes into blobs keyed by a hash of their
+   contents, so that identical values are only stored once. Writes keep
+   setting nodes.value as usual and the triggers below replace it with a
+   reference, which each blob keeps count of and gets deleted once there are
+   no references to it left. Not using INSERT OR IGNORE, because conflict
+   resolution of statements in triggers is overridden by the outer one. */
+CREATE TABLE IF NOT EXISTS blobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hash BLOB NOT NULL UNIQUE,
+    value BLOB NOT NULL,
+    refs INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS nodes_blob_insert
+AFTER INSERT ON nodes
+WHEN new.value IS NOT NULL
+BEGIN
+    INSERT INTO blobs (hash, value)
+    SELECT sqltrie_hash(new.value), new.value
+    WHERE NOT EXISTS (
+        SELECT 1 FROM blobs WHERE hash == sqltrie_hash(new.value)
+    );
+    UPDATE nodes
+    SET
+        value = NULL,
+        blob = (SELECT id FROM blobs WHERE hash == sqltrie_hash(new.value))
+    WHERE id == new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS nodes_blob_value
+AFTER UPDATE OF value ON nodes
+WHEN new.value IS NOT NULL
+BEGIN
+    INSERT INTO blobs (hash, value)
+    SELECT sqltrie_hash(new.value), new.value
+    WHERE NOT EXISTS (
+        SELECT 1 FROM blobs WHERE hash == sqltrie_hash(new.value)
+    );
+    UPDATE nodes
+    SET
+        value = NULL,
+        blob = (SELECT id FROM blobs WHERE hash == sqltrie_hash(new.value))
+    WHERE id == new.id;
+END;
+
+/* NOTE: value set to NULL explicitly (as opposed to being moved to blobs
+   by the triggers above, in which case the old value is not NULL). */
+CREATE TRIGGER IF NOT EXISTS nodes_blob_clear
+AFTER UPDATE OF value ON nodes
+WHEN new.value IS NULL AND old.value IS NULL AND new.blob IS NOT NULL
+BEGIN
+    UPDATE nodes SET blob = NULL WHERE id == new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS nodes_blob_refs
+AFTER UPDATE OF blob ON nodes
+WHEN new.blob IS NOT old.blob
+BEGIN
+    UPDATE blobs SET refs = refs + 1 WHERE id == new.blob;
+    UPDATE blobs SET refs = refs - 1 WHERE id == old.blob;
+    DELETE FROM blobs WHERE id == old.blob AND refs == 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS nodes_blob_delete
+AFTER DELETE ON nodes
+WHEN old.blob IS NOT NULL
+BEGIN
+    UPDATE blobs SET refs = refs - 1 WHERE id == old.blob;
+    DELETE FROM blobs WHERE id == old.blob AND refs == 0;
+END;
@@ -0,0 +1,33 @@
+/* NOTE: each node keeps the number of values in its subtree (including its
+   own), so that len() of any (sub)trie is a single row read. The triggers
+   below propagate changes up the ancestor chain, which requires
+   recursive_triggers to be enabled. */
+CREATE TRIGGER IF NOT EXISTS nodes_count_insert
+AFTER INSERT ON nodes
+WHEN new.has_value
+BEGIN
+    UPDATE nodes SET count = count + 1 WHERE id == new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS nodes_count_has_value
+AFTER UPDATE OF has_value ON nodes
+WHEN IFNULL(new.has_value, 0) != IFNULL(old.has_value, 0)
+BEGIN
+    UPDATE nodes
+    SET count = count + IFNULL(new.has_value, 0) - IFNULL(old.has_value, 0)
+    WHERE id == new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS nodes_count_update
+AFTER UPDATE OF count ON nodes
+WHEN new.count != old.count AND new.pid IS NOT NULL
+BEGIN
+    UPDATE nodes SET count = count + new.count - old.count WHERE id == new.pid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS nodes_count_delete
+AFTER DELETE ON nodes
+WHEN old.count != 0 AND old.pid IS NOT NULL
+BEGIN
+    UPDATE nodes SET count = count - old.count WHERE id == old.pid;
+END;
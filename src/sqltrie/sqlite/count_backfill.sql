@@ -0,0 +1,20 @@
+WITH RECURSIVE
+ancestors (id, pid) AS (
+    SELECT
+        nodes.id,
+        nodes.pid
+    FROM nodes WHERE nodes.has_value
+
+    UNION ALL
+
+    SELECT
+        nodes.id,
+        nodes.pid
+    FROM nodes, ancestors WHERE nodes.id == ancestors.pid
+)
+
+SELECT
+    COUNT(*) AS count,
+    id
+FROM ancestors
+GROUP BY id;
@@ -0,0 +1,10 @@
+WITH RECURSIVE
+descendants (id) AS (
+    SELECT nodes.id FROM nodes WHERE nodes.pid == :root
+
+    UNION ALL
+
+    SELECT nodes.id FROM nodes, descendants WHERE nodes.pid == descendants.id
+)
+
+DELETE FROM nodes WHERE id IN descendants;
@@ -0,0 +1,28 @@
+/* NOTE: nodes that don't have any values in their subtrees (see count.sql)
+   are only found below nodes that still do, so the walk doesn't go into the
+   empty subtrees themselves. Only the topmost empty nodes are deleted here,
+   their descendants become orphans (see orphans.sql). :root is always kept,
+   even if it is empty, and so are the :kept nodes (roots of live views) along
+   with their ancestors. */
+WITH RECURSIVE
+kept (id) AS (
+    SELECT value FROM json_each(:kept)
+
+    UNION
+
+    SELECT nodes.pid FROM nodes, kept
+    WHERE nodes.id == kept.id AND nodes.pid IS NOT NULL
+),
+
+live (id) AS (
+    SELECT :root
+
+    UNION ALL
+
+    SELECT nodes.id FROM nodes, live
+    WHERE
+        nodes.pid == live.id
+        AND (nodes.count != 0 OR nodes.id IN kept)
+)
+
+DELETE FROM nodes WHERE count == 0 AND pid IN live AND id NOT IN kept;
@@ -0,0 +1,28 @@
+/* NOTE: each node can store a hash of its subtree, which is reset to NULL
+   whenever anything in the subtree changes. Invalidation stops at the first
+   ancestor that is already invalid, because a NULL hash always implies that
+   all of the ancestors have NULL hashes as well. */
+CREATE TRIGGER IF NOT EXISTS nodes_hash_insert
+AFTER INSERT ON nodes
+BEGIN
+    UPDATE nodes SET hash = NULL WHERE id == new.pid AND hash IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS nodes_hash_value
+AFTER UPDATE OF has_value, value ON nodes
+BEGIN
+    UPDATE nodes SET hash = NULL WHERE id == new.id AND hash IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS nodes_hash_invalidate
+AFTER UPDATE OF hash ON nodes
+WHEN new.hash IS NULL AND old.hash IS NOT NULL
+BEGIN
+    UPDATE nodes SET hash = NULL WHERE id == new.pid AND hash IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS nodes_hash_delete
+AFTER DELETE ON nodes
+BEGIN
+    UPDATE nodes SET hash = NULL WHERE id == old.pid AND hash IS NOT NULL;
+END;
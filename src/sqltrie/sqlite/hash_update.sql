@@ -0,0 +1,44 @@
+/* NOTE: returns invalid nodes of the subtree (along with their valid
+   children) in depth-first order, so that hashes could be computed
+   bottom-up without keeping the whole subtree in memory. */
+WITH RECURSIVE
+invalid (id, name, depth, hash, tail) AS (
+    SELECT
+        nodes.id,
+        nodes.name,
+        0,
+        nodes.hash,
+        {tail}
+    FROM nodes WHERE nodes.id == :root AND nodes.hash IS NULL
+
+    UNION ALL
+
+    SELECT
+        nodes.id,
+        nodes.name,
+        invalid.depth + 1,
+        nodes.hash,
+        {tail}
+    FROM nodes, invalid
+    WHERE nodes.pid == invalid.id AND invalid.hash IS NULL
+    ORDER BY 3 DESC, 2 ASC
+)
+
+SELECT
+    invalid.id,
+    invalid.name,
+    invalid.depth,
+    invalid.hash,
+    (
+        CASE WHEN invalid.hash IS NULL THEN (
+            SELECT IFNULL(nodes.has_value, 0)
+            FROM nodes WHERE nodes.id == invalid.id
+        ) END
+    ) AS has_value,
+    (
+        CASE WHEN invalid.hash IS NULL THEN (
+            SELECT {value} FROM nodes WHERE nodes.id == invalid.id
+        ) END
+    ) AS value,
+    invalid.tail
+FROM invalid;
@@ -1,10 +1,12 @@
 PRAGMA journal_mode = WAL;
+PRAGMA recursive_triggers = ON;
 CREATE TABLE IF NOT EXISTS nodes (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     pid INTEGER,
     name TEXT,
     has_value BOOLEAN,
     value BLOB,
+    count INTEGER NOT NULL DEFAULT 0,
     UNIQUE(pid, name),
     UNIQUE(id, pid),
     CHECK(id != pid)
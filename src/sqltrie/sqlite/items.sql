@@ -0,0 +1,36 @@
+WITH RECURSIVE
+items (id, name, depth, has_value) AS (
+    SELECT
+        nodes.id,
+        nodes.name,
+        0,
+        IFNULL(nodes.has_value, 0)
+    FROM nodes WHERE nodes.id == :root
+
+    UNION ALL
+
+    SELECT
+        nodes.id,
+        nodes.name,
+        items.depth + 1,
+        IFNULL(nodes.has_value, 0)
+    FROM nodes, items
+    WHERE
+        nodes.pid == items.id
+        AND NOT (:shallow AND items.has_value)
+    /* NOTE: always expanding the deepest node first makes this a depth-first
+       walk and ordering siblings by name makes it return nodes in key order. */
+    ORDER BY 3 DESC, 2 ASC
+)
+
+SELECT
+    items.depth,
+    items.name,
+    items.has_value,
+    (
+        CASE WHEN :with_values AND items.has_value THEN (
+            SELECT {value} FROM nodes WHERE nodes.id == items.id
+        ) END
+    ) AS value
+    {tail}
+FROM items;
@@ -0,0 +1,17 @@
+/* NOTE: nodes whose parents don't exist anymore (e.g. after delete_node)
+   can't be reached from any root, neither can any of their descendants. */
+WITH RECURSIVE
+orphans (id) AS (
+    SELECT nodes.id FROM nodes
+    WHERE
+        nodes.pid IS NOT NULL
+        AND NOT EXISTS (
+            SELECT 1 FROM nodes AS parent WHERE parent.id == nodes.pid
+        )
+
+    UNION ALL
+
+    SELECT nodes.id FROM nodes, orphans WHERE nodes.pid == orphans.id
+)
+
+DELETE FROM nodes WHERE id IN orphans;
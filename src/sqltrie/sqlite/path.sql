@@ -0,0 +1,22 @@
+CREATE UNIQUE INDEX IF NOT EXISTS nodes_path_idx ON nodes (path);
+
+CREATE TRIGGER IF NOT EXISTS nodes_path_insert
+AFTER INSERT ON nodes
+WHEN new.path IS NULL AND new.pid IS NOT NULL
+BEGIN
+    UPDATE nodes
+    SET path = (
+        SELECT parent.path FROM nodes AS parent WHERE parent.id == new.pid
+    ) || char(1) || new.name
+    WHERE id == new.id;
+END;
+
+/* NOTE: full paths of the descendants would become stale, so we can't leave
+   orphans behind like the adjacency layout does. */
+CREATE TRIGGER IF NOT EXISTS nodes_path_delete
+AFTER DELETE ON nodes
+WHEN old.path IS NOT NULL
+BEGIN
+    DELETE FROM nodes
+    WHERE path >= old.path || char(1) AND path < old.path || char(2);
+END;
@@ -0,0 +1,19 @@
+WITH RECURSIVE
+paths (id, path) AS (
+    SELECT
+        nodes.id,
+        ''
+    FROM nodes WHERE nodes.pid IS NULL
+
+    UNION ALL
+
+    SELECT
+        nodes.id,
+        paths.path || char(1) || nodes.name
+    FROM nodes, paths WHERE nodes.pid == paths.id
+)
+
+SELECT
+    path,
+    id
+FROM paths;
@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import threading
+from typing import NamedTuple, Optional
+from urllib.request import pathname2url
+
+
+def readonly_uri(path: str) -> str:
+    if path == ":memory:" or "mode=memory" in path:
+        raise ValueError("read-only connections require a database file")
+    return "file:" + pathname2url(os.path.abspath(path)) + "?mode=ro"
+
+
+def connect_readonly(uri: str, **kwargs) -> sqlite3.Connection:
+    conn = sqlite3.connect(uri, uri=True, **kwargs)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class PoolStats(NamedTuple):
+    size: int
+    created: int
+    idle: int
+    in_use: int
+    checkouts: int
+    fallbacks: int
+
+
+class ReaderPool:
+    """Bounded pool of read-only connections to a database file.
+
+    Each checked out connection holds a read transaction until it is
+    released, so everything read through it comes from the same snapshot
+    (with WAL, writers are not blocked by it).
+    """
+
+    def __init__(self, path: str, size: int):
+        self.size = size
+        self._uri = readonly_uri(path)
+        self._lock = threading.Lock()
+        self._idle: list[sqlite3.Connection] = []
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._fallbacks = 0
+
+    def acquire(self) -> Optional[sqlite3.Connection]:
+        # NOTE: never blocking, the caller is expected to fall back to its
+        # own connection when the pool is exhausted. Waiting instead could
+        # deadlock if the same thread holds all the readers in unfinished
+        # generators.
+        with self._lock:
+            if self._idle:
+                conn = self._idle.pop()
+            elif self._created < self.size:
+                conn = None
+                self._created += 1
+            else:
+                self._fallbacks += 1
+                return None
+            self._in_use += 1
+            self._checkouts += 1
+
+        if conn is None:
+            try:
+                conn = connect_readonly(self._uri, check_same_thread=False)
+            except BaseException:
+                with self._lock:
+                    self._created -= 1
+                    self._in_use -= 1
+                raise
+
+        conn.execute("BEGIN")
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        conn.rollback()
+        with self._lock:
+            self._in_use -= 1
+            self._idle.append(conn)
+
+    def close(self) -> None:
+        # NOTE: only closing idle connections, the ones that are checked out
+        # are returned to the pool as usual and new ones are opened lazily.
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> PoolStats:
+        with self._lock:
+            return PoolStats(
+                self.size,
+                self._created,
+                len(self._idle),
+                self._in_use,
+                self._checkouts,
+                self._fallbacks,
+            )
@@ -0,0 +1,18 @@
+/* NOTE: walks up from :id for as long as the nodes don't have any values left
+   in their subtrees, without going above :root. Rows come out bottom up, so
+   the last one is the topmost node that can be deleted. */
+WITH RECURSIVE
+empty (id, pid, name, tail) AS (
+    SELECT nodes.id, nodes.pid, nodes.name, {tail}
+    FROM nodes
+    WHERE nodes.id == :id AND nodes.count == 0 AND nodes.id != :root
+
+    UNION ALL
+
+    SELECT nodes.id, nodes.pid, nodes.name, {tail}
+    FROM nodes, empty
+    WHERE
+        nodes.id == empty.pid AND nodes.count == 0 AND nodes.id != :root
+)
+
+SELECT id, name, tail FROM empty;
@@ -0,0 +1,42 @@
+/* NOTE: same as steps.sql, but for the radix layout, where a node stands for
+   a whole chain of names: the first one is in name and the rest are in tail,
+   each prefixed with char(1). Tails are matched against :joined, which is the
+   key with each name prefixed with char(1), starting right after the part of
+   it that was already matched (offset). */
+WITH RECURSIVE
+steps (id, depth, offset) AS (
+    SELECT
+        :root,
+        0,
+        0
+
+    UNION ALL
+
+    SELECT
+        nodes.id,
+        steps.depth + 1
+        + length(nodes.tail) - length(replace(nodes.tail, char(1), '')),
+        steps.offset + 1 + length(nodes.name) + length(nodes.tail)
+    FROM nodes, steps
+    WHERE
+        nodes.pid == steps.id
+        AND nodes.name == json_extract(:path, '$[' || steps.depth || ']')
+        AND substr(
+            :joined, steps.offset + length(nodes.name) + 2, length(nodes.tail)
+        ) == nodes.tail
+        AND substr(
+            :joined,
+            steps.offset + length(nodes.name) + length(nodes.tail) + 2,
+            1
+        ) IN ('', char(1))
+)
+
+SELECT
+    {columns},
+    steps.depth
+FROM nodes, steps
+WHERE
+    steps.depth >= :depth
+    AND steps.depth > 0
+    AND nodes.id == steps.id
+ORDER BY steps.depth;
@@ -1,24 +1,51 @@
+import hashlib
+import json
 import sqlite3
+import sys
 import threading
-from collections.abc import Iterator
+import weakref
+from collections import defaultdict, deque
+from collections.abc import Iterator, Mapping
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
+from multiprocessing import Manager
+from operator import itemgetter
 from pathlib import Path
-from typing import Any, Optional, Union
+from queue import Empty
+from typing import TYPE_CHECKING, Any, Optional, Union
 from uuid import uuid4
 
 from attrs import define
 
+from sqltrie.cache import CacheInfo, PrefixLRUCache
 from sqltrie.trie import (
+    ADD,
+    DELETE,
+    UNCHANGED,
     AbstractTrie,
     Change,
     NodeFactory,
     ShortKeyError,
+    TrieItems,
     TrieKey,
     TrieNode,
     TrieStep,
+    build_subtree,
+    diff_entries,
+    diff_items,
+    merge_join,
 )
 
+from .pool import PoolStats, ReaderPool, connect_readonly, readonly_uri
+
+if TYPE_CHECKING:
+    from sqltrie.trie import Subtree
+
 # https://www.sqlite.org/lang_with.html
-MIN_SQLITE_VER = (3, 8, 3)
+# https://www.sqlite.org/json1.html
+MIN_SQLITE_VER = (3, 9, 0)
 
 # https://www.sqlite.org/lang_UPSERT.html
 HAS_UPSERT = sqlite3.sqlite_version_info >= (3, 24, 0)
@@ -35,15 +62,287 @@ ROOT_NAME = "/"
 
 INIT_SQL = (scripts / "init.sql").read_text()
 
-STEPS_SQL = (scripts / "steps.sql").read_text()
-STEPS_TABLE = "temp_steps"
+COUNT_SQL = (scripts / "count.sql").read_text()
+COUNT_BACKFILL_SQL = (scripts / "count_backfill.sql").read_text()
+
+DELETE_DESCENDANTS_SQL = (scripts / "descendants.sql").read_text()
+DELETE_EMPTY_SQL = (scripts / "empty.sql").read_text()
+DELETE_ORPHANS_SQL = (scripts / "orphans.sql").read_text()
+
+# NOTE: dedup=True moves values into a separate table of blobs keyed by a
+# hash of their contents and only stores references to them in nodes.
+BLOBS_SQL = (scripts / "blobs.sql").read_text()
+BLOB_HASH_SIZE = 32
+
+# NOTE: keyed by whether or not values are deduplicated
+VALUE_SQL = {
+    False: "nodes.value",
+    True: "(SELECT blobs.value FROM blobs WHERE blobs.id == nodes.blob)",
+}
+# NOTE: keyed by whether or not the radix layout is used
+TAIL_SQL = {False: "''", True: "nodes.tail"}
+PRUNE_SQL = {
+    radix: (scripts / "prune.sql").read_text().format(tail=TAIL_SQL[radix])
+    for radix in (False, True)
+}
+# NOTE: statements that depend on the schema are keyed by (dedup, radix)
+SCHEMAS = [(dedup, radix) for dedup in (False, True) for radix in (False, True)]
+NODE_COLUMNS_SQL = {
+    (dedup, radix): (
+        "nodes.id, nodes.pid, nodes.name, nodes.has_value, "
+        f"{VALUE_SQL[dedup]} AS value, {TAIL_SQL[radix]} AS tail"
+    )
+    for dedup, radix in SCHEMAS
+}
+
+HASH_SQL = (scripts / "hash.sql").read_text()
+HASH_UPDATE_SQL = {
+    (dedup, radix): (scripts / "hash_update.sql")
+    .read_text()
+    .format(value=VALUE_SQL[dedup], tail=TAIL_SQL[radix])
+    for dedup, radix in SCHEMAS
+}
+HASH_SIZE = 16
+
+STEPS_SQL = {
+    (dedup, radix): (scripts / ("radix_steps.sql" if radix else "steps.sql"))
+    .read_text()
+    .format(columns=NODE_COLUMNS_SQL[dedup, radix])
+    for dedup, radix in SCHEMAS
+}
+
+# NOTE: tails are only selected in radix layout, rows of the other layouts
+# don't have them at all.
+ITEMS_TAIL_SQL = {
+    False: "",
+    True: ", (SELECT nodes.tail FROM nodes WHERE nodes.id == items.id) AS tail",
+}
+ITEMS_SQL = {
+    (dedup, radix): (scripts / "items.sql")
+    .read_text()
+    .format(value=VALUE_SQL[dedup], tail=ITEMS_TAIL_SQL[radix])
+    for dedup, radix in SCHEMAS
+}
+ITEMS_CHUNK_SIZE = 1024
+
+# NOTE: batched lookups (get_many, has_nodes, etc) resolve keys a level at a
+# time, this many (pid, name) pairs (or paths) per statement.
+LOOKUP_CHUNK_SIZE = 8192
+
+# NOTE: "adjacency" layout only stores (pid, name) for each node, while "path"
+# layout additionally maintains an indexed full path column, which turns
+# lookups into a single index probe and prefix iteration into a range scan.
+# "radix" layout collapses chains of nodes into a single node, see
+# radix_steps.sql, which makes deep and sparse trees a lot smaller.
+ADJACENCY_LAYOUT = "adjacency"
+PATH_LAYOUT = "path"
+RADIX_LAYOUT = "radix"
+LAYOUTS = (ADJACENCY_LAYOUT, PATH_LAYOUT, RADIX_LAYOUT)
+
+# NOTE: full paths are built by prefixing each name with a separator that
+# sorts before any printable character, so that paths sort the same way as
+# their keys and all descendants of a node share its path as a prefix.
+# Tails of radix nodes are built the same way.
+PATH_SEP = "\x01"
+ROOT_PATH = ""
+
+PATH_SQL = (scripts / "path.sql").read_text()
+PATH_BACKFILL_SQL = (scripts / "path_backfill.sql").read_text()
 
 DIFF_SQL = (scripts / "diff.sql").read_text()
-DIFF_TABLE = "temp_diff"
+# NOTE: keyed by whether or not merkle hashes are enabled and the schema
+DIFF_NODE_SQL = {
+    (hashes, dedup, radix): DIFF_SQL.format(
+        hash="nodes.hash" if hashes else "NULL",
+        blob="nodes.blob" if dedup else "NULL",
+        value=VALUE_SQL[dedup],
+        tail=TAIL_SQL[radix],
+        column="id",
+    )
+    for hashes in (False, True)
+    for dedup, radix in SCHEMAS
+}
+DIFF_CHILDREN_SQL = {
+    (hashes, dedup, radix): DIFF_SQL.format(
+        hash="nodes.hash" if hashes else "NULL",
+        blob="nodes.blob" if dedup else "NULL",
+        value=VALUE_SQL[dedup],
+        tail=TAIL_SQL[radix],
+        column="pid",
+    )
+    for hashes in (False, True)
+    for dedup, radix in SCHEMAS
+}
+
+if HAS_UPSERT:
+    SET_SQLS: tuple[str, ...] = (
+        """
+        INSERT INTO
+            nodes (pid, name, has_value, value)
+            VALUES (:pid, :name, True, :value)
+            ON CONFLICT (pid, name) DO UPDATE SET has_value=True, value=:value
+        """,
+    )
+else:
+    # NOTE: not using INSERT OR REPLACE here, as deleting the old row would
+    # trigger the subtree count updates.
+    SET_SQLS = (
+        """
+        UPDATE nodes
+            SET has_value = True, value = :value
+            WHERE pid == :pid AND name == :name
+        """,
+        """
+        INSERT OR IGNORE INTO
+            nodes (pid, name, has_value, value)
+            VALUES (:pid, :name, True, :value)
+        """,
+    )
+
+# NOTE: max number of node ids to keep cached per trie (and its views)
+NODE_CACHE_SIZE = 65536
+# NOTE: memory budget (in bytes) for cached values, disabled by default
+VALUE_CACHE_SIZE = 0
+
+# NOTE: parallel scans split the work into this many partitions per worker,
+# so that a single large subtree doesn't leave the other workers idle.
+PARTITIONS_PER_WORKER = 4
+# NOTE: parallel scans send results back in batches of this many rows, and
+# buffer at most this many batches per worker.
+PARALLEL_BATCH_SIZE = 1024
+PARALLEL_QUEUE_SIZE = 4
+# NOTE: how often (in seconds) to check if a worker has failed
+PARALLEL_POLL_INTERVAL = 1
 
 DEFAULT_DB_FMT = "file:sqlitetrie_{id}?mode=memory&cache=shared"
 
 
+def _hash_blob(value: bytes) -> bytes:
+    return hashlib.blake2b(value, digest_size=BLOB_HASH_SIZE).digest()
+
+
+def _select_nodes(conn, schema, where, params):
+    # NOTE: where is always one of the literals from this module
+    return conn.execute(
+        f"SELECT {NODE_COLUMNS_SQL[schema]} FROM nodes WHERE {where}",  # noqa: S608
+        params,
+    )
+
+
+def _tail(names) -> str:
+    return "".join(PATH_SEP + name for name in names)
+
+
+def _names(tail: str) -> list[str]:
+    return tail.split(PATH_SEP)[1:]
+
+
+def _edge(row) -> TrieKey:
+    return (row["name"], *_names(row["tail"]))
+
+
+def _chain_node(row, name, rest) -> dict[str, Any]:
+    # NOTE: a node in the middle of a chain, see _rest
+    return {
+        **dict(row),
+        "name": name,
+        "has_value": False,
+        "value": None,
+        "tail": "",
+        "rest": rest,
+    }
+
+
+def _chunks(entries, size=LOOKUP_CHUNK_SIZE):
+    it = iter(entries)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+def _rest(node) -> TrieKey:
+    # NOTE: in radix layout, keys that end in the middle of a collapsed chain
+    # are looked up as the node that the chain belongs to, along with the rest
+    # of the names in the chain (see SQLiteTrie._lookup_node).
+    return node.get("rest", ()) if isinstance(node, dict) else ()
+
+
+def _hash_value(has_value: bool, value: Optional[bytes]) -> "hashlib.blake2b":
+    ret = hashlib.blake2b(digest_size=HASH_SIZE)
+    if not has_value:
+        ret.update(b"\x00")
+    elif value is None:
+        ret.update(b"\x01")
+    else:
+        ret.update(b"\x02" + len(value).to_bytes(8, "big"))
+        ret.update(value)
+    return ret
+
+
+def _hash_child(name: str, digest: bytes) -> bytes:
+    encoded = name.encode("utf-8")
+    return len(encoded).to_bytes(4, "big") + encoded + digest
+
+
+def _partition(tasks, weights, parts):
+    # NOTE: splitting into contiguous groups of roughly the same weight, so
+    # that results of the groups could simply be concatenated in order.
+    target = max(sum(weights) / parts, 1)
+    groups: list[list] = []
+    group: list = []
+    total = 0
+    for task, weight in zip(tasks, weights):
+        group.append(task)
+        total += weight
+        if total >= target * (len(groups) + 1):
+            groups.append(group)
+            group = []
+    if group:
+        groups.append(group)
+    return groups
+
+
+def _get_batch(future, queue):
+    # NOTE: checking on the worker every now and then, so that we don't wait
+    # for results forever if it has failed.
+    while True:
+        try:
+            return queue.get(timeout=PARALLEL_POLL_INTERVAL)
+        except Empty:
+            if future.done():
+                future.result()
+
+
+def _merge_children(old_rows, new_rows):
+    # NOTE: children are selected in name order
+    return merge_join(old_rows, new_rows, itemgetter("name"))
+
+
+def _iterate_chains(cursor, key):
+    names = list(key)
+    ends = [len(names)]
+    while rows := cursor.fetchmany(ITEMS_CHUNK_SIZE):
+        for depth, name, has_value, value, tail in rows:
+            if depth:
+                del names[ends[depth - 1] :]
+                names.append(name)
+                names.extend(_names(tail))
+                del ends[depth:]
+                ends.append(len(names))
+            if has_value:
+                yield tuple(names), value
+
+
+def _build_chain(node_factory: NodeFactory, key: TrieKey, names, build):
+    # NOTE: expanding the rest of a chain that radix layout collapsed into a
+    # single node, the last node of the chain is built by build(key).
+    if not names:
+        return build(key)
+    children = (
+        _build_chain(node_factory, (*key, names[0]), names[1:], build) for _ in (0,)
+    )
+    return node_factory(tuple, key, children)
+
+
 @define(frozen=True)
 class _SQLiteTrieNode:
     id: int
@@ -51,77 +350,300 @@ class _SQLiteTrieNode:
     name: str
     has_value: bool
     value: Optional[bytes]
+    tail: str = ""
 
     @classmethod
     def from_step(cls, step: sqlite3.Row):
         kwargs = dict(step)
-        kwargs.pop("path", None)
+        kwargs.pop("depth", None)
+        kwargs.pop("rest", None)
         return cls(**kwargs)
 
-    def get_children(
+    def traverse(
         self,
         conn: sqlite3.Connection,
-        limit: Optional[int] = None,
-    ) -> Iterator["_SQLiteTrieNode"]:
-        limit_sql = ""
-        if limit:
-            limit_sql = f"LIMIT {limit}"
-
-        for row in conn.execute(  # nosec
-            f"""
-            SELECT * FROM nodes WHERE nodes.pid == ? {limit_sql}
-            """,  # noqa: S608
-            (self.id,),
-        ).fetchall():
-            yield _SQLiteTrieNode(**row)
-
-    def traverse(
+        node_factory: NodeFactory,
+        key: TrieKey,
+        prefetch: bool = True,
+        schema: tuple[bool, bool] = (False, False),
+    ):
+        if not prefetch:
+            return self._traverse_lazy(conn, node_factory, key, schema)
+
+        # NOTE: prefetching the whole subtree with a single query and grouping
+        # nodes by parent in memory, instead of querying for children of each
+        # node separately. Node factory is still fed lazily, so subtrees that
+        # it doesn't consume are never built.
+        rows = conn.execute(
+            ITEMS_SQL[schema],
+            {"root": self.id, "shallow": False, "with_values": True},
+        )
+        root: Subtree = (self.name, self.has_value, self.value, [])
+        stack = [root]
+        while chunk := rows.fetchmany(ITEMS_CHUNK_SIZE):
+            for depth, name, has_value, value, *tail in chunk:
+                if not depth:
+                    continue
+                del stack[depth:]
+                node: Subtree = (name, has_value, value, [])
+                head = node
+                if tail and tail[0]:
+                    names = [name, *_names(tail[0])]
+                    node = head = (names.pop(), has_value, value, [])
+                    for parent in reversed(names):
+                        head = (parent, False, None, [head])
+                stack[-1][3].append(head)
+                stack.append(node)
+
+        return build_subtree(node_factory, key, root)
+
+    def _traverse_lazy(
         self,
         conn: sqlite3.Connection,
         node_factory: NodeFactory,
         key: TrieKey,
+        schema: tuple[bool, bool] = (False, False),
     ):
-        def children() -> Iterator[tuple[TrieKey, bytes]]:
-            for node in self.get_children(conn):
-                yield node.traverse(conn, node_factory, (*key, node.name))
+        def children():
+            for row in _select_nodes(
+                conn, schema, "nodes.pid == ? ORDER BY nodes.name", (self.id,)
+            ).fetchall():
+                node = _SQLiteTrieNode(**row)
+                if not node.tail:
+                    yield node._traverse_lazy(
+                        conn, node_factory, (*key, node.name), schema
+                    )
+                    continue
+                yield _build_chain(
+                    node_factory,
+                    (*key, node.name),
+                    _names(node.tail),
+                    partial(node._traverse_lazy, conn, node_factory, schema=schema),
+                )
 
-        args: list[Any] = [None, key, children()]
+        args: list[Any] = [tuple, key, children()]
         if self.has_value:
             args.append(self.value)
         return node_factory(*args)
 
     def iterate(
-        self, conn: sqlite3.Connection, key: TrieKey, shallow: bool = False
-    ) -> Iterator[tuple[TrieKey, bytes]]:
-        stack = [(key, self)]
-        while stack:
-            node_key, node = stack.pop()
-            if node.has_value:
-                yield node_key, node.value  # type: ignore[misc]
-            if not (shallow and node.has_value):
-                stack.extend(
-                    ((*node_key, child.name), child)
-                    for child in node.get_children(conn)
-                )
+        self,
+        conn: sqlite3.Connection,
+        key: TrieKey,
+        shallow: bool = False,
+        with_values: bool = True,
+        schema: tuple[bool, bool] = (False, False),
+    ) -> Iterator[tuple[TrieKey, Optional[bytes]]]:
+        # NOTE: rows come in depth-first order, so we only need to keep track
+        # of the names along the current path to restore the keys. In radix
+        # layout nodes can have more than one name, so _iterate_chains also
+        # keeps track of where the names of each node end.
+        cursor = conn.execute(
+            ITEMS_SQL[schema],
+            {"root": self.id, "shallow": shallow, "with_values": with_values},
+        )
+        _, radix = schema
+        if radix:
+            yield from _iterate_chains(cursor, key)
+            return
+
+        names = list(key)
+        offset = len(key) - 1
+        while rows := cursor.fetchmany(ITEMS_CHUNK_SIZE):
+            for depth, name, has_value, value in rows:
+                if depth:
+                    del names[offset + depth :]
+                    names.append(name)
+                if has_value:
+                    yield tuple(names), value
+
+
+def _lazy_diff_values(hashes, schema):
+    # NOTE: with merkle hashes or deduplicated values (which could be
+    # compared by their blob ids) values are only needed for nodes that
+    # did change, so we only load them on demand.
+    dedup, _ = schema
+    return hashes or dedup
+
+
+def _get_diff_rows(conn, sql, nid, *, hashes, schema):
+    return conn.execute(
+        sql[(hashes, *schema)],
+        {"id": nid, "with_values": not _lazy_diff_values(hashes, schema)},
+    )
+
+
+def _get_diff_value(conn, node, *, hashes, schema):
+    if not _lazy_diff_values(hashes, schema):
+        return node["value"]
+    row = _select_nodes(conn, schema, "nodes.id == ?", (node["id"],)).fetchone()
+    return row["value"]
+
+
+def _iterate_subtree(conn, nid, key, *, schema):
+    node = _SQLiteTrieNode(nid, None, "", False, None)
+    return node.iterate(conn, key, schema=schema)
+
+
+def _iterate_changes(conn, typ, node, key, *, hashes, schema):  # noqa: PLR0913
+    if node["has_children"]:
+        items = _iterate_subtree(conn, node["id"], key, schema=schema)
+    elif node["has_value"]:
+        items = iter([(key, _get_diff_value(conn, node, hashes=hashes, schema=schema))])
+    else:
+        return
+
+    for ikey, value in items:
+        if not ikey:
+            # NOTE: values of the roots themselves are not compared
+            continue
+        entry = TrieNode(ikey, value)
+        yield Change(
+            typ,
+            None if typ == ADD else entry,
+            None if typ == DELETE else entry,
+        )
+
+
+def _diff_values(conn, old, new, key, with_unchanged, *, hashes, schema):  # noqa: PLR0913
+    if not with_unchanged and old["blob"] is not None and old["blob"] == new["blob"]:
+        return None
+
+    ctx = {"hashes": hashes, "schema": schema}
+    old_entry = new_entry = None
+    if old["has_value"]:
+        old_entry = TrieNode(key, _get_diff_value(conn, old, **ctx))
+    if new["has_value"]:
+        new_entry = TrieNode(key, _get_diff_value(conn, new, **ctx))
+    return diff_entries(old_entry, new_entry, with_unchanged)
+
+
+def _diff_nodes(  # noqa: PLR0913
+    conn, old, new, key, with_unchanged, *, hashes, schema, stale=None
+):
+    # NOTE: stale are the hashes that couldn't be stored, see
+    # SQLiteTrie._refresh_hashes
+    stale = stale or {}
+    ctx = {"hashes": hashes, "schema": schema}
+    old_hash = old["hash"] or stale.get(old["id"])
+    if old["id"] == new["id"] or (
+        old_hash is not None and old_hash == (new["hash"] or stale.get(new["id"]))
+    ):
+        if with_unchanged:
+            yield from _iterate_changes(conn, UNCHANGED, old, key, **ctx)
+        return
+
+    if key and (old["has_value"] or new["has_value"]):
+        change = _diff_values(conn, old, new, key, with_unchanged, **ctx)
+        if change is not None:
+            yield change
+
+    if not (old["has_children"] or new["has_children"]):
+        return
+
+    old_children = _get_diff_rows(conn, DIFF_CHILDREN_SQL, old["id"], **ctx)
+    new_children = _get_diff_rows(conn, DIFF_CHILDREN_SQL, new["id"], **ctx)
+    for old_child, new_child in _merge_children(old_children, new_children):
+        if new_child is None:
+            child_key = (*key, *_edge(old_child))
+            yield from _iterate_changes(conn, DELETE, old_child, child_key, **ctx)
+        elif old_child is None:
+            child_key = (*key, *_edge(new_child))
+            yield from _iterate_changes(conn, ADD, new_child, child_key, **ctx)
+        elif _edge(old_child) == _edge(new_child):
+            child_key = (*key, *_edge(old_child))
+            yield from _diff_nodes(
+                conn,
+                old_child,
+                new_child,
+                child_key,
+                with_unchanged,
+                stale=stale,
+                **ctx,
+            )
+        else:
+            # NOTE: chains that were collapsed differently can't be walked
+            # side by side, so we merge-join their items instead.
+            yield from diff_items(
+                _iterate_subtree(
+                    conn, old_child["id"], (*key, *_edge(old_child)), schema=schema
+                ),
+                _iterate_subtree(
+                    conn, new_child["id"], (*key, *_edge(new_child)), schema=schema
+                ),
+                with_unchanged,
+            )
 
 
 class SQLiteTrie(AbstractTrie):
     def __init__(self, *args, **kwargs):
         self._root_key = ROOT_KEY
         self._root_id = ROOT_ID
+        self._root_path = ROOT_PATH
+        self._layout = ADJACENCY_LAYOUT
+        self._hashes = False
+        self._dedup = False
+        self._prune = False
         self._path = DEFAULT_DB_FMT.format(id=uuid4())
         self._local = threading.local()
-        self._ids = {}
+        # NOTE: node ids by absolute keys, shared between the trie and its views
+        self._ids = PrefixLRUCache(NODE_CACHE_SIZE)
+        self._values = PrefixLRUCache(VALUE_CACHE_SIZE, getsizeof=sys.getsizeof)
+        self._pool: Optional[ReaderPool] = None
+        self._workers = 0
+        # NOTE: live views, shared between the trie and its views, so that
+        # gc() doesn't collect their roots.
+        self._views: weakref.WeakValueDictionary[int, SQLiteTrie] = (
+            weakref.WeakValueDictionary()
+        )
         super().__init__(*args, **kwargs)
 
     @classmethod
-    def open(cls, path):
+    def open(  # noqa: PLR0913
+        cls,
+        path,
+        layout=ADJACENCY_LAYOUT,
+        *,
+        hashes=False,
+        dedup=False,
+        prune=False,
+        node_cache_size=NODE_CACHE_SIZE,
+        value_cache_size=VALUE_CACHE_SIZE,
+        readers=0,
+        workers=0,
+    ):
+        # NOTE: hashes=True maintains merkle hashes of subtrees, which allows
+        # diff() to skip subtrees that didn't change (diff() stores the hashes
+        # it had to recompute, see _refresh_hashes). dedup=True stores each
+        # distinct value only once, see blobs.sql, and stays on for the
+        # database from then on. prune=True makes del also delete the
+        # ancestors that don't have any values left under them, see
+        # prune.sql. readers>0 makes items() and diff() read from a pool of
+        # read-only connections. workers>0 makes items() and diff() scan
+        # subtrees in that many processes.
+        if layout not in LAYOUTS:
+            raise ValueError(f"unknown layout '{layout}', expected one of {LAYOUTS}")
+
         trie = cls()
         trie._path = path
+        trie._layout = layout
+        trie._hashes = hashes
+        trie._dedup = dedup
+        trie._prune = prune
+        trie._ids = PrefixLRUCache(node_cache_size)
+        trie._values = PrefixLRUCache(value_cache_size, getsizeof=sys.getsizeof)
+        if readers:
+            trie._pool = ReaderPool(path, readers)
+        if workers:
+            readonly_uri(path)
+            trie._workers = workers
         return trie
 
     def close(self):
-        self._ids = {}
+        self._ids.clear()
+        self._values.clear()
+        if self._pool is not None:
+            self._pool.close()
 
         conn = getattr(self._local, "conn", None)
         if conn is None:
@@ -135,10 +657,111 @@ class SQLiteTrie(AbstractTrie):
             pass
 
     def commit(self):
+        in_transaction = self.in_transaction
         self._conn.commit()
+        if in_transaction:
+            # NOTE: other threads might have cached values that were just
+            # overwritten.
+            self._values.clear()
 
     def rollback(self):
         self._conn.rollback()
+        # NOTE: cached ids might point to nodes that don't exist anymore
+        self._ids.clear()
+        self._values.clear()
+
+    @property
+    def in_transaction(self) -> bool:
+        conn = getattr(self._local, "conn", None)
+        return conn is not None and conn.in_transaction
+
+    def node_cache_info(self) -> CacheInfo:
+        return self._ids.info()
+
+    def value_cache_info(self) -> CacheInfo:
+        return self._values.info()
+
+    def pool_stats(self) -> Optional[PoolStats]:
+        if self._pool is None:
+            return None
+        return self._pool.stats()
+
+    @property
+    def _schema(self):
+        return self._dedup, self._layout == RADIX_LAYOUT
+
+    def _parallel(self):
+        # NOTE: worker processes can only see committed changes. Subtrees are
+        # split between them by the names of the top-level children, which
+        # doesn't work for collapsed chains of the radix layout.
+        return (
+            self._workers
+            and self._layout != RADIX_LAYOUT
+            and not self._conn.in_transaction
+        )
+
+    def _map(self, func, tasks, weights):
+        # NOTE: groups are streamed back in order, each through a bounded
+        # queue, and only as many of them are in flight as there are
+        # workers, so memory use doesn't depend on the size of the results.
+        groups = _partition(tasks, weights, self._workers * PARTITIONS_PER_WORKER)
+        if not groups:
+            return
+
+        workers = min(self._workers, len(groups))
+        remaining = iter(groups)
+        uri = readonly_uri(self._path)
+        with ProcessPoolExecutor(workers) as executor, Manager() as manager:
+            pending: deque = deque()
+
+            def _submit():
+                for group in islice(remaining, workers - len(pending)):
+                    queue = manager.Queue(PARALLEL_QUEUE_SIZE)
+                    future = executor.submit(_stream_worker, func, uri, queue, group)
+                    pending.append((future, queue))
+
+            _submit()
+            while pending:
+                future, queue = pending[0]
+                while (batch := _get_batch(future, queue)) is not None:
+                    yield from batch
+                pending.popleft()
+                _submit()
+
+    @contextmanager
+    def _reader(self):
+        conn = self._conn
+        # NOTE: uncommitted changes are only visible to our own connection
+        reader = None
+        if self._pool is not None and not conn.in_transaction:
+            reader = self._pool.acquire()
+        if reader is None:
+            yield conn
+            return
+
+        try:
+            yield reader
+        finally:
+            self._pool.release(reader)
+
+    @contextmanager
+    def _transaction(self):
+        # NOTE: using a savepoint inside of an explicitly started transaction,
+        # so that we could roll back our own changes on failure without
+        # committing or rolling back anything that the caller has pending.
+        conn = self._conn
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        conn.execute("SAVEPOINT sqltrie")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK TO sqltrie")
+            conn.execute("RELEASE sqltrie")
+            self._ids.clear()
+            self._values.clear()
+            raise
+        conn.execute("RELEASE sqltrie")
 
     @property
     def _conn(self):  # pylint: disable=method-hidden
@@ -151,24 +774,98 @@ class SQLiteTrie(AbstractTrie):
         if conn is None:
             conn = self._local.conn = sqlite3.connect(self._path)
             conn.row_factory = sqlite3.Row
-            conn.executescript(INIT_SQL)
+            # NOTE: triggers of blobs.sql call this, so it has to be there even
+            # if dedup wasn't asked for, see _init.
+            conn.create_function("sqltrie_hash", 1, _hash_blob, deterministic=True)
+            self._init(conn)
 
         return conn
 
+    def _init(self, conn):
+        conn.executescript(INIT_SQL)
+
+        # NOTE: migrating databases that were created by older versions
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(nodes)")}
+        if "count" not in columns:
+            conn.execute(
+                "ALTER TABLE nodes ADD COLUMN count INTEGER NOT NULL DEFAULT 0"
+            )
+            conn.executemany(
+                "UPDATE nodes SET count = ? WHERE id == ?",
+                conn.execute(COUNT_BACKFILL_SQL).fetchall(),
+            )
+        if self._hashes and "hash" not in columns:
+            # NOTE: NULL hash means "unknown", so they'll be computed lazily
+            conn.execute("ALTER TABLE nodes ADD COLUMN hash BLOB")
+        self._init_layout(conn, columns)
+
+        if "blob" in columns:
+            # NOTE: once a database was opened with dedup=True, its values
+            # live in blobs, so it has to stay deduplicated.
+            self._dedup = True
+        elif self._dedup:
+            conn.execute("ALTER TABLE nodes ADD COLUMN blob INTEGER")
+
+        conn.executescript(COUNT_SQL)
+        if self._hashes:
+            conn.executescript(HASH_SQL)
+        if self._layout == PATH_LAYOUT:
+            conn.executescript(PATH_SQL)
+        if self._dedup:
+            conn.executescript(BLOBS_SQL)
+            if "blob" not in columns:
+                # NOTE: triggers move existing values to blobs
+                conn.execute("UPDATE nodes SET value = value WHERE value IS NOT NULL")
+                conn.commit()
+
+    def _init_layout(self, conn, columns):
+        radix = self._layout == RADIX_LAYOUT
+        if ("tail" in columns and not radix) or ("path" in columns and radix):
+            # NOTE: other layouts would ignore collapsed chains and radix
+            # layout doesn't maintain full paths.
+            raise ValueError(
+                f"'{self._path}' uses a layout that is incompatible with "
+                f"'{self._layout}'"
+            )
+        if radix and "tail" not in columns:
+            # NOTE: existing chains are left as they are, only the new ones
+            # are collapsed.
+            conn.execute("ALTER TABLE nodes ADD COLUMN tail TEXT NOT NULL DEFAULT ''")
+        if self._layout == PATH_LAYOUT and "path" not in columns:
+            conn.execute("ALTER TABLE nodes ADD COLUMN path TEXT")
+            conn.executemany(
+                "UPDATE nodes SET path = ? WHERE id == ?",
+                conn.execute(PATH_BACKFILL_SQL).fetchall(),
+            )
+
+    def _key_path(self, key):
+        return self._root_path + "".join(PATH_SEP + name for name in key)
+
+    def _path_key(self, path):
+        return tuple(path[len(self._root_path) :].split(PATH_SEP)[1:])
+
+    def _abs_key(self, key):
+        return (*self._root_key, *key)
+
     def _create_node(self, key):
         try:
-            return self._ids[key]
+            return self._ids[self._abs_key(key)]
         except KeyError:
             pass
 
+        if self._layout == RADIX_LAYOUT:
+            nid = self._create_radix_node(key)
+            self._ids[self._abs_key(key)] = nid
+            return nid
+
         rows = self._traverse(key)
         if rows:
-            longest_prefix = tuple(rows[-1]["path"].split("/"))
+            longest_prefix = key[: rows[-1]["depth"]]
             pid = rows[-1]["id"]
         else:
             longest_prefix = ()
             pid = self._root_id
-        self._ids[longest_prefix] = pid
+        self._ids[self._abs_key(longest_prefix)] = pid
 
         node_key = longest_prefix
         for name in key[len(longest_prefix) :]:
@@ -182,115 +879,434 @@ class SQLiteTrie(AbstractTrie):
                 (pid, name),
             )
             nid = cur.lastrowid
-            self._ids[node_key] = nid
+            self._ids[self._abs_key(node_key)] = nid
             pid = nid
 
         return pid
 
-    def _traverse(self, key):
-        path = "/".join(key).replace("'", "''")
-        self._conn.executescript(STEPS_SQL.format(path=path, root=self._root_id))
+    def _create_radix_node(self, key):
+        last, depth, child = self._find_chain(key)
+        pid = last["id"] if last else self._root_id
+        if child is not None:
+            # NOTE: key leaves the chain (or ends) somewhere in the middle of
+            # it, so the chain has to be split there.
+            edge = _edge(child)
+            size = 1
+            while (
+                size < len(edge)
+                and depth + size < len(key)
+                and edge[size] == key[depth + size]
+            ):
+                size += 1
+            pid = self._split_chain(child, size)
+            depth += size
+
+        if depth == len(key):
+            return pid
+
+        return self._conn.execute(
+            "INSERT INTO nodes (pid, name, tail) VALUES (?, ?, ?)",
+            (pid, key[depth], _tail(key[depth + 1 :])),
+        ).lastrowid
+
+    def _split_chain(self, row, size):
+        # NOTE: the first size names of the chain become a new node, which
+        # takes over (pid, name) of the old one, so it is only attached after
+        # the old one is moved under it. Counts of all of the nodes stay the
+        # same and so does the hash of the old node.
+        edge = _edge(row)
+        conn = self._conn
+        nid = conn.execute(
+            """
+            INSERT INTO nodes (pid, name, tail, count)
+            SELECT NULL, ?, ?, count FROM nodes WHERE id == ?
+            """,
+            (edge[0], _tail(edge[1:size]), row["id"]),
+        ).lastrowid
+        conn.execute(
+            "UPDATE nodes SET pid = ?, name = ?, tail = ? WHERE id == ?",
+            (nid, edge[size], _tail(edge[size + 1 :]), row["id"]),
+        )
+        conn.execute("UPDATE nodes SET pid = ? WHERE id == ?", (row["pid"], nid))
+        if self._hashes:
+            # NOTE: the new node doesn't have a hash yet, so its ancestors
+            # can't have one either.
+            conn.execute("UPDATE nodes SET hash = NULL WHERE id == ?", (row["pid"],))
+        return nid
+
+    def _find_chain(self, key):
+        # NOTE: returns the deepest node that key goes all the way through,
+        # the number of names of the key that it covers and its child that
+        # the rest of the key starts in (if any).
+        rows = self._traverse(key)
+        last = rows[-1] if rows else None
+        depth = last["depth"] if last else 0
+        child = None
+        if depth < len(key):
+            child = _select_nodes(
+                self._conn,
+                self._schema,
+                "nodes.pid == ? AND nodes.name == ?",
+                (last["id"] if last else self._root_id, key[depth]),
+            ).fetchone()
+        return last, depth, child
+
+    def _create_nodes(self, keys):
+        # NOTE: bulk version of _create_node that resolves node ids level by
+        # level, so that we only need a couple of statements per tree level
+        # instead of a couple of statements per node.
+        ids = {(): self._root_id}
+        levels = defaultdict(set)
+        for key in keys:
+            while key not in ids and key not in levels[len(key)]:
+                levels[len(key)].add(key)
+                key = key[:-1]
+
+        for depth in sorted(levels):
+            missing = []
+            for key in levels[depth]:
+                nid = self._ids.get(self._abs_key(key))
+                if nid is None:
+                    missing.append(key)
+                else:
+                    ids[key] = nid
+
+            if not missing:
+                continue
 
-        return self._conn.execute(f"SELECT * FROM {STEPS_TABLE}").fetchall()  # nosec  # noqa: S608
+            self._conn.executemany(
+                """
+                INSERT OR IGNORE
+                    INTO nodes (pid, name)
+                    VALUES (?, ?)
+                """,
+                ((ids[key[:-1]], key[-1]) for key in missing),
+            )
+
+            pids = {ids[key[:-1]] for key in missing}
+            rows = self._conn.execute(
+                """
+                SELECT id, pid, name FROM nodes
+                WHERE pid IN (SELECT value FROM json_each(?))
+                """,
+                (json.dumps(list(pids)),),
+            )
+            children = {(row["pid"], row["name"]): row["id"] for row in rows}
+            for key in missing:
+                nid = children[(ids[key[:-1]], key[-1])]
+                ids[key] = self._ids[self._abs_key(key)] = nid
+
+        return ids
+
+    def update_many(self, items: TrieItems) -> None:
+        if isinstance(items, Mapping):
+            items = items.items()
+        items = {tuple(key): value for key, value in items}
+
+        with self._transaction() as conn:
+            if self._layout == RADIX_LAYOUT:
+                # NOTE: chains might have to be split along the way, so nodes
+                # are created one by one.
+                for key, value in items.items():
+                    self[key] = value
+                return
+
+            if () in items:
+                self[()] = items.pop(())
+
+            ids = self._create_nodes({key[:-1] for key in items})
+            params = [
+                {"pid": ids[key[:-1]], "name": key[-1], "value": value}
+                for key, value in items.items()
+            ]
+            for sql in SET_SQLS:
+                conn.executemany(sql, params)
+
+        if self._values.maxsize != 0:
+            for key in items:
+                self._values.pop(self._abs_key(key), None)
+
+    def _traverse(self, key, depth=0):
+        if self._layout == PATH_LAYOUT:
+            paths = [self._key_path(key[:idx]) for idx in range(1, len(key) + 1)]
+            return self._conn.execute(
+                f"""
+                SELECT
+                    {NODE_COLUMNS_SQL[self._schema]},
+                    paths.key + 1 AS depth
+                FROM json_each(:paths) AS paths, nodes
+                WHERE nodes.path == paths.value AND paths.key + 1 >= :depth
+                ORDER BY paths.key
+                """,  # noqa: S608
+                {"paths": json.dumps(paths), "depth": depth},
+            ).fetchall()
+
+        # NOTE: the path is passed as a json array of names, so that we could
+        # use the same (cached) statement with bound parameters for any key.
+        return self._conn.execute(
+            STEPS_SQL[self._schema],
+            {
+                "root": self._root_id,
+                "path": json.dumps(list(key)),
+                "joined": _tail(key),
+                "depth": depth,
+            },
+        ).fetchall()
 
     def _get_node(self, key):
         if not key:
-            return self._conn.execute(
-                "SELECT * FROM nodes WHERE id == ?",
-                (self._root_id,),
+            return _select_nodes(
+                self._conn, self._schema, "nodes.id == ?", (self._root_id,)
+            ).fetchone()
+
+        abs_key = self._abs_key(key)
+        nid = self._ids.get(abs_key)
+        if nid is not None:
+            row = _select_nodes(
+                self._conn, self._schema, "nodes.id == ?", (nid,)
+            ).fetchone()
+            if (
+                row is not None
+                and (row["name"] if not row["tail"] else _names(row["tail"])[-1])
+                == key[-1]
+            ):
+                return row
+            self._ids.pop(abs_key, None)
+
+        row = self._lookup_node(key)
+        if not _rest(row):
+            self._ids[abs_key] = row["id"]
+        return row
+
+    def _lookup_node(self, key):
+        if self._layout == PATH_LAYOUT:
+            row = _select_nodes(
+                self._conn, self._schema, "nodes.path == ?", (self._key_path(key),)
             ).fetchone()
+            if row is None:
+                raise KeyError(key)
+            return row
+
+        if self._layout == RADIX_LAYOUT:
+            return self._lookup_radix_node(key)
 
-        rows = list(self._traverse(key))
-        if len(rows) != len(key):
+        rows = self._traverse(key, depth=len(key))
+        if not rows:
             raise KeyError(key)
 
         return rows[-1]
 
+    def _lookup_radix_node(self, key):
+        last, depth, child = self._find_chain(key)
+        if depth == len(key):
+            return last
+
+        names = key[depth:]
+        edge = _edge(child) if child is not None else ()
+        if edge[: len(names)] != tuple(names):
+            raise KeyError(key)
+
+        # NOTE: key ends in the middle of a chain, so it is a node without a
+        # value, that only has the rest of the chain under it. Not splitting
+        # the chain here, so that lookups don't modify the database.
+        return _chain_node(child, key[-1], edge[len(names) :])
+
+    def _lookup_many(self, keys, prefixes=False):
+        # NOTE: bulk version of _lookup_node, returns rows of the nodes that
+        # exist by their keys (and by keys of their prefixes if asked to).
+        if self._layout != PATH_LAYOUT:
+            return self._walk_many(keys)
+
+        if prefixes:
+            keys = {key[:idx] for key in keys for idx in range(1, len(key) + 1)}
+        nodes = {(): self._get_node(())}
+        for chunk in _chunks(key for key in keys if key):
+            rows = self._conn.execute(
+                f"""
+                SELECT {NODE_COLUMNS_SQL[self._schema]}, paths.key AS idx
+                FROM json_each(?) AS paths, nodes
+                WHERE nodes.path == paths.value
+                """,  # noqa: S608
+                (json.dumps([self._key_path(key) for key in chunk]),),
+            )
+            nodes.update((chunk[row["idx"]], row) for row in rows)
+        return nodes
+
+    def _walk_many(self, keys):
+        # NOTE: walks down the tree for all of the keys at once, a level (or a
+        # radix chain) at a time, so that each node is only looked up once no
+        # matter how many keys go through it and each level only takes a
+        # single statement per LOOKUP_CHUNK_SIZE distinct nodes.
+        nodes = {(): self._get_node(())}
+        pending = [(key, 0, self._root_id) for key in keys if key]
+        while pending:
+            children = {}
+            for chunk in _chunks({(pid, key[depth]) for key, depth, pid in pending}):
+                # NOTE: names are grouped by their parents and the join order
+                # is forced, so that we don't need to extract each pair from
+                # json separately and the planner doesn't scan the parents.
+                parents = defaultdict(list)
+                for pid, name in chunk:
+                    parents[pid].append(name)
+                rows = self._conn.execute(
+                    f"""
+                    SELECT {NODE_COLUMNS_SQL[self._schema]}
+                    FROM json_each(?) AS parents
+                    CROSS JOIN json_each(parents.value) AS names
+                    CROSS JOIN nodes
+                    WHERE
+                        nodes.pid == CAST(parents.key AS INTEGER)
+                        AND nodes.name == names.value
+                    """,  # noqa: S608
+                    (json.dumps(parents),),
+                )
+                children.update(((row["pid"], row["name"]), row) for row in rows)
+
+            next_pending = []
+            for key, depth, pid in pending:
+                row = children.get((pid, key[depth]))
+                if row is None:
+                    continue
+
+                end = depth + 1
+                if row["tail"]:
+                    edge = _edge(row)
+                    end = depth + len(edge)
+                    if key[depth:end] != edge:
+                        names = key[depth:]
+                        if edge[: len(names)] == names:
+                            nodes[key] = _chain_node(row, key[-1], edge[len(names) :])
+                        continue
+
+                nodes[key[:end]] = row
+                if end < len(key):
+                    next_pending.append((key, end, row["id"]))
+            pending = next_pending
+        return nodes
+
     def _get_children(self, key, limit=None):
         node = self._get_node(key)
+        rest = _rest(node)
+        if rest:
+            # NOTE: the only child is the rest of the chain
+            row = _select_nodes(
+                self._conn, self._schema, "nodes.id == ?", (node["id"],)
+            ).fetchone()
+            return [{**dict(row), "name": rest[0], "tail": _tail(rest[1:])}]
 
         limit_sql = ""
         if limit:
             limit_sql = f"LIMIT {limit}"
 
-        return self._conn.execute(  # nosec
-            f"""
-            SELECT * FROM nodes WHERE nodes.pid == ? {limit_sql}
-            """,  # noqa: S608
-            (node["id"],),
+        return _select_nodes(  # nosec
+            self._conn, self._schema, f"nodes.pid == ? {limit_sql}", (node["id"],)
         ).fetchall()
 
     def __setitem__(self, key, value):
-        if not key:
+        if not key or self._layout == RADIX_LAYOUT:
             self._conn.execute(
                 """
                 UPDATE nodes SET has_value = True, value = ?  WHERE id == ?
                 """,
-                (value, self._root_id),
+                (value, self._create_node(key) if key else self._root_id),
             )
-            return
+        else:
+            pid = self._create_node(key[:-1])
 
-        pid = self._create_node(key[:-1])
+            params = {"pid": pid, "name": key[-1], "value": value}
+            for sql in SET_SQLS:
+                self._conn.execute(sql, params)
 
-        if HAS_UPSERT:
-            self._conn.execute(
-                """
-                INSERT INTO
-                    nodes (pid, name, has_value, value)
-                    VALUES (:pid, :name, True, :value)
-                    ON CONFLICT (pid, name) DO UPDATE SET has_value=True, value=:value
-                """,
-                {"pid": pid, "name": key[-1], "value": value},
-            )
-        else:
-            self._conn.execute(
-                """
-                INSERT OR REPLACE INTO
-                    nodes (id, pid, name, has_value, value)
-                    SELECT
-                        COALESCE(
-                            (SELECT id FROM nodes WHERE pid == :pid AND name == :name),
-                            (SELECT MAX(id) + 1 FROM nodes)
-                        ),
-                        :pid,
-                        :name,
-                        1,
-                        :value
-                """,
-                {"pid": pid, "name": key[-1], "value": value},
-            )
+        if self._values.maxsize != 0:
+            self._values.pop(self._abs_key(key), None)
 
     def __iter__(self):
-        yield from (key for key, _ in self.items())
+        if self._layout == PATH_LAYOUT:
+            yield from (key for key, _ in self.items())
+            return
+
+        node = _SQLiteTrieNode.from_step(self._get_node(()))
+        yield from (
+            key
+            for key, _ in node.iterate(
+                self._conn, (), with_values=False, schema=self._schema
+            )
+        )
 
     def __getitem__(self, key):
+        # NOTE: the cache is shared between threads, while transactions are
+        # not, so it is only used for committed values.
+        cached = not self.in_transaction
+        abs_key = self._abs_key(key)
+        if cached:
+            try:
+                return self._values[abs_key]
+            except KeyError:
+                pass
+
         row = self._get_node(key)
         has_value = row["has_value"]
         if not has_value:
             raise ShortKeyError(key)
+        if cached:
+            self._values[abs_key] = row["value"]
         return row["value"]
 
     def __delitem__(self, key):
+        self._values.pop(self._abs_key(key), None)
         node = self._get_node(key)
-        self._conn.execute(
-            """
-            UPDATE nodes SET has_value = 0, value = NULL WHERE id == ?
-            """,
-            (node["id"],),
-        )
+        if _rest(node):
+            # NOTE: nodes in the middle of a chain don't have values
+            return
+        if not self._prune:
+            self._conn.execute(
+                """
+                UPDATE nodes SET has_value = 0, value = NULL WHERE id == ?
+                """,
+                (node["id"],),
+            )
+            return
+
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE nodes SET has_value = 0, value = NULL WHERE id == ?",
+                (node["id"],),
+            )
+            self._prune_ancestors(conn, key, node["id"])
+
+    def _prune_ancestors(self, conn, key, nid):
+        rows = conn.execute(
+            PRUNE_SQL[self._layout == RADIX_LAYOUT],
+            {"id": nid, "root": self._root_id},
+        ).fetchall()
+        if not rows:
+            return
+        # NOTE: each node stands for a whole chain of names in radix layout
+        depth = len(key) - sum(len(_edge(row)) for row in rows[:-1])
+        self._forget(key[:depth])
+        self._delete_subtree(conn, rows[-1]["id"])
+
+    def _delete_subtree(self, conn, nid):
+        # NOTE: deleting the node before its descendants, so that count
+        # updates triggered by them stop right at it instead of going all the
+        # way up to the root. Path layout deletes descendants by itself.
+        conn.execute("DELETE FROM nodes WHERE id == ?", (nid,))
+        if self._layout != PATH_LAYOUT:
+            conn.execute(DELETE_DESCENDANTS_SQL, {"root": nid})
 
     def __len__(self):
-        return len(list(self.items()))
+        row = self._conn.execute(
+            "SELECT count FROM nodes WHERE id == ?",
+            (self._root_id,),
+        ).fetchone()
+        return row["count"] if row else 0
 
     def prefixes(self, key: TrieKey) -> Iterator[TrieStep]:
         for row in self._traverse(key):
             if not row["has_value"]:
                 continue
 
-            yield (
-                tuple(row["path"].split("/")),
-                row["value"],
-            )
+            yield key[: row["depth"]], row["value"]
 
     def shortest_prefix(self, key: TrieKey) -> Optional[TrieStep]:
         return next(self.prefixes(key), None)
@@ -301,6 +1317,36 @@ class SQLiteTrie(AbstractTrie):
             ret = step
         return ret
 
+    def get_many(self, keys, default=None):
+        keys = [tuple(key) for key in keys]
+        nodes = self._lookup_many(dict.fromkeys(keys))
+        ret = []
+        for key in keys:
+            row = nodes.get(key)
+            ret.append(
+                row["value"] if row is not None and row["has_value"] else default
+            )
+        return ret
+
+    def has_nodes(self, keys):
+        keys = [tuple(key) for key in keys]
+        nodes = self._lookup_many(dict.fromkeys(keys))
+        return [key in nodes for key in keys]
+
+    def longest_prefix_many(self, keys):
+        keys = [tuple(key) for key in keys]
+        nodes = self._lookup_many(dict.fromkeys(keys), prefixes=True)
+        ret = []
+        for key in keys:
+            step = None
+            for depth in range(len(key), 0, -1):
+                row = nodes.get(key[:depth])
+                if row is not None and row["has_value"]:
+                    step = (key[:depth], row["value"])
+                    break
+            ret.append(step)
+        return ret
+
     def view(
         self,
         key: Optional[TrieKey] = None,
@@ -308,27 +1354,113 @@ class SQLiteTrie(AbstractTrie):
         if not key:
             return self
 
-        self.commit()
-        try:
-            nid = self._get_node(key)["id"]
-        except KeyError:
+        # NOTE: not committing here, so that views could be created in the
+        # middle of the caller's transaction.
+        if self._layout == RADIX_LAYOUT:
+            # NOTE: the view needs a node of its own, even if that means
+            # splitting a chain.
             nid = self._create_node(key)
-            self.commit()
+        else:
+            try:
+                nid = self._get_node(key)["id"]
+            except KeyError:
+                nid = self._create_node(key)
 
         trie = SQLiteTrie()
         trie._path = self._path  # pylint: disable=protected-access
         trie._local = self._local  # pylint: disable=protected-access
-        trie._root_key = key  # pylint: disable=protected-access
+        trie._ids = self._ids  # pylint: disable=protected-access
+        trie._values = self._values  # pylint: disable=protected-access
+        trie._pool = self._pool  # pylint: disable=protected-access
+        trie._workers = self._workers  # pylint: disable=protected-access
+        trie._layout = self._layout  # pylint: disable=protected-access
+        trie._hashes = self._hashes  # pylint: disable=protected-access
+        trie._dedup = self._dedup  # pylint: disable=protected-access
+        trie._prune = self._prune  # pylint: disable=protected-access
+        trie._root_key = self._abs_key(key)  # pylint: disable=protected-access
         trie._root_id = nid  # pylint: disable=protected-access
+        trie._root_path = self._key_path(key)  # pylint: disable=protected-access
+        trie._views = self._views  # pylint: disable=protected-access
+        self._views[id(trie)] = trie
         return trie
 
     def items(self, prefix=None, shallow=False):
         key = prefix or ()
-        node = _SQLiteTrieNode.from_step(self._get_node(key))
-        yield from node.iterate(self._conn, key, shallow=shallow)
+        if self._parallel():
+            yield from self._items_parallel(key, shallow=shallow)
+            return
+
+        with self._reader() as conn:
+            if self._layout == PATH_LAYOUT:
+                yield from self._items_range(conn, key, shallow=shallow)
+                return
+
+            node = self._get_node(key)
+            yield from _SQLiteTrieNode.from_step(node).iterate(
+                conn, (*key, *_rest(node)), shallow=shallow, schema=self._schema
+            )
+
+    def _items_parallel(self, key, shallow=False):
+        node = self._get_node(key)
+        if node["has_value"]:
+            yield key, node["value"]
+            if shallow:
+                return
+
+        rows = self._conn.execute(
+            "SELECT id, name, count FROM nodes WHERE pid == ? ORDER BY name",
+            (node["id"],),
+        ).fetchall()
+        yield from self._map(
+            partial(_items_task, shallow, self._dedup),
+            [(row["id"], (*key, row["name"])) for row in rows],
+            [row["count"] + 1 for row in rows],
+        )
+
+    def _items_range(self, conn, key, shallow=False):
+        # NOTE: [path, path + "\x02") covers the node itself and all of its
+        # descendants, which are returned in key order.
+        path = self._key_path(key)
+        rows = conn.execute(
+            f"""
+            SELECT path, {VALUE_SQL[self._dedup]} AS value FROM nodes
+            WHERE path >= :path AND path < :path || char(2) AND has_value
+            ORDER BY path
+            """,  # noqa: S608
+            {"path": path},
+        )
+        skip = None
+        empty = True
+        for row in rows:
+            empty = False
+            if skip is not None and row["path"].startswith(skip):
+                continue
+            if shallow:
+                skip = row["path"] + PATH_SEP
+            yield self._path_key(row["path"]), row["value"]
+
+        if empty:
+            # NOTE: raising KeyError for non-existent prefixes, same as the
+            # adjacency layout does.
+            self._get_node(key)
 
     def clear(self):
-        self._conn.execute("DELETE FROM nodes")
+        # NOTE: keeping the root node itself, so that the trie (or the view)
+        # stays usable afterwards.
+        with self._transaction() as conn:
+            conn.execute(DELETE_DESCENDANTS_SQL, {"root": self._root_id})
+            conn.execute(
+                "UPDATE nodes SET has_value = 0, value = NULL WHERE id == ?",
+                (self._root_id,),
+            )
+        self._forget(())
+
+    def _forget(self, key):
+        # NOTE: dropping cached ids and values of key and its descendants,
+        # caches are shared with views, so they have to be modified in place.
+        key = self._abs_key(key)
+        self._ids.pop_prefix(key)
+        self._values.pop_prefix(key)
 
     def has_node(self, key: TrieKey) -> bool:
         try:
@@ -337,9 +1469,24 @@ class SQLiteTrie(AbstractTrie):
         except KeyError:
             return False
 
-    def delete_node(self, key: TrieKey):
+    def _own_node(self, key):
         node = self._get_node(key)
-        self._ids.pop(key, None)
+        if key and (_rest(node) or len(_edge(node)) > 1):
+            # NOTE: the part of the chain above the key has to stay
+            nid = self._create_node(key)
+            row = _select_nodes(
+                self._conn, self._schema, "nodes.id == ?", (nid,)
+            ).fetchone()
+            if len(_edge(row)) > 1:
+                self._split_chain(row, len(_edge(row)) - 1)
+            node = row
+        return node
+
+    def delete_node(self, key: TrieKey):
+        node = self._own_node(key)
+        # NOTE: descendants are either deleted together with the node or
+        # become unreachable, so their cached ids are stale either way.
+        self._forget(key)
         self._conn.execute(
             """
             DELETE FROM nodes WHERE id = ?
@@ -347,45 +1494,237 @@ class SQLiteTrie(AbstractTrie):
             (node["id"],),
         )
 
+    def delete_subtree(self, key: TrieKey):
+        if not key:
+            self.clear()
+            return
+
+        with self._transaction() as conn:
+            node = self._own_node(key)
+            self._forget(key)
+            self._delete_subtree(conn, node["id"])
+            if self._prune:
+                self._prune_ancestors(conn, key[:-1], node["pid"])
+
+    def gc(self) -> int:
+        # NOTE: deletes subtrees that don't have any values (e.g. left behind
+        # by del without prune=True) and nodes that can't be reached anymore
+        # (e.g. left behind by delete_node). Empty subtrees are only looked
+        # for under the root of this trie (or view), orphans are collected in
+        # the whole database. Roots of live views are kept, even if they are
+        # empty. Returns the number of deleted nodes.
+        with self._transaction() as conn:
+            before = conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+            # pylint: disable-next=protected-access
+            kept = [view._root_id for view in self._views.values()]
+            conn.execute(
+                DELETE_EMPTY_SQL, {"root": self._root_id, "kept": json.dumps(kept)}
+            )
+            conn.execute(DELETE_ORPHANS_SQL)
+            after = conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+        self._ids.clear()
+        return before - after
+
     def ls(
         self, key: TrieKey, with_values: Optional[bool] = False
     ) -> Iterator[Union[TrieKey, TrieNode]]:
         if with_values:
+            # NOTE: a child that starts a chain doesn't have a value
             yield from (  # type: ignore[misc]
-                ((*key, row["name"]), row["value"]) for row in self._get_children(key)
+                ((*key, row["name"]), None if row["tail"] else row["value"])
+                for row in self._get_children(key)
             )
         else:
             yield from ((*key, row["name"]) for row in self._get_children(key))
 
-    def traverse(self, node_factory: NodeFactory, prefix: Optional[TrieKey] = None):
+    def traverse(
+        self,
+        node_factory: NodeFactory,
+        prefix: Optional[TrieKey] = None,
+        prefetch: bool = True,
+    ):
+        # NOTE: prefetch=False queries children of each node only when they
+        # are consumed, which is cheaper for factories that only look at a
+        # small part of a large subtree.
         key = prefix or ()
-        node = _SQLiteTrieNode.from_step(self._get_node(key))
-        return node.traverse(self._conn, node_factory, key)
+        rest = _rest(self._get_node(key))
+        node = _SQLiteTrieNode.from_step(self._get_node((*key, *rest)))
+        return _build_chain(
+            node_factory,
+            key,
+            rest,
+            partial(
+                node.traverse,
+                self._conn,
+                node_factory,
+                prefetch=prefetch,
+                schema=self._schema,
+            ),
+        )
+
+    def _compute_hashes(self, nid):
+        rows = self._conn.execute(HASH_UPDATE_SQL[self._schema], {"root": nid})
+
+        hashes = {}
+        stack: list[tuple[int, int, str, Any]] = []
+
+        def _finalize():
+            _, fid, fname, hasher = stack.pop()
+            digest = hasher.digest()
+            hashes[fid] = digest
+            if stack:
+                stack[-1][3].update(_hash_child(fname, digest))
+
+        # NOTE: rows come in depth-first order with siblings sorted by name,
+        # so children get fed into their parent's hasher in the same order
+        # no matter which of them needed to be recomputed.
+        while chunk := rows.fetchmany(ITEMS_CHUNK_SIZE):
+            for rid, name, depth, digest, has_value, value, tail in chunk:
+                # NOTE: in radix layout, the whole chain is hashed as a name
+                name += tail
+                while stack and stack[-1][0] >= depth:
+                    _finalize()
+                if digest is None:
+                    stack.append((depth, rid, name, _hash_value(has_value, value)))
+                else:
+                    stack[-1][3].update(_hash_child(name, digest))
+        while stack:
+            _finalize()
+
+        return hashes
+
+    def _refresh_hashes(self, *nids):
+        # NOTE: hashes are stored in a savepoint of their own, which commits
+        # them right away, unless the caller has a transaction pending, in
+        # which case they become a part of it. Not waiting for other writers,
+        # if the database is locked, the hashes are only used for this diff.
+        hashes = {}
+        for nid in nids:
+            hashes.update(self._compute_hashes(nid))
+        if not hashes:
+            return hashes
+
+        conn = self._conn
+        (timeout,) = conn.execute("PRAGMA busy_timeout").fetchone()
+        conn.execute("PRAGMA busy_timeout = 0")
+        conn.execute("SAVEPOINT sqltrie_hashes")
+        try:
+            conn.executemany(
+                "UPDATE nodes SET hash = ? WHERE id == ?",
+                ((digest, nid) for nid, digest in hashes.items()),
+            )
+        except sqlite3.OperationalError:
+            conn.execute("ROLLBACK TO sqltrie_hashes")
+            return hashes
+        finally:
+            conn.execute("RELEASE sqltrie_hashes")
+            conn.execute(f"PRAGMA busy_timeout = {int(timeout)}")
+        return {}
 
     def diff(self, old, new, with_unchanged=False):
-        old_id = self._get_node(old)["id"]
-        new_id = self._get_node(new)["id"]
-
-        self._conn.executescript(
-            DIFF_SQL.format(
-                old_root=old_id,
-                new_root=new_id,
-                with_unchanged=int(with_unchanged),
+        # NOTE: walking both subtrees side by side in (pid, name) index order
+        # and merge-joining children at each level, so changes are streamed
+        # right away without materializing either of the subtrees.
+        old_node = self._get_node(old)
+        new_node = self._get_node(new)
+        if _rest(old_node) or _rest(new_node):
+            with self._reader() as conn:
+                yield from diff_items(
+                    _iterate_subtree(
+                        conn, old_node["id"], _rest(old_node), schema=self._schema
+                    ),
+                    _iterate_subtree(
+                        conn, new_node["id"], _rest(new_node), schema=self._schema
+                    ),
+                    with_unchanged,
+                )
+            return
+
+        old_id = old_node["id"]
+        new_id = new_node["id"]
+        stale = {}
+        if self._hashes and old_id != new_id:
+            # NOTE: only descending into subtrees whose hashes differ, which
+            # makes the cost proportional to the size of the change. Stale
+            # hashes are recomputed and written to the database, see
+            # _refresh_hashes.
+            stale = self._refresh_hashes(old_id, new_id)
+
+        if self._parallel() and old_id != new_id:
+            # NOTE: workers only see the hashes that were stored
+            yield from self._diff_parallel(old_id, new_id, with_unchanged)
+            return
+
+        ctx = {"hashes": self._hashes, "schema": self._schema}
+        with self._reader() as conn:
+            yield from _diff_nodes(
+                conn,
+                _get_diff_rows(conn, DIFF_NODE_SQL, old_id, **ctx).fetchone(),
+                _get_diff_rows(conn, DIFF_NODE_SQL, new_id, **ctx).fetchone(),
+                (),
+                with_unchanged,
+                stale=stale,
+                **ctx,
             )
-        )
 
-        rows = self._conn.execute(f"SELECT * FROM {DIFF_TABLE}")  # nosec  # noqa: S608
-        yield from (
-            Change(
-                row["type"],
-                TrieNode(
-                    tuple(row["old_path"].split("/")),
-                    row["old_value"],
-                ),
-                TrieNode(
-                    tuple(row["new_path"].split("/")),
-                    row["new_value"],
-                ),
+    def _diff_parallel(self, old_id, new_id, with_unchanged):
+        conn = self._conn
+        ctx = {"hashes": self._hashes, "schema": self._schema}
+        old_children = _get_diff_rows(conn, DIFF_CHILDREN_SQL, old_id, **ctx)
+        new_children = _get_diff_rows(conn, DIFF_CHILDREN_SQL, new_id, **ctx)
+        pairs = [
+            (
+                old_child["id"] if old_child else None,
+                new_child["id"] if new_child else None,
+                (old_child or new_child)["name"],
             )
-            for row in rows
+            for old_child, new_child in _merge_children(old_children, new_children)
+        ]
+        counts = dict(
+            conn.execute(
+                "SELECT id, count FROM nodes WHERE pid IN (?, ?)", (old_id, new_id)
+            ).fetchall()
+        )
+        yield from self._map(
+            partial(_diff_task, self._hashes, self._dedup, with_unchanged),
+            pairs,
+            [
+                counts.get(old_child, 0) + counts.get(new_child, 0) + 1
+                for old_child, new_child, _ in pairs
+            ],
         )
+
+
+def _stream_worker(func, uri, queue, tasks):
+    # NOTE: results are sent back in batches through a bounded queue, which
+    # blocks the worker until the consumer catches up. None marks the end.
+    conn = connect_readonly(uri)
+    try:
+        for batch in _chunks(func(conn, tasks), PARALLEL_BATCH_SIZE):
+            queue.put(batch)
+    finally:
+        conn.close()
+    queue.put(None)
+
+
+def _items_task(shallow, dedup, conn, tasks):
+    for nid, key in tasks:
+        node = _SQLiteTrieNode(nid, None, "", False, None)
+        yield from node.iterate(conn, key, shallow=shallow, schema=(dedup, False))
+
+
+def _diff_task(hashes, dedup, with_unchanged, conn, tasks):
+    ctx = {"hashes": hashes, "schema": (dedup, False)}
+    for old_id, new_id, name in tasks:
+        old = new = None
+        if old_id is not None:
+            old = _get_diff_rows(conn, DIFF_NODE_SQL, old_id, **ctx).fetchone()
+        if new_id is not None:
+            new = _get_diff_rows(conn, DIFF_NODE_SQL, new_id, **ctx).fetchone()
+
+        if new is None:
+            yield from _iterate_changes(conn, DELETE, old, (name,), **ctx)
+        elif old is None:
+            yield from _iterate_changes(conn, ADD, new, (name,), **ctx)
+        else:
+            yield from _diff_nodes(conn, old, new, (name,), with_unchanged, **ctx)
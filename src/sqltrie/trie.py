@@ -1,5 +1,6 @@
 from abc import abstractmethod
-from collections.abc import Iterator, MutableMapping
+from collections.abc import Iterable, Iterator, Mapping, MutableMapping
+from operator import itemgetter
 from typing import (
     Any,
     Callable,
@@ -20,6 +21,10 @@ class ShortKeyError(KeyError):
 
 TrieKey = Union[tuple[()], tuple[str, ...]]
 TrieStep = tuple[Optional[TrieKey], Optional[bytes]]
+TrieItems = Union[
+    Mapping[TrieKey, Optional[bytes]],
+    Iterable[tuple[TrieKey, Optional[bytes]]],
+]
 
 
 class TrieNode(NamedTuple):
@@ -72,6 +77,77 @@ class Change:
         return self.typ != UNCHANGED
 
 
+def merge_join(
+    old: Iterator[_T], new: Iterator[_T], key: Callable[[_T], Any]
+) -> Iterator[tuple[Optional[_T], Optional[_T]]]:
+    # NOTE: both sides have to be sorted by key
+    old_entry = next(old, None)
+    new_entry = next(new, None)
+    while old_entry is not None or new_entry is not None:
+        if new_entry is None or (
+            old_entry is not None and key(old_entry) < key(new_entry)
+        ):
+            yield old_entry, None
+            old_entry = next(old, None)
+        elif old_entry is None or key(new_entry) < key(old_entry):
+            yield None, new_entry
+            new_entry = next(new, None)
+        else:
+            yield old_entry, new_entry
+            old_entry = next(old, None)
+            new_entry = next(new, None)
+
+
+def diff_entries(
+    old: Optional[TrieNode], new: Optional[TrieNode], with_unchanged: bool
+) -> Optional[Change]:
+    if old is None:
+        return Change(ADD, None, new)
+    if new is None:
+        return Change(DELETE, old, None)
+    if old.value != new.value:
+        return Change(MODIFY, old, new)
+    if with_unchanged:
+        return Change(UNCHANGED, old, new)
+    return None
+
+
+def diff_items(
+    old: Iterator[tuple[TrieKey, Optional[bytes]]],
+    new: Iterator[tuple[TrieKey, Optional[bytes]]],
+    with_unchanged: bool = False,
+) -> Iterator[Change]:
+    # NOTE: both sides have to be in key order, keys are relative to the
+    # roots of the subtrees that are compared.
+    for old_item, new_item in merge_join(old, new, itemgetter(0)):
+        old_entry = TrieNode(*old_item) if old_item is not None else None
+        new_entry = TrieNode(*new_item) if new_item is not None else None
+        entry = old_entry or new_entry
+        if entry is None or not entry.key:
+            # NOTE: values of the roots themselves are not compared
+            continue
+        change = diff_entries(old_entry, new_entry, with_unchanged)
+        if change is not None:
+            yield change
+
+
+# (name, has_value, value, children)
+Subtree = tuple[str, bool, Optional[bytes], list[Any]]
+
+
+def build_subtree(node_factory: NodeFactory, key: TrieKey, node: Subtree):
+    _, has_value, value, children = node
+
+    def _children():
+        for child in children:
+            yield build_subtree(node_factory, (*key, child[0]), child)
+
+    args: list[Any] = [tuple, key, _children()]
+    if has_value:
+        args.append(value)
+    return node_factory(*args)
+
+
 class AbstractTrie(MutableMapping):
     def __init__(self, *args, **kwargs):
         self.update(*args, **kwargs)
@@ -81,6 +157,36 @@ class AbstractTrie(MutableMapping):
     def open(cls, path: str) -> "AbstractTrie":
         pass
 
+    @classmethod
+    def from_items(cls, items: TrieItems) -> "AbstractTrie":
+        trie = cls()
+        trie.update_many(items)
+        return trie
+
+    def update_many(self, items: TrieItems) -> None:
+        # NOTE: backends are expected to override this with something
+        # smarter than setting items one by one.
+        if isinstance(items, Mapping):
+            items = items.items()
+
+        for key, value in items:
+            self[key] = value
+
+    def get_many(
+        self, keys: Iterable[TrieKey], default: Any = None
+    ) -> list[Optional[bytes]]:
+        # NOTE: backends are expected to override these batched lookups with
+        # something smarter than looking keys up one by one. Results are in
+        # the same order as keys, with default for keys that don't have a
+        # value.
+        return [self.get(key, default) for key in keys]
+
+    def has_nodes(self, keys: Iterable[TrieKey]) -> list[bool]:
+        return [self.has_node(key) for key in keys]
+
+    def longest_prefix_many(self, keys: Iterable[TrieKey]) -> list[Optional[TrieStep]]:
+        return [self.longest_prefix(key) for key in keys]
+
     @abstractmethod
     def close(self) -> None:
         pass
@@ -93,6 +199,11 @@ class AbstractTrie(MutableMapping):
     def rollback(self) -> None:
         pass
 
+    @property
+    def in_transaction(self) -> bool:
+        # NOTE: whether the current thread has uncommitted changes
+        return False
+
     @abstractmethod
     def items(  # type: ignore[override]
         self, prefix: Optional[TrieKey] = None, shallow: Optional[bool] = False
@@ -112,6 +223,13 @@ class AbstractTrie(MutableMapping):
         # NOTE: this will leave orphans down the tree
         pass
 
+    def delete_subtree(self, key: TrieKey) -> None:
+        # NOTE: unlike delete_node, this deletes all of the descendants too.
+        # Backends are expected to override this with something smarter than
+        # deleting values one by one, which also leaves the nodes behind.
+        for ikey in [ikey for ikey, _ in self.items(prefix=key)]:
+            del self[ikey]
+
     @abstractmethod
     def prefixes(self, key: TrieKey) -> Iterator[TrieStep]:
         pass
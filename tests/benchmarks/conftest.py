@@ -0,0 +1,48 @@
+import tracemalloc
+
+import pytest
+
+from .datasets import DATASETS
+
+
+def pytest_generate_tests(metafunc):
+    if "dataset" in metafunc.fixturenames:
+        shapes = metafunc.config.getoption("dataset") or list(DATASETS)
+        metafunc.parametrize("dataset", shapes, indirect=True, scope="session")
+
+
+@pytest.fixture(scope="session")
+def dataset(request):
+    size = request.config.getoption("dataset_size")
+    return DATASETS[request.param](size)
+
+
+@pytest.fixture
+def bench(benchmark, request):
+    # NOTE: peak memory is measured in a separate run, so that tracing doesn't
+    # slow down the timed ones. tracemalloc only sees python allocations, not
+    # the ones made by sqlite itself. Everything ends up in extra_info, which
+    # is saved along with the timings by --benchmark-json/--benchmark-autosave.
+    if "dataset" in request.fixturenames:
+        benchmark.extra_info["dataset"] = request.node.callspec.params["dataset"]
+        benchmark.extra_info["dataset_size"] = request.config.getoption("dataset_size")
+
+    def _bench(func, *args, setup=None, **extra_info):
+        benchmark.extra_info.update(extra_info)
+        if setup is None:
+            ret = benchmark(func, *args)
+            fresh_args = args
+        else:
+            ret = benchmark.pedantic(func, setup=setup, rounds=5)
+            fresh_args, _ = setup()
+
+        tracemalloc.start()
+        try:
+            func(*fresh_args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_memory"] = peak
+        return ret
+
+    return _bench
@@ -0,0 +1,80 @@
+"""Mockup datasets of different shapes for benchmarks.
+
+Each generator takes the (approximate) number of files and returns a dict of
+their keys and values, directories are only created implicitly.
+"""
+
+import hashlib
+import math
+import random
+
+DEEP_CHAIN_LENGTH = 12
+DEEP_FILES_PER_PACKAGE = 5
+
+
+def _value(idx):
+    # NOTE: about the size of the hash info that dvc stores for each file
+    return hashlib.blake2b(str(idx).encode(), digest_size=16).hexdigest().encode()
+
+
+def mnist(size):
+    # NOTE: emulating mnist dataset from dvc-bench, i.e. train and test splits
+    # with 10 classes each and 11 test files for every 60 train files.
+    ret = {}
+    for dataset, share in (("train", 60), ("test", 11)):
+        nfiles = max(1, size * share // 71 // 10)
+        for class_idx in range(10):
+            for file_idx in range(nfiles):
+                key = (dataset, str(class_idx), f"{file_idx}.png")
+                ret[key] = _value(len(ret))
+    return ret
+
+
+def flat(size):
+    # NOTE: a single huge directory
+    return {("data", f"{idx}.bin"): _value(idx) for idx in range(size)}
+
+
+def wide(size):
+    # NOTE: lots of small directories next to each other
+    ndirs = max(1, math.isqrt(size))
+    return {
+        (f"dir{idx % ndirs}", f"{idx // ndirs}.bin"): _value(idx) for idx in range(size)
+    }
+
+
+def deep(size):
+    # NOTE: files deep down long chains of directories without any siblings,
+    # e.g. checked out java packages or nested build outputs
+    chain = tuple(f"level{idx}" for idx in range(DEEP_CHAIN_LENGTH))
+    return {
+        ("src", f"pkg{idx // DEEP_FILES_PER_PACKAGE}", *chain, f"{idx}.java"): _value(
+            idx
+        )
+        for idx in range(size)
+    }
+
+
+def skewed(size):
+    # NOTE: directory sizes follow a power law (the biggest one has more than a
+    # half of all of the files) and they are scattered at random depths.
+    rng = random.Random(0)
+    ret = {}
+    rank = 1
+    while len(ret) < size:
+        nfiles = min(size - len(ret), max(1, round(0.6 * size / rank**2)))
+        depth = rng.randint(0, 8)
+        prefix = ("data", *(f"level{level}" for level in range(depth)), f"dir{rank}")
+        for idx in range(nfiles):
+            ret[(*prefix, f"{idx}.bin")] = _value(len(ret))
+        rank += 1
+    return ret
+
+
+DATASETS = {
+    "mnist": mnist,
+    "flat": flat,
+    "wide": wide,
+    "deep": deep,
+    "skewed": skewed,
+}
@@ -0,0 +1,138 @@
+import os
+from uuid import uuid4
+
+import pytest
+
+from sqltrie import SQLiteTrie
+
+STORAGES = ["memory", "file"]
+# NOTE: number of keys that the lookup benchmarks go through
+LOOKUP_SAMPLE_SIZE = 1000
+
+
+def _path(tmp_path, storage):
+    if storage == "memory":
+        return ":memory:"
+    return os.fspath(tmp_path / f"{uuid4()}.db")
+
+
+def _changed(dataset, ratio):
+    # NOTE: modifying, deleting and adding files in equal proportions
+    new = dict(dataset)
+    keys = list(dataset)
+    nchanges = max(1, round(len(keys) * ratio))
+    for idx, key in enumerate(keys[:: max(1, len(keys) // nchanges)][:nchanges]):
+        if idx % 3 == 0:
+            new[key] = b"modified"
+        elif idx % 3 == 1:
+            del new[key]
+        else:
+            new[(*key[:-1], f"added{idx}")] = b"added"
+    return new
+
+
+@pytest.fixture
+def make_trie(tmp_path, dataset):
+    def _make_trie(storage="file", **kwargs):
+        trie = SQLiteTrie.open(_path(tmp_path, storage), **kwargs)
+        trie.update_many(dataset)
+        trie.commit()
+        return trie
+
+    return _make_trie
+
+
+@pytest.fixture
+def sample(dataset):
+    keys = list(dataset)
+    return keys[:: max(1, len(keys) // LOOKUP_SAMPLE_SIZE)]
+
+
+@pytest.mark.parametrize("storage", STORAGES)
+def test_update_many(bench, tmp_path, dataset, storage):
+    def _setup():
+        return (SQLiteTrie.open(_path(tmp_path, storage)),), {}
+
+    def _update_many(trie):
+        trie.update_many(dataset)
+        trie.commit()
+
+    bench(_update_many, setup=_setup)
+
+
+@pytest.mark.parametrize("storage", STORAGES)
+def test_items(bench, make_trie, storage):
+    trie = make_trie(storage)
+
+    def _items():
+        for _ in trie.items():
+            pass
+
+    bench(_items)
+
+
+@pytest.mark.parametrize("storage", STORAGES)
+def test_getitem(bench, make_trie, sample, storage):
+    trie = make_trie(storage)
+
+    def _getitem():
+        # NOTE: cold lookups, that can't use the cached node ids
+        trie._ids.clear()
+        for key in sample:
+            trie[key]  # pylint: disable=pointless-statement
+
+    bench(_getitem)
+
+
+@pytest.mark.parametrize("storage", STORAGES)
+def test_get_many(bench, make_trie, sample, storage):
+    trie = make_trie(storage)
+
+    def _get_many():
+        trie._ids.clear()
+        trie.get_many(sample)
+
+    bench(_get_many)
+
+
+def test_longest_prefix(bench, make_trie, sample):
+    trie = make_trie()
+    keys = [(*key, "missing") for key in sample]
+
+    def _longest_prefix():
+        for key in keys:
+            trie.longest_prefix(key)
+
+    bench(_longest_prefix)
+
+
+def test_view_items(bench, make_trie, dataset):
+    trie = make_trie()
+    keys = list(dataset)
+    # NOTE: the directory of a file from the middle of the dataset
+    prefix = keys[len(keys) // 2][:-1]
+
+    def _view_items():
+        for _ in trie.view(prefix).items():
+            pass
+
+    bench(_view_items)
+
+
+@pytest.mark.parametrize("hashes", [False, True])
+@pytest.mark.parametrize("ratio", [0.001, 0.01, 0.1])
+def test_diff(bench, tmp_path, dataset, ratio, hashes):
+    trie = SQLiteTrie.open(os.fspath(tmp_path / "db"), hashes=hashes)
+    trie.update_many({("old", *key): value for key, value in dataset.items()})
+    trie.update_many(
+        {("new", *key): value for key, value in _changed(dataset, ratio).items()}
+    )
+    trie.commit()
+    # NOTE: hashes are computed lazily by the first diff and reused afterwards
+    changes = sum(1 for _ in trie.diff(("old",), ("new",)))
+
+    def _diff():
+        for _ in trie.diff(("old",), ("new",)):
+            pass
+
+    bench(_diff, changes=changes)
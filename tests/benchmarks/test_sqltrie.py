@@ -1,14 +1,27 @@
+import os
+import shutil
+from uuid import uuid4
+
 import pytest
 
-from sqltrie import PyGTrie, SQLiteTrie
+from sqltrie import CodecTrie, PyGTrie, SQLiteTrie
+from sqltrie.codecs import (
+    JSONCodec,
+    LZMACodec,
+    MsgpackCodec,
+    PickleCodec,
+    ZlibCodec,
+)
+from sqltrie.snapshot import SnapshotTrie
+from sqltrie.sqlalchemy import SQLAlchemyTrie
 
 
 @pytest.fixture(scope="session")
 def tree():
     ret = {}
 
-    # NOTE: emulating mnist dataset from dvc-bench
-    # TODO: ability to test multiple mockup datasets, maybe even with a CLI flag
+    # NOTE: emulating mnist dataset from dvc-bench. See test_datasets.py for
+    # benchmarks on other shapes and sizes (--dataset, --dataset-size).
 
     ret["train"] = None
     for subdir_idx in range(10):
@@ -29,20 +42,20 @@ def tree():
     return ret
 
 
+@pytest.fixture(scope="session")
+def lookup_keys(tree):
+    return [key for key in tree if isinstance(key, tuple)][::100]
+
+
 @pytest.fixture
 def make_trie(tree):
     def _make_trie(cls):
-        trie = cls()
-
-        for key, value in tree.items():
-            trie[key] = value
-
-        return trie
+        return cls.from_items(tree)
 
     return _make_trie
 
 
-@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie])
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
 def test_set(benchmark, tree, cls):
     trie = cls()
 
@@ -53,7 +66,17 @@ def test_set(benchmark, tree, cls):
     benchmark(_set)
 
 
-@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie])
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
+def test_update_many(benchmark, tree, cls):
+    trie = cls()
+
+    def _update_many():
+        trie.update_many(tree)
+
+    benchmark(_update_many)
+
+
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
 def test_items(benchmark, make_trie, cls):
     trie = make_trie(cls)
 
@@ -63,7 +86,7 @@ def test_items(benchmark, make_trie, cls):
     benchmark(_items)
 
 
-@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie])
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
 def test_len(benchmark, make_trie, cls):
     trie = make_trie(cls)
 
@@ -73,7 +96,7 @@ def test_len(benchmark, make_trie, cls):
     benchmark(_len)
 
 
-@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie])
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
 def test_traverse(benchmark, make_trie, cls):
     trie = make_trie(cls)
 
@@ -86,7 +109,20 @@ def test_traverse(benchmark, make_trie, cls):
     benchmark(traverse)
 
 
-@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie])
+@pytest.mark.parametrize("prefetch", [True, False])
+def test_traverse_prefetch(benchmark, make_trie, prefetch):
+    trie = make_trie(SQLiteTrie)
+
+    def traverse():
+        def node_factory(path_conv, key, children, *args):
+            list(children)
+
+        trie.traverse(node_factory, prefetch=prefetch)
+
+    benchmark(traverse)
+
+
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
 def test_ls(benchmark, make_trie, cls):
     trie = make_trie(cls)
 
@@ -96,7 +132,7 @@ def test_ls(benchmark, make_trie, cls):
     benchmark(_ls)
 
 
-@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie])
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
 def test_diff(benchmark, make_trie, cls):
     trie = make_trie(cls)
 
@@ -104,3 +140,484 @@ def test_diff(benchmark, make_trie, cls):
         list(trie.diff(None, None))
 
     benchmark(_diff)
+
+
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
+def test_getitem(benchmark, make_trie, lookup_keys, cls):
+    trie = make_trie(cls)
+
+    def _getitem():
+        for key in lookup_keys:
+            trie[key]  # pylint: disable=pointless-statement
+
+    benchmark(_getitem)
+
+
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
+def test_has_node(benchmark, make_trie, lookup_keys, cls):
+    trie = make_trie(cls)
+
+    def _has_node():
+        for key in lookup_keys:
+            trie.has_node(key)
+
+    benchmark(_has_node)
+
+
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
+def test_longest_prefix(benchmark, make_trie, lookup_keys, cls):
+    trie = make_trie(cls)
+
+    def _longest_prefix():
+        for key in lookup_keys:
+            trie.longest_prefix((*key, "missing"))
+
+    benchmark(_longest_prefix)
+
+
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
+def test_view(benchmark, make_trie, cls):
+    trie = make_trie(cls)
+
+    def _view():
+        trie.view(("test", "0"))
+
+    benchmark(_view)
+
+
+@pytest.fixture
+def make_sqlite_trie(tmp_path, tree):
+    def _make_sqlite_trie(**kwargs):
+        trie = SQLiteTrie.open(os.fspath(tmp_path / "db"), **kwargs)
+        trie.update_many(tree)
+        trie.commit()
+        return trie
+
+    return _make_sqlite_trie
+
+
+@pytest.mark.parametrize("layout", ["adjacency", "path"])
+def test_layout_getitem(benchmark, make_sqlite_trie, lookup_keys, layout):
+    trie = make_sqlite_trie(layout=layout)
+
+    def _getitem():
+        for key in lookup_keys:
+            trie[key]  # pylint: disable=pointless-statement
+
+    benchmark(_getitem)
+
+
+@pytest.mark.parametrize("value_cache_size", [0, 2**24])
+def test_value_cache_getitem(
+    benchmark, make_sqlite_trie, lookup_keys, value_cache_size
+):
+    trie = make_sqlite_trie(value_cache_size=value_cache_size)
+
+    def _getitem():
+        for key in lookup_keys:
+            trie[key]  # pylint: disable=pointless-statement
+
+    benchmark(_getitem)
+
+
+@pytest.mark.parametrize("layout", ["adjacency", "path"])
+def test_layout_items_prefix(benchmark, make_sqlite_trie, layout):
+    trie = make_sqlite_trie(layout=layout)
+
+    def _items():
+        list(trie.items(("train", "5")))
+
+    benchmark(_items)
+
+
+@pytest.fixture(scope="session")
+def deep_tree():
+    # NOTE: files deep down long chains of directories without any siblings,
+    # e.g. checked out java packages or nested build outputs
+    chain = tuple(f"level{idx}" for idx in range(12))
+    return {
+        ("src", str(pkg_idx), *chain, str(file_idx)): bytes(file_idx)
+        for pkg_idx in range(1000)
+        for file_idx in range(5)
+    }
+
+
+@pytest.mark.parametrize("layout", ["adjacency", "path", "radix"])
+def test_layout_deep_getitem(benchmark, tmp_path, deep_tree, layout):
+    trie = SQLiteTrie.open(os.fspath(tmp_path / "db"), layout=layout)
+    trie.update_many(deep_tree)
+    trie.commit()
+    keys = list(deep_tree)[::10]
+
+    def _getitem():
+        trie._ids.clear()
+        for key in keys:
+            trie[key]  # pylint: disable=pointless-statement
+
+    benchmark(_getitem)
+    benchmark.extra_info["nodes"] = trie._conn.execute(
+        "SELECT COUNT(*) FROM nodes"
+    ).fetchone()[0]
+    # NOTE: number of nodes that a lookup has to go through
+    benchmark.extra_info["depth"] = sum(len(trie._traverse(key)) for key in keys) / len(
+        keys
+    )
+
+
+@pytest.mark.parametrize("layout", ["adjacency", "radix"])
+def test_layout_deep_items(benchmark, tmp_path, deep_tree, layout):
+    trie = SQLiteTrie.open(os.fspath(tmp_path / "db"), layout=layout)
+    trie.update_many(deep_tree)
+    trie.commit()
+
+    def _items():
+        list(trie.items())
+
+    benchmark(_items)
+
+
+@pytest.mark.parametrize("dedup", [False, True])
+def test_dedup_update_many(benchmark, tmp_path, tree, dedup):
+    # NOTE: values in the tree are repeated across directories a lot
+    def _update_many():
+        path = os.fspath(tmp_path / f"{uuid4()}.db")
+        trie = SQLiteTrie.open(path, dedup=dedup)
+        trie.update_many(tree)
+        trie.commit()
+        trie.close()
+        return path
+
+    path = benchmark(_update_many)
+    benchmark.extra_info["size"] = os.path.getsize(path)
+
+
+@pytest.mark.parametrize("dedup", [False, True])
+def test_dedup_diff(benchmark, make_sqlite_trie, dedup):
+    trie = make_sqlite_trie(dedup=dedup)
+    trie.update_many({("copy", *key): value for key, value in trie.items(("train",))})
+
+    def _diff():
+        for _ in trie.diff(("train",), ("copy", "train")):
+            pass
+
+    benchmark(_diff)
+
+
+@pytest.fixture
+def make_read_trie(tmp_path, make_sqlite_trie):
+    def _make_read_trie(cls):
+        trie = make_sqlite_trie()
+        if cls is SQLiteTrie:
+            return trie
+        path = os.fspath(tmp_path / "snapshot")
+        SnapshotTrie.write(path, trie)
+        return SnapshotTrie.open(path)
+
+    return _make_read_trie
+
+
+@pytest.mark.parametrize("cls", [SQLiteTrie, SnapshotTrie])
+def test_snapshot_getitem(benchmark, make_read_trie, lookup_keys, cls):
+    trie = make_read_trie(cls)
+
+    def _getitem():
+        for key in lookup_keys:
+            trie[key]  # pylint: disable=pointless-statement
+
+    benchmark(_getitem)
+
+
+@pytest.mark.parametrize("cls", [SQLiteTrie, SnapshotTrie])
+def test_snapshot_items_prefix(benchmark, make_read_trie, cls):
+    trie = make_read_trie(cls)
+
+    def _items():
+        list(trie.items(("train", "5")))
+
+    benchmark(_items)
+
+
+@pytest.mark.parametrize("cls", [SQLiteTrie, SnapshotTrie])
+def test_snapshot_longest_prefix(benchmark, make_read_trie, lookup_keys, cls):
+    trie = make_read_trie(cls)
+
+    def _longest_prefix():
+        for key in lookup_keys:
+            trie.longest_prefix((*key, "missing"))
+
+    benchmark(_longest_prefix)
+
+
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
+def test_diff_changes(benchmark, tree, cls):
+    items = [(key, value) for key, value in tree.items() if isinstance(key, tuple)]
+    trie = cls()
+    for root in ("old", "new"):
+        trie.update_many({(root, *key): value for key, value in items})
+    for key, _ in items[::100]:
+        trie[("new", *key)] = b"changed"
+
+    def _diff():
+        assert len(list(trie.diff(("old",), ("new",)))) == len(items[::100])
+
+    benchmark(_diff)
+
+
+@pytest.mark.parametrize("hashes", [False, True])
+def test_diff_small_change(benchmark, tmp_path, tree, hashes):
+    trie = SQLiteTrie.open(os.fspath(tmp_path / "db"), hashes=hashes)
+    for root in ("old", "new"):
+        trie.update_many(
+            {
+                (root, *key): value
+                for key, value in tree.items()
+                if isinstance(key, tuple)
+            }
+        )
+    trie.commit()
+    list(trie.diff(("old",), ("new",)))
+
+    changed = ("new", "test", "5", "42")
+    values = iter(range(1_000_000))
+
+    def _diff():
+        trie[changed] = str(next(values)).encode()
+        assert len(list(trie.diff(("old",), ("new",)))) == 1
+
+    benchmark(_diff)
+
+
+@pytest.fixture(scope="session")
+def big_trie_path(tmp_path_factory):
+    # NOTE: same shape as the tree fixture, but with 10x as many files and
+    # short values, so that it is dominated by the row handling.
+    path = os.fspath(tmp_path_factory.mktemp("big") / "db")
+    trie = SQLiteTrie.open(path)
+    for dataset, nfiles in (("train", 11000), ("test", 60000)):
+        for subdir_idx in range(10):
+            trie.update_many(
+                {
+                    (dataset, str(subdir_idx), str(file_idx)): str(file_idx).encode()
+                    for file_idx in range(nfiles)
+                }
+            )
+    trie.commit()
+    trie.close()
+    return path
+
+
+@pytest.mark.parametrize(
+    "size, batched",
+    [
+        (1, False),
+        (1, True),
+        (100, False),
+        (100, True),
+        (10_000, False),
+        (10_000, True),
+        # NOTE: looking keys up one by one takes minutes at this size
+        (1_000_000, True),
+    ],
+)
+def test_get_many(benchmark, big_trie_path, size, batched):
+    trie = SQLiteTrie.open(big_trie_path)
+    # NOTE: spread over all of the subdirs, about a third of them are missing
+    keys = [("test", str(idx % 10), str(idx // 10)) for idx in range(size)]
+
+    def _get_many():
+        trie._ids.clear()
+        if batched:
+            trie.get_many(keys)
+        else:
+            [trie.get(key) for key in keys]  # pylint: disable=expression-not-assigned
+
+    benchmark(_get_many)
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_has_nodes(benchmark, make_trie, lookup_keys, batched):
+    trie = make_trie(SQLiteTrie)
+
+    def _has_nodes():
+        trie._ids.clear()
+        if batched:
+            trie.has_nodes(lookup_keys)
+        else:
+            [trie.has_node(key) for key in lookup_keys]  # pylint: disable=expression-not-assigned
+
+    benchmark(_has_nodes)
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_longest_prefix_many(benchmark, make_trie, lookup_keys, batched):
+    trie = make_trie(SQLiteTrie)
+    keys = [(*key, "missing") for key in lookup_keys]
+
+    def _longest_prefix_many():
+        if batched:
+            trie.longest_prefix_many(keys)
+        else:
+            [trie.longest_prefix(key) for key in keys]  # pylint: disable=expression-not-assigned
+
+    benchmark(_longest_prefix_many)
+
+
+@pytest.mark.parametrize("workers", [0, 4])
+def test_parallel_items(benchmark, big_trie_path, workers):
+    trie = SQLiteTrie.open(big_trie_path, workers=workers)
+
+    def _items():
+        for _ in trie.items():
+            pass
+
+    benchmark(_items)
+
+
+@pytest.mark.parametrize("workers", [0, 4])
+def test_parallel_diff(benchmark, big_trie_path, workers):
+    trie = SQLiteTrie.open(big_trie_path, workers=workers)
+
+    def _diff():
+        for _ in trie.diff(("train",), ("test",)):
+            pass
+
+    benchmark(_diff)
+
+
+@pytest.fixture
+def copy_big_trie(tmp_path, big_trie_path):
+    def _copy(**kwargs):
+        path = os.fspath(tmp_path / f"{uuid4()}.db")
+        shutil.copyfile(big_trie_path, path)
+        return SQLiteTrie.open(path, **kwargs)
+
+    return _copy
+
+
+@pytest.mark.parametrize("method", ["delete_subtree", "clear"])
+def test_delete_subtree(benchmark, copy_big_trie, method):
+    # NOTE: clearing a view and deleting its root is how the same thing was
+    # done before delete_subtree.
+    def _setup():
+        return (copy_big_trie(),), {}
+
+    def _delete(trie):
+        if method == "delete_subtree":
+            trie.delete_subtree(("test",))
+        else:
+            trie.view(("test",)).clear()
+            trie.delete_node(("test",))
+        trie.commit()
+
+    benchmark.pedantic(_delete, setup=_setup, rounds=3)
+
+
+def test_gc(benchmark, copy_big_trie):
+    # NOTE: ~600k orphans and ~110k empty nodes
+    def _setup():
+        trie = copy_big_trie()
+        trie.delete_node(("test",))
+        trie.view(("train",)).clear()
+        trie.commit()
+        return (trie,), {}
+
+    def _gc(trie):
+        trie.gc()
+        trie.commit()
+
+    benchmark.pedantic(_gc, setup=_setup, rounds=3)
+
+
+@pytest.mark.parametrize("prune", [False, True])
+def test_delitem_prune(benchmark, copy_big_trie, prune):
+    keys = [("train", str(idx % 10), str(idx // 10)) for idx in range(10_000)]
+
+    def _setup():
+        return (copy_big_trie(prune=prune),), {}
+
+    def _delitem(trie):
+        for key in keys:
+            del trie[key]
+        trie.commit()
+
+    benchmark.pedantic(_delitem, setup=_setup, rounds=3)
+
+
+@pytest.fixture(scope="session")
+def meta_items(tree):
+    # NOTE: similar to the file metadata that dvc stores in its index
+    return [
+        (
+            key,
+            {
+                "md5": f"{idx:032x}",
+                "size": len(value),
+                "isexec": False,
+                "cloud": {"remote": {"etag": f"{idx:032x}", "version_id": None}},
+            },
+        )
+        for idx, (key, value) in enumerate(tree.items())
+        if isinstance(key, tuple) and value is not None
+    ]
+
+
+CODECS = {
+    "json": lambda _: JSONCodec(),
+    "pickle": lambda _: PickleCodec(),
+    "msgpack": lambda _: MsgpackCodec(),
+    "msgpack-zlib": lambda _: ZlibCodec(MsgpackCodec()),
+    "msgpack-lzma": lambda _: LZMACodec(MsgpackCodec()),
+    "msgpack-zdict": lambda samples: ZlibCodec.train(MsgpackCodec(), samples),
+}
+
+
+class _CodecTrie(CodecTrie):
+    _trie = None
+
+    def __init__(self, *args, **kwargs):
+        self._trie = SQLiteTrie()
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def open(cls, path):
+        raise NotImplementedError
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_codec_update_many(benchmark, meta_items, codec):
+    codec = CODECS[codec]([value for _, value in meta_items[::1000]])
+
+    def _update_many():
+        trie = _CodecTrie(codec=codec)
+        trie.update_many(meta_items)
+        return trie
+
+    trie = benchmark(_update_many)
+    benchmark.extra_info["size"] = sum(len(raw) for _, raw in trie._trie.items())
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_codec_items(benchmark, meta_items, codec):
+    trie = _CodecTrie(codec=CODECS[codec]([value for _, value in meta_items[::1000]]))
+    trie.update_many(meta_items)
+
+    def _items():
+        list(trie.items())
+
+    benchmark(_items)
+
+
+@pytest.mark.parametrize("mode", ["raw", "eager", "lazy"])
+def test_serialized_keys_scan(benchmark, meta_items, mode):
+    trie = _CodecTrie(codec=JSONCodec())
+    trie.update_many(meta_items)
+
+    def _scan():
+        if mode == "raw":
+            entries = trie._trie.items()
+        else:
+            entries = trie.items(lazy=mode == "lazy")
+        for _key, _value in entries:
+            pass
+
+    benchmark(_scan)
@@ -0,0 +1,22 @@
+from .benchmarks.datasets import DATASETS
+
+DEFAULT_DATASET_SIZE = 10_000
+
+
+def pytest_addoption(parser):
+    # NOTE: options of the benchmarks, see benchmarks/conftest.py. They are
+    # here, because options of nested conftests are only registered when
+    # pytest is pointed at their directory explicitly.
+    group = parser.getgroup("sqltrie benchmarks")
+    group.addoption(
+        "--dataset",
+        action="append",
+        choices=sorted(DATASETS),
+        help="shape of the mockup dataset to run benchmarks on (all by default)",
+    )
+    group.addoption(
+        "--dataset-size",
+        type=int,
+        default=DEFAULT_DATASET_SIZE,
+        help="number of files in the mockup datasets",
+    )
@@ -1,13 +1,49 @@
 """Tests for `sqltrie` package."""
 
+import asyncio
+import importlib.util
+import inspect
 import os
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import pytest
+from sqlalchemy.dialects import mysql, postgresql
+from sqlalchemy.exc import StatementError
 
-from sqltrie import UNCHANGED, Change, PyGTrie, ShortKeyError, SQLiteTrie, TrieNode
+from sqltrie import (
+    ADD,
+    DELETE,
+    MODIFY,
+    UNCHANGED,
+    AbstractTrie,
+    AsyncSQLiteTrie,
+    Change,
+    CodecTrie,
+    JSONTrie,
+    LazyValue,
+    PyGTrie,
+    ShortKeyError,
+    SQLiteTrie,
+    TrieNode,
+)
+from sqltrie.cache import PrefixLRUCache
+from sqltrie.codecs import (
+    JSONCodec,
+    LZMACodec,
+    MsgpackCodec,
+    PickleCodec,
+    ZlibCodec,
+    json_dumps,
+    json_loads,
+)
+from sqltrie.snapshot import SnapshotTrie
+from sqltrie.sqlalchemy import SQLAlchemyTrie, _children_stmt, _items_stmt
 
 
-@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie])
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
 def test_trie(cls):
     trie = cls()
 
@@ -82,7 +118,7 @@ def test_trie(cls):
     ]
 
 
-@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie])
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
 def test_set_get(cls):
     trie = cls()
 
@@ -103,7 +139,7 @@ def test_set_get(cls):
     assert trie[("foo'bar",)] == b"2"
 
 
-@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie])
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
 def test_set_get_root(cls):
     trie = cls()
 
@@ -114,7 +150,7 @@ def test_set_get_root(cls):
         trie[()]  # pylint: disable=pointless-statement
 
 
-@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie])
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
 def test_has_node(cls):
     trie = cls()
 
@@ -128,6 +164,157 @@ def test_has_node(cls):
     assert not trie.has_node(("foo", "bar", "qux", "xyz"))
 
 
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
+def test_delete_subtree(cls):
+    trie = cls()
+    trie.update_many(
+        {
+            ("foo",): b"foo-value",
+            ("foo", "bar", "baz"): b"baz-value",
+            ("foo", "bar", "qux", "quux"): b"quux-value",
+            ("foo", "x"): b"x-value",
+        }
+    )
+
+    trie.delete_subtree(("foo", "bar"))
+    assert not trie.has_node(("foo", "bar"))
+    assert not trie.has_node(("foo", "bar", "qux"))
+    assert sorted(trie.items()) == [
+        (("foo",), b"foo-value"),
+        (("foo", "x"), b"x-value"),
+    ]
+    assert len(trie) == 2
+    with pytest.raises(KeyError):
+        trie.delete_subtree(("foo", "bar"))
+
+    trie[("foo", "bar", "baz")] = b"new-value"
+    assert trie[("foo", "bar", "baz")] == b"new-value"
+
+    view = trie.view(("foo",))
+    view.delete_subtree(("x",))
+    assert sorted(trie.items()) == [
+        (("foo",), b"foo-value"),
+        (("foo", "bar", "baz"), b"new-value"),
+    ]
+
+    trie.delete_subtree(())
+    assert list(trie.items()) == []
+    assert len(trie) == 0
+
+
+def test_delete_subtree_default():
+    # NOTE: AbstractTrie.delete_subtree deletes values one by one, for tries
+    # that don't implement it themselves.
+    trie = PyGTrie()
+    trie.update_many(
+        {
+            ("foo",): b"foo-value",
+            ("foo", "bar", "baz"): b"baz-value",
+            ("foo", "bar", "qux"): b"qux-value",
+        }
+    )
+    AbstractTrie.delete_subtree(trie, ("foo", "bar"))
+    assert list(trie.items()) == [(("foo",), b"foo-value")]
+    with pytest.raises(KeyError):
+        AbstractTrie.delete_subtree(trie, ("missing",))
+
+
+@pytest.mark.parametrize("layout", ["adjacency", "path", "radix"])
+@pytest.mark.parametrize("dedup", [False, True])
+def test_gc(tmp_path, layout, dedup):
+    trie = SQLiteTrie.open(os.fspath(tmp_path / "db"), layout, dedup=dedup)
+
+    def nodes():
+        return trie._conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+
+    items = {
+        ("a", "b", "c", str(idx), "file"): str(idx % 3).encode() for idx in range(10)
+    }
+    items[("a", "x")] = b"x-value"
+    trie.update_many(items)
+    trie.commit()
+    assert trie.gc() == 0
+
+    # NOTE: delete_node leaves orphans (that still hold their values) behind
+    # in every layout but path.
+    trie.delete_node(("a", "b", "c", "0"))
+    del trie[("a", "b", "c", "1", "file")]
+    del trie[("a", "b", "c", "2", "file")]
+    trie[("a", "b", "c", "2", "other")] = b"other-value"
+    assert len(trie) == 9
+    before = nodes()
+    collected = trie.gc()
+    assert collected > 0
+    assert nodes() == before - collected
+    assert trie.gc() == 0
+    assert not trie.has_node(("a", "b", "c", "1"))
+    assert trie.has_node(("a", "b", "c", "2"))
+    assert len(trie) == 9
+    assert sorted(trie.items()) == sorted(
+        (key, value)
+        for key, value in {
+            **items,
+            ("a", "b", "c", "2", "other"): b"other-value",
+        }.items()
+        if key[3:4] not in (("0",), ("1",), ("2",)) or key[4:] == ("other",)
+    )
+    if dedup:
+        refs = trie._conn.execute("SELECT SUM(refs) FROM blobs").fetchone()[0]
+        assert refs == 9
+
+    # NOTE: a view keeps its root, even if it is empty
+    view = trie.view(("a", "b", "c", "3"))
+    view.clear()
+    view.gc()
+    assert trie.has_node(("a", "b", "c", "3"))
+    # NOTE: and so does the trie, as long as the view is alive
+    trie.gc()
+    assert trie.has_node(("a", "b", "c", "3"))
+    view[("file",)] = b"new-value"
+    assert trie[("a", "b", "c", "3", "file")] == b"new-value"
+    view.clear()
+
+    del view
+    assert trie.gc() > 0
+    assert not trie.has_node(("a", "b", "c", "3"))
+
+
+@pytest.mark.parametrize("layout", ["adjacency", "path", "radix"])
+def test_prune(tmp_path, layout):
+    trie = SQLiteTrie.open(os.fspath(tmp_path / "db"), layout, prune=True)
+
+    def nodes():
+        return trie._conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+
+    trie[("a", "b")] = b"b-value"
+    trie[("a", "b", "c", "d", "e")] = b"e-value"
+    trie[("a", "b", "c", "x")] = b"x-value"
+    total = nodes()
+
+    del trie[("a", "b", "c", "d", "e")]
+    assert not trie.has_node(("a", "b", "c", "d"))
+    assert trie.has_node(("a", "b", "c", "x"))
+    del trie[("a", "b", "c", "x")]
+    assert not trie.has_node(("a", "b", "c"))
+    assert trie[("a", "b")] == b"b-value"
+    assert nodes() < total
+
+    trie[("a", "b", "c", "d")] = b"d-value"
+    trie.delete_subtree(("a", "b", "c"))
+    assert trie.has_node(("a", "b"))
+    del trie[("a", "b")]
+    assert not trie.has_node(("a",))
+    assert nodes() == 1
+    assert trie.gc() == 0
+
+    view = trie.view(("v", "w"))
+    view[("x",)] = b"x-value"
+    del view[("x",)]
+    # NOTE: the root of the view stays
+    assert trie.has_node(("v", "w"))
+    assert list(view.items()) == []
+
+
 def test_open(tmp_path):
     path = os.fspath(tmp_path / "db")
     trie = SQLiteTrie.open(path)
@@ -152,14 +339,14 @@ def test_open(tmp_path):
     assert trie[("foo",)] == b"foo-value"
     assert trie[("foo", "bar", "baz")] == b"baz-value"
 
-    assert not trie._ids
+    assert trie._ids == {("foo",): 2, ("foo", "bar", "baz"): 4}
     assert trie._local.conn
     trie.close()
     assert not trie._ids
     assert not hasattr(trie._local, "conn")
 
 
-@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie])
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
 def test_view(cls):
     trie = cls()
 
@@ -171,3 +358,1316 @@ def test_view(cls):
 
     view = trie.view(("a", "b", "c"))
     assert not list(view.items())
+
+
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
+def test_view_shares_storage(cls):
+    trie = cls()
+    trie[("a", "b", "c")] = b"abc"
+    trie[("a", "d")] = b"ad"
+    trie[("x",)] = b"x"
+
+    view = trie.view(("a",))
+    assert sorted(view.items()) == [(("b", "c"), b"abc"), (("d",), b"ad")]
+    assert view[("d",)] == b"ad"
+    assert len(view) == 2
+    assert view.longest_prefix(("b", "c", "e")) == (("b", "c"), b"abc")
+    assert list(view.ls(("b",))) == [("b", "c")]
+
+    view[("e",)] = b"ae"
+    assert trie[("a", "e")] == b"ae"
+    del view[("d",)]
+    assert ("a", "d") not in trie
+
+    trie[("a", "b", "f")] = b"abf"
+    assert view.view(("b",))[("f",)] == b"abf"
+
+
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
+def test_update_many(cls):
+    items = {
+        (): b"root",
+        ("foo",): b"foo-value",
+        ("foo", "bar", "baz"): b"baz-value",
+        ("foo", "bar", "qux"): b"qux-value",
+        ("foo/bar",): b"slash-value",
+        ("a", "b", "c", "d"): None,
+    }
+
+    trie = cls()
+    trie[("foo", "bar")] = b"bar-value"
+    trie[("foo",)] = b"old-value"
+    trie.update_many(items)
+
+    expected = cls()
+    expected[("foo", "bar")] = b"bar-value"
+    for key, value in items.items():
+        expected[key] = value
+
+    assert sorted(trie.items()) == sorted(expected.items())
+    assert trie[("foo",)] == b"foo-value"
+    assert trie.has_node(("a", "b", "c"))
+
+    trie = cls.from_items(list(items.items()))
+    assert len(trie) == len(items)
+    assert trie[("foo", "bar", "qux")] == b"qux-value"
+
+
+@pytest.mark.parametrize(
+    "make",
+    [
+        SQLiteTrie,
+        partial(SQLiteTrie.open, ":memory:", layout="path"),
+        partial(SQLiteTrie.open, ":memory:", layout="radix"),
+        PyGTrie,
+        SQLAlchemyTrie,
+    ],
+)
+def test_batched_lookups(make):
+    trie = make()
+    trie.update_many(
+        {
+            ("foo",): b"foo-value",
+            ("foo", "bar", "baz", "qux"): b"qux-value",
+            ("foo", "bar", "baz", "quux"): None,
+            ("a", "b", "c", "d"): b"d-value",
+        }
+    )
+    keys = [
+        ("a", "b", "c", "d"),
+        ("foo", "bar"),
+        ("foo", "bar", "baz", "quux"),
+        ("missing",),
+        ("a", "b"),
+        ("foo", "bar", "baz", "qux", "x"),
+        ("a", "b", "c", "d"),
+        ("a", "x", "c"),
+    ]
+
+    assert trie.get_many(keys, default=b"default") == [
+        trie.get(key, b"default") for key in keys
+    ]
+    assert trie.get_many(keys)[:4] == [b"d-value", None, None, None]
+    assert trie.has_nodes(keys) == [True, True, True, False, True, False, True, False]
+    assert trie.longest_prefix_many(keys) == [trie.longest_prefix(key) for key in keys]
+    assert trie.longest_prefix_many(keys)[5] == (
+        ("foo", "bar", "baz", "qux"),
+        b"qux-value",
+    )
+
+    view = trie.view(("foo", "bar"))
+    assert view.get_many([("baz", "qux"), ("baz",)]) == [b"qux-value", None]
+    assert view.has_nodes([("baz",), ("qux",)]) == [True, False]
+    assert view.longest_prefix_many([("baz", "qux", "x"), ("baz",)]) == [
+        (("baz", "qux"), b"qux-value"),
+        None,
+    ]
+
+
+def test_lookups_do_not_commit(tmp_path):
+    path = os.fspath(tmp_path / "db")
+    trie = SQLiteTrie.open(path)
+    trie[("foo",)] = b"foo-value"
+    trie.commit()
+
+    trie[("foo", "bar/baz")] = b"baz-value"
+    assert trie[("foo", "bar/baz")] == b"baz-value"
+    assert trie.has_node(("foo", "bar/baz"))
+    assert not trie.has_node(("foo", "bar"))
+    assert list(trie.prefixes(("foo", "bar/baz", "qux"))) == [
+        (("foo",), b"foo-value"),
+        (("foo", "bar/baz"), b"baz-value"),
+    ]
+
+    view = trie.view(("foo",))
+    assert view[("bar/baz",)] == b"baz-value"
+    view = trie.view(("new", "node"))
+    view[("qux",)] = b"qux-value"
+    assert trie[("new", "node", "qux")] == b"qux-value"
+    assert view._ids is trie._ids  # pylint: disable=protected-access
+
+    trie.rollback()
+    trie.close()
+
+    trie = SQLiteTrie.open(path)
+    assert list(trie.items()) == [(("foo",), b"foo-value")]
+    trie.close()
+
+
+def test_path_layout(tmp_path):
+    path = os.fspath(tmp_path / "db")
+
+    trie = SQLiteTrie.open(path)
+    trie[("foo",)] = b"foo-value"
+    trie[("foo", "bar", "baz")] = b"baz-value"
+    trie.commit()
+    trie.close()
+
+    # NOTE: existing databases get their paths backfilled
+    trie = SQLiteTrie.open(path, layout="path")
+    trie[("foo", "bar", "qux")] = b"qux-value"
+    trie[("foo-bar",)] = b"foo-bar-value"
+
+    assert trie[("foo", "bar", "baz")] == b"baz-value"
+    assert trie[("foo", "bar", "qux")] == b"qux-value"
+    with pytest.raises(ShortKeyError):
+        trie[("foo", "bar")]  # pylint: disable=pointless-statement
+    with pytest.raises(KeyError):
+        trie[("foo", "non-existent")]  # pylint: disable=pointless-statement
+
+    assert list(trie.items()) == [
+        (("foo",), b"foo-value"),
+        (("foo", "bar", "baz"), b"baz-value"),
+        (("foo", "bar", "qux"), b"qux-value"),
+        (("foo-bar",), b"foo-bar-value"),
+    ]
+    assert list(trie.items(shallow=True)) == [
+        (("foo",), b"foo-value"),
+        (("foo-bar",), b"foo-bar-value"),
+    ]
+    assert list(trie.items(("foo", "bar"))) == [
+        (("foo", "bar", "baz"), b"baz-value"),
+        (("foo", "bar", "qux"), b"qux-value"),
+    ]
+    with pytest.raises(KeyError):
+        list(trie.items(("foo", "non-existent")))
+    assert trie.longest_prefix(("foo", "bar", "xyz")) == (("foo",), b"foo-value")
+
+    view = trie.view(("foo", "bar"))
+    assert list(view.items()) == [
+        (("baz",), b"baz-value"),
+        (("qux",), b"qux-value"),
+    ]
+    view[("xyz", "abc")] = b"abc-value"
+    assert view[("xyz", "abc")] == b"abc-value"
+    assert trie[("foo", "bar", "xyz", "abc")] == b"abc-value"
+
+    trie.delete_node(("foo", "bar"))
+    assert not trie.has_node(("foo", "bar", "baz"))
+    assert list(trie.items()) == [
+        (("foo",), b"foo-value"),
+        (("foo-bar",), b"foo-bar-value"),
+    ]
+
+    trie[("foo", "bar", "baz")] = b"new-value"
+    assert list(trie.items(("foo", "bar"))) == [
+        (("foo", "bar", "baz"), b"new-value"),
+    ]
+    trie.commit()
+    trie.close()
+
+    with pytest.raises(ValueError, match="unknown layout"):
+        SQLiteTrie.open(path, layout="unknown")
+
+
+@pytest.mark.parametrize("hashes", [False, True])
+def test_radix_layout(tmp_path, hashes):
+    path = os.fspath(tmp_path / "db")
+    trie = SQLiteTrie.open(path, layout="radix", hashes=hashes)
+
+    def nodes():
+        return trie._conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+
+    trie[("a", "b", "c", "d", "e")] = b"e-value"
+    assert nodes() == 2
+    assert trie[("a", "b", "c", "d", "e")] == b"e-value"
+    with pytest.raises(ShortKeyError):
+        trie[("a", "b", "c")]  # pylint: disable=pointless-statement
+    with pytest.raises(KeyError):
+        trie[("a", "b", "x")]  # pylint: disable=pointless-statement
+    assert trie.has_node(("a", "b", "c"))
+    assert not trie.has_node(("a", "c"))
+    assert list(trie.ls(("a", "b"), with_values=True)) == [(("a", "b", "c"), None)]
+    assert list(trie.ls(("a", "b", "c", "d"), with_values=True)) == [
+        (("a", "b", "c", "d", "e"), b"e-value")
+    ]
+    assert list(trie.items(("a", "b"))) == [(("a", "b", "c", "d", "e"), b"e-value")]
+    assert nodes() == 2
+
+    # NOTE: chains are split where the new keys leave them
+    trie[("a", "b", "x", "y")] = b"y-value"
+    trie[("a", "b")] = b"b-value"
+    trie[("a", "b", "c", "d", "e", "f")] = b"f-value"
+    assert nodes() == 5
+    assert list(trie.items()) == [
+        (("a", "b"), b"b-value"),
+        (("a", "b", "c", "d", "e"), b"e-value"),
+        (("a", "b", "c", "d", "e", "f"), b"f-value"),
+        (("a", "b", "x", "y"), b"y-value"),
+    ]
+    assert list(trie.items(shallow=True)) == [(("a", "b"), b"b-value")]
+    assert list(trie.prefixes(("a", "b", "c", "d", "e", "f", "g"))) == [
+        (("a", "b"), b"b-value"),
+        (("a", "b", "c", "d", "e"), b"e-value"),
+        (("a", "b", "c", "d", "e", "f"), b"f-value"),
+    ]
+    assert len(trie) == 4
+    assert len(trie.view(("a", "b", "c"))) == 2
+
+    def node_factory(_, key, children, value=None):
+        return key, value, list(children)
+
+    for prefetch in (True, False):
+        assert trie.traverse(node_factory, ("a", "b", "c"), prefetch=prefetch) == (
+            ("a", "b", "c"),
+            None,
+            [
+                (
+                    ("a", "b", "c", "d"),
+                    None,
+                    [
+                        (
+                            ("a", "b", "c", "d", "e"),
+                            b"e-value",
+                            [(("a", "b", "c", "d", "e", "f"), b"f-value", [])],
+                        )
+                    ],
+                )
+            ],
+        )
+
+    trie[("q", "b", "c", "d", "e")] = b"e-value"
+    trie[("q", "b", "c", "d", "e", "f")] = b"new-value"
+    assert list(trie.diff(("a",), ("q",))) == [
+        Change(DELETE, TrieNode(("b",), b"b-value"), None),
+        Change(
+            MODIFY,
+            TrieNode(("b", "c", "d", "e", "f"), b"f-value"),
+            TrieNode(("b", "c", "d", "e", "f"), b"new-value"),
+        ),
+        Change(DELETE, TrieNode(("b", "x", "y"), b"y-value"), None),
+    ]
+    assert list(trie.diff(("a", "b", "c"), ("q", "b", "c"))) == [
+        Change(
+            MODIFY,
+            TrieNode(("d", "e", "f"), b"f-value"),
+            TrieNode(("d", "e", "f"), b"new-value"),
+        ),
+    ]
+
+    trie.delete_node(("q", "b", "c", "d"))
+    assert trie.has_node(("q", "b", "c"))
+    assert not trie.has_node(("q", "b", "c", "d"))
+    assert list(trie.items(("q",))) == []
+
+    view = trie.view(("q", "b"))
+    view[("z",)] = b"z-value"
+    assert trie[("q", "b", "z")] == b"z-value"
+    trie.commit()
+    trie.close()
+
+    with pytest.raises(ValueError, match="incompatible"):
+        SQLiteTrie.open(path)[("a",)]  # pylint: disable=pointless-statement
+
+
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
+def test_items(cls):
+    trie = cls()
+    trie[("b",)] = b"b-value"
+    trie[("a", "c")] = b"c-value"
+    trie[("a", "b", "d")] = b"d-value"
+    trie[("a", "b")] = b"b-value"
+    trie[("a-b",)] = b"a-b-value"
+
+    assert sorted(trie.items()) == [
+        (("a", "b"), b"b-value"),
+        (("a", "b", "d"), b"d-value"),
+        (("a", "c"), b"c-value"),
+        (("a-b",), b"a-b-value"),
+        (("b",), b"b-value"),
+    ]
+    assert sorted(trie.items(shallow=True)) == [
+        (("a", "b"), b"b-value"),
+        (("a", "c"), b"c-value"),
+        (("a-b",), b"a-b-value"),
+        (("b",), b"b-value"),
+    ]
+    assert sorted(trie.items(("a",), shallow=True)) == [
+        (("a", "b"), b"b-value"),
+        (("a", "c"), b"c-value"),
+    ]
+    assert sorted(trie) == [
+        ("a", "b"),
+        ("a", "b", "d"),
+        ("a", "c"),
+        ("a-b",),
+        ("b",),
+    ]
+
+
+def test_prefix_lru_cache():
+    cache = PrefixLRUCache(4)
+    for key in [("a",), ("a", "b"), ("a", "b", "c"), ("a", "d"), ("x", "y")]:
+        cache[key] = key
+    # NOTE: ("a",) was evicted
+    assert list(cache) == [("a", "b"), ("a", "b", "c"), ("a", "d"), ("x", "y")]
+
+    cache.pop_prefix(("a", "b"))
+    assert list(cache) == [("a", "d"), ("x", "y")]
+    cache.pop_prefix(("a", "b"))
+    cache.pop_prefix(("q",))
+    assert list(cache) == [("a", "d"), ("x", "y")]
+
+    del cache[("a", "d")]
+    cache[("a", "d", "e")] = 1
+    cache.pop_prefix(("a",))
+    assert list(cache) == [("x", "y")]
+    assert cache.currsize == 1
+    cache.pop_prefix(())
+    assert not cache
+    assert not cache._index
+
+
+@pytest.mark.parametrize("layout", ["adjacency", "path"])
+def test_node_cache(tmp_path, layout):
+    trie = SQLiteTrie.open(os.fspath(tmp_path / "db"), layout=layout, node_cache_size=3)
+    trie.update_many(
+        {
+            ("a", "b", "c"): b"abc",
+            ("a", "b", "f"): b"abf",
+            ("a", "e"): b"ae",
+            ("x", "y"): b"xy",
+        }
+    )
+    trie.commit()
+    assert len(trie._ids) == 3
+
+    trie._ids.clear()
+    before = trie.node_cache_info()
+    assert trie[("a", "b", "c")] == b"abc"
+    assert trie[("a", "b", "c")] == b"abc"
+    assert trie.has_node(("a", "b"))
+    assert list(trie.ls(("a", "b"))) == [("a", "b", "c"), ("a", "b", "f")]
+    info = trie.node_cache_info()
+    assert info.hits - before.hits == 2
+    assert info.misses - before.misses == 2
+    assert info.maxsize == 3
+    assert info.currsize == 2
+
+    view = trie.view(("a",))
+    assert view[("b", "c")] == b"abc"
+    assert view.node_cache_info().hits - before.hits == 3
+
+    trie.delete_node(("a", "b"))
+    assert not trie.has_node(("a", "b", "c"))
+    assert not view.has_node(("b", "c"))
+    trie.rollback()
+    assert not trie._ids
+    assert view[("b", "c")] == b"abc"
+
+    view.clear()
+    assert not trie.has_node(("a", "b", "c"))
+    assert trie[("x", "y")] == b"xy"
+    trie[("a", "b", "c")] = b"new"
+    assert view[("b", "c")] == b"new"
+
+    with pytest.raises(sqlite3.Error):
+        trie.update_many({("q", "r"): object()})
+    assert not trie._ids
+    assert not trie.has_node(("q",))
+
+
+def test_value_cache(tmp_path):
+    trie = SQLiteTrie.open(os.fspath(tmp_path / "db"), value_cache_size=1024)
+    trie[("a", "b")] = b"ab"
+    trie[("a", "c")] = b"ac"
+    trie.commit()
+
+    assert trie[("a", "b")] == b"ab"
+    assert trie[("a", "b")] == b"ab"
+    info = trie.value_cache_info()
+    assert info.hits == 1
+    assert info.maxsize == 1024
+    assert 0 < info.currsize <= 1024
+
+    view = trie.view(("a",))
+    view[("b",)] = b"new"
+    assert trie[("a", "b")] == b"new"
+    del trie[("a", "c")]
+    with pytest.raises(KeyError):
+        view[("c",)]  # pylint: disable=pointless-statement
+
+    trie.rollback()
+    assert trie.value_cache_info().currsize == 0
+    assert view[("b",)] == b"ab"
+    assert view[("c",)] == b"ac"
+
+    trie[("a", "d")] = bytes(2048)
+    assert ("a", "d") not in trie._values
+    assert trie[("a", "d")] == bytes(2048)
+
+    view.clear()
+    assert trie.value_cache_info().currsize == 0
+    assert not trie.has_node(("a", "b"))
+
+
+def test_value_cache_threads(tmp_path):
+    trie = SQLiteTrie.open(os.fspath(tmp_path / "db"), value_cache_size=1 << 20)
+    trie[("a",)] = b"committed"
+    trie.commit()
+
+    with ThreadPoolExecutor(1) as executor:
+
+        def _get():
+            return executor.submit(trie.__getitem__, ("a",)).result()
+
+        assert _get() == b"committed"
+
+        # NOTE: uncommitted values are only visible to the thread that wrote
+        # them
+        trie[("a",)] = b"uncommitted"
+        assert trie[("a",)] == b"uncommitted"
+        assert _get() == b"committed"
+
+        trie.commit()
+        assert _get() == b"uncommitted"
+        assert trie[("a",)] == b"uncommitted"
+        executor.submit(trie.close).result()
+    trie.close()
+
+
+class _JSONTrie(JSONTrie):
+    _trie = None
+
+    def __init__(self, *args, **kwargs):
+        self._trie = SQLiteTrie()
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def open(cls, path):
+        raise NotImplementedError
+
+
+def test_serialized_value_cache():
+    trie = _JSONTrie(value_cache_size=1024)
+    assert trie.value_cache_info().currsize == 0
+
+    value = {"foo": "bar"}
+    trie[("a", "b")] = value
+    trie[("a", "c")] = [1, 2, 3]
+    value["foo"] = "mutated"
+    trie.commit()
+    assert trie[("a", "b")] == {"foo": "bar"}
+    assert trie[("a", "b")] is trie[("a", "b")]
+    assert trie.value_cache_info().hits == 2
+
+    view = trie.view(("a",))
+    view[("b",)] = {"foo": "baz"}
+    assert trie[("a", "b")] == {"foo": "baz"}
+    trie.delete_node(("a", "c"))
+    assert ("a", "c") not in trie._values
+
+    assert _JSONTrie().value_cache_info() is None
+
+
+class _CodecTrie(CodecTrie):
+    _trie = None
+
+    def __init__(self, *args, **kwargs):
+        self._trie = SQLiteTrie()
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def open(cls, path):
+        raise NotImplementedError
+
+
+@pytest.mark.parametrize(
+    "codec",
+    [
+        JSONCodec(),
+        PickleCodec(),
+        MsgpackCodec(),
+        ZlibCodec(JSONCodec()),
+        ZlibCodec.train(JSONCodec(), [{"foo": "bar", "baz": idx} for idx in range(3)]),
+        LZMACodec(MsgpackCodec()),
+    ],
+)
+def test_codec_trie(codec):
+    trie = _CodecTrie(codec=codec)
+    items = {("a", str(idx)): {"foo": "bar", "baz": idx} for idx in range(2000)}
+    items[("a",)] = None
+    trie.update_many(items)
+
+    assert trie[("a", "5")] == {"foo": "bar", "baz": 5}
+    assert trie[("a",)] is None
+    assert dict(trie.items()) == items
+    assert trie._trie[("a", "5")] == codec.dumps({"foo": "bar", "baz": 5})
+
+    view = trie.view(("a",))
+    assert view.codec is codec
+    view[("x",)] = [1, 2, 3]
+    assert trie[("a", "x")] == [1, 2, 3]
+
+
+def test_serialized_update(mocker):
+    trie = _JSONTrie()
+    dump = mocker.spy(trie, "_dump")
+    dump_many = mocker.spy(trie, "_dump_many")
+
+    trie.update({("a",): {"foo": "bar"}, ("a", "b"): [1, 2]})
+    trie.update([(("x",), None)])
+    assert not dump.called
+    assert dump_many.call_count == 2
+    assert dict(trie.items()) == {
+        ("a",): {"foo": "bar"},
+        ("a", "b"): [1, 2],
+        ("x",): None,
+    }
+
+
+def test_json_fallback(monkeypatch):
+    # NOTE: loading a separate copy of the module, so that the one that the
+    # rest of the tests use still has orjson.
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    spec = importlib.util.spec_from_file_location("_codecs", inspect.getfile(JSONCodec))
+    assert spec
+    assert spec.loader
+    fallback = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(fallback)
+
+    value = {"foo": ["bar", 1, None]}
+    raw = fallback.json_dumps(value)
+    assert isinstance(raw, bytes)
+    assert fallback.json_loads(raw) == value
+    assert fallback.json_loads(json_dumps(value)) == value
+    assert json_loads(raw) == value
+
+
+def test_serialized_batched_lookups():
+    trie = _JSONTrie()
+    trie.update_many({("a",): {"foo": "bar"}, ("a", "b", "c"): [1, 2], ("x",): None})
+
+    assert trie.get_many([("a", "b", "c"), ("a", "b"), ("x",), ("y",), ("a",)]) == [
+        [1, 2],
+        None,
+        None,
+        None,
+        {"foo": "bar"},
+    ]
+    assert trie.has_nodes([("a", "b"), ("y",)]) == [True, False]
+    assert trie.longest_prefix_many([("a", "b"), ("y",), ("a", "b", "c", "d")]) == [
+        (("a",), {"foo": "bar"}),
+        None,
+        (("a", "b", "c"), [1, 2]),
+    ]
+
+
+def test_lazy_values(mocker):
+    trie = _JSONTrie()
+    trie[("a",)] = {"foo": "bar"}
+    trie[("a", "b", "c")] = [1, 2, 3]
+    load = mocker.spy(trie, "_load")
+
+    items = dict(trie.items(lazy=True))
+    assert list(items) == [("a",), ("a", "b", "c")]
+    assert not load.called
+
+    value = items[("a",)]
+    assert isinstance(value, LazyValue)
+    assert value.raw == b'{"foo":"bar"}'
+    assert value.value == {"foo": "bar"}
+    assert value.value is value.value
+    assert load.call_count == 1
+
+    assert list(trie.ls(("a",), with_values=True, lazy=True)) == [(("a", "b"), None)]
+
+    def node_factory(path_conv, path, children, value):
+        if isinstance(value, LazyValue):
+            value = value.value
+        return (path, value, list(children))
+
+    load.reset_mock()
+    assert trie.traverse(node_factory, lazy=True) == trie.traverse(node_factory)
+    # NOTE: nothing is decoded for the root and ("a", "b"), which have no values
+    assert load.call_count == 4
+
+
+def test_zlib_zdict():
+    values = [
+        {"md5": f"{idx:032x}", "size": idx, "isexec": False} for idx in range(100)
+    ]
+    plain = ZlibCodec(JSONCodec())
+    trained = ZlibCodec.train(JSONCodec(), values[:50])
+    assert sum(map(len, trained.dumps_many(values))) < sum(
+        map(len, plain.dumps_many(values))
+    )
+    assert list(trained.loads_many(trained.dumps_many(values))) == values
+
+
+@pytest.mark.parametrize("layout", ["adjacency", "path"])
+def test_reader_pool(tmp_path, layout):
+    path = os.fspath(tmp_path / "db")
+    trie = SQLiteTrie.open(path, layout=layout, readers=2)
+    trie[("a",)] = b"a"
+    trie[("b",)] = b"b"
+    trie.commit()
+
+    items = trie.items()
+    assert next(items) == (("a",), b"a")
+    trie[("c",)] = b"c"
+    trie.commit()
+    # NOTE: the reader keeps seeing the snapshot it has started with
+    assert list(items) == [(("b",), b"b")]
+    assert len(list(trie.items())) == 3
+
+    stats = trie.pool_stats()
+    assert stats.checkouts == 2
+    assert stats.in_use == 0
+    assert stats.idle == stats.created == 1
+
+    # NOTE: uncommitted changes are only visible to the writer
+    trie[("d",)] = b"d"
+    assert (("d",), b"d") in list(trie.items())
+    assert not list(trie.diff((), ()))
+    assert trie.pool_stats().checkouts == 2
+    trie.commit()
+
+    iterators = [trie.items() for _ in range(3)]
+    for it in iterators:
+        next(it)
+    stats = trie.pool_stats()
+    assert stats.in_use == stats.size == 2
+    assert stats.fallbacks == 1
+    for it in iterators:
+        it.close()
+    assert trie.pool_stats().idle == 2
+
+    trie.close()
+    assert trie.pool_stats().created == 0
+
+    with pytest.raises(ValueError, match="require a database file"):
+        SQLiteTrie.open(":memory:", readers=1)
+
+
+@pytest.mark.parametrize("hashes", [False, True])
+def test_parallel(tmp_path, monkeypatch, hashes):
+    # NOTE: small batches, so that workers have to wait for the consumer
+    monkeypatch.setattr("sqltrie.sqlite.sqlite.PARALLEL_BATCH_SIZE", 2)
+    monkeypatch.setattr("sqltrie.sqlite.sqlite.PARALLEL_QUEUE_SIZE", 1)
+    path = os.fspath(tmp_path / "db")
+    trie = SQLiteTrie.open(path, hashes=hashes)
+    for name in ("old", "new"):
+        trie[(name,)] = name.encode()
+        for idx in range(20):
+            trie[(name, str(idx), "file")] = str(idx).encode()
+    trie[("new", "5", "file")] = b"modified"
+    trie[("new", "21", "file")] = b"added"
+    del trie[("new", "7", "file")]
+    trie.delete_node(("new", "9"))
+    trie.commit()
+
+    expected_items = list(trie.items())
+    expected_shallow = list(trie.items(("old",), shallow=True))
+    expected_diff = list(trie.diff(("old",), ("new",), with_unchanged=True))
+    trie.commit()
+    trie.close()
+
+    trie = SQLiteTrie.open(path, hashes=hashes, workers=2)
+    assert list(trie.items()) == expected_items
+    assert list(trie.items(("old",), shallow=True)) == expected_shallow
+    assert list(trie.diff(("old",), ("new",), with_unchanged=True)) == expected_diff
+
+    # NOTE: workers that are blocked on a full queue are stopped, if the
+    # consumer doesn't read everything
+    items = trie.items()
+    assert next(items) == expected_items[0]
+    items.close()
+
+    # NOTE: pending changes are not visible to the workers
+    trie[("old", "0", "file")] = b"changed"
+    assert (("old", "0", "file"), b"changed") in list(trie.items())
+    trie.close()
+
+    with pytest.raises(ValueError, match="require a database file"):
+        SQLiteTrie.open(":memory:", workers=2)
+
+
+@pytest.mark.parametrize("layout", ["adjacency", "path"])
+def test_len(tmp_path, layout):
+    trie = SQLiteTrie.open(os.fspath(tmp_path / "db"), layout=layout)
+    assert len(trie) == 0
+
+    trie[("foo",)] = b"foo-value"
+    trie[("foo", "bar", "baz")] = b"baz-value"
+    trie[("foo", "bar", "baz")] = b"new-value"
+    trie.update_many({("foo", "bar", "qux"): b"qux-value", (): b"root-value"})
+    assert len(trie) == 4
+
+    view = trie.view(("foo", "bar"))
+    assert len(view) == 2
+    view[("xyz",)] = b"xyz-value"
+    assert len(view) == 3
+    assert len(trie) == 5
+
+    del trie[("foo", "bar", "baz")]
+    assert len(view) == 2
+    assert len(trie) == 4
+
+    trie.delete_node(("foo", "bar", "qux"))
+    assert len(view) == 1
+    assert len(trie) == 3
+
+    view.clear()
+    assert len(view) == 0
+    assert len(trie) == 2
+    assert list(trie.items()) == [((), b"root-value"), (("foo",), b"foo-value")]
+
+    trie.commit()
+    trie[("foo", "bar")] = b"bar-value"
+    assert len(trie) == 3
+    trie.rollback()
+    assert len(trie) == 2
+
+    trie[("foo", "bar")] = b"bar-value"
+    trie.clear()
+    assert len(trie) == 0
+    assert not list(trie.items())
+    trie[("foo",)] = b"foo-value"
+    assert len(trie) == 1
+
+
+def test_len_migration(tmp_path):
+    path = os.fspath(tmp_path / "db")
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE nodes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pid INTEGER,
+            name TEXT,
+            has_value BOOLEAN,
+            value BLOB,
+            UNIQUE(pid, name),
+            UNIQUE(id, pid),
+            CHECK(id != pid)
+        );
+        INSERT INTO nodes (id, pid, name, has_value, value) VALUES
+            (1, NULL, '', 0, NULL),
+            (2, 1, 'foo', 1, 'foo-value'),
+            (3, 2, 'bar', NULL, NULL),
+            (4, 3, 'baz', 1, 'baz-value');
+        """
+    )
+    conn.close()
+
+    trie = SQLiteTrie.open(path)
+    assert len(trie) == 2
+    assert len(trie.view(("foo", "bar"))) == 1
+    trie[("foo", "bar", "qux")] = b"qux-value"
+    assert len(trie) == 3
+    trie.close()
+
+
+@pytest.mark.parametrize("layout", ["adjacency", "path"])
+def test_dedup(tmp_path, layout):
+    path = os.fspath(tmp_path / "db")
+    trie = SQLiteTrie.open(path, layout=layout, dedup=True, hashes=True)
+
+    def _blobs():
+        rows = trie._conn.execute("SELECT value, refs FROM blobs ORDER BY value")
+        return [tuple(row) for row in rows]
+
+    trie.update_many(
+        {
+            ("old", "foo"): b"same",
+            ("old", "bar"): b"bar",
+            ("new", "foo"): b"same",
+            ("new", "bar"): b"changed",
+        }
+    )
+    trie[("new", "baz")] = b"same"
+    assert _blobs() == [(b"bar", 1), (b"changed", 1), (b"same", 3)]
+    assert not trie._conn.execute(
+        "SELECT count(*) FROM nodes WHERE value IS NOT NULL"
+    ).fetchone()[0]
+    assert trie[("new", "foo")] == b"same"
+    assert list(trie.items(("old",))) == [
+        (("old", "bar"), b"bar"),
+        (("old", "foo"), b"same"),
+    ]
+    assert trie.longest_prefix(("new", "bar", "x")) == (("new", "bar"), b"changed")
+    assert list(trie.diff(("old",), ("new",))) == [
+        Change(
+            MODIFY,
+            TrieNode(("bar",), b"bar"),
+            TrieNode(("bar",), b"changed"),
+        ),
+        Change(ADD, None, TrieNode(("baz",), b"same")),
+    ]
+
+    trie[("new", "bar")] = b"bar"
+    del trie[("new", "baz")]
+    trie[("new", "foo")] = None
+    assert trie[("new", "foo")] is None
+    assert _blobs() == [(b"bar", 2), (b"same", 1)]
+
+    trie.delete_node(("old",))
+    trie.commit()
+    trie.close()
+
+    trie = SQLiteTrie.open(path, layout=layout, dedup=True)
+    assert list(trie.items()) == [(("new", "bar"), b"bar"), (("new", "foo"), None)]
+    if layout == "path":
+        assert _blobs() == [(b"bar", 1)]
+    trie.close()
+
+
+def test_dedup_migration(tmp_path):
+    path = os.fspath(tmp_path / "db")
+    trie = SQLiteTrie.open(path)
+    trie.update_many({("foo",): b"value", ("bar",): b"value", ("baz",): None})
+    trie.commit()
+    trie.close()
+
+    trie = SQLiteTrie.open(path, dedup=True)
+    assert list(trie.items()) == [
+        (("bar",), b"value"),
+        (("baz",), None),
+        (("foo",), b"value"),
+    ]
+    assert [tuple(row) for row in trie._conn.execute("SELECT refs FROM blobs")] == [
+        (2,)
+    ]
+    trie.close()
+
+
+@pytest.mark.parametrize("dedup", [False, True])
+def test_dedup_reopen(tmp_path, dedup):
+    path = os.fspath(tmp_path / "db")
+    trie = SQLiteTrie.open(path, dedup=True)
+    trie.update_many({("foo",): b"value", ("bar",): b"other"})
+    trie.commit()
+    trie.close()
+
+    trie = SQLiteTrie.open(path, dedup=dedup)
+    assert trie[("foo",)] == b"value"
+    trie[("baz",)] = b"value"
+    trie[("bar",)] = b"new"
+    trie.commit()
+    assert list(trie.items()) == [
+        (("bar",), b"new"),
+        (("baz",), b"value"),
+        (("foo",), b"value"),
+    ]
+    assert sorted(
+        tuple(row) for row in trie._conn.execute("SELECT value, refs FROM blobs")
+    ) == [(b"new", 1), (b"value", 2)]
+    assert trie.view(("baz",))[()] == b"value"
+    trie.close()
+
+
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
+def test_traverse(cls):
+    trie = cls()
+    trie[("foo",)] = b"foo-value"
+    trie[("foo", "bar", "baz")] = b"baz-value"
+    trie[("foo", "bar", "qux")] = b"qux-value"
+    trie[("xyz",)] = b"xyz-value"
+
+    def node_factory(path_conv, path, children, *value):
+        return (path_conv(path), value, sorted(children))
+
+    assert trie.traverse(node_factory) == (
+        (),
+        (),
+        [
+            (
+                ("foo",),
+                (b"foo-value",),
+                [
+                    (
+                        ("foo", "bar"),
+                        (),
+                        [
+                            (("foo", "bar", "baz"), (b"baz-value",), []),
+                            (("foo", "bar", "qux"), (b"qux-value",), []),
+                        ],
+                    ),
+                ],
+            ),
+            (("xyz",), (b"xyz-value",), []),
+        ],
+    )
+
+    visited = []
+
+    def pruning_factory(path_conv, path, children, *value):
+        visited.append(path)
+        if path != ("foo", "bar"):
+            list(children)
+
+    trie.traverse(pruning_factory, prefix=("foo",))
+    assert sorted(visited) == [("foo",), ("foo", "bar")]
+
+    if cls is SQLiteTrie:
+        assert trie.traverse(node_factory, prefetch=False) == trie.traverse(
+            node_factory
+        )
+
+
+@pytest.mark.parametrize("hashes", [False, True])
+def test_diff(tmp_path, hashes):
+    trie = SQLiteTrie.open(os.fspath(tmp_path / "db"), hashes=hashes)
+    for root in ("old", "new"):
+        trie[(root, "foo")] = b"foo-value"
+        trie[(root, "bar", "baz")] = b"baz-value"
+        trie[(root, "bar", "qux")] = b"qux-value"
+
+    assert not list(trie.diff(("old",), ("new",)))
+    assert trie._conn.in_transaction
+
+    trie[("new", "bar", "baz")] = b"new-value"
+    trie[("new", "bar", "xyz")] = b"xyz-value"
+    del trie[("new", "foo")]
+
+    assert list(trie.diff(("old",), ("new",))) == [
+        Change(
+            MODIFY,
+            TrieNode(("bar", "baz"), b"baz-value"),
+            TrieNode(("bar", "baz"), b"new-value"),
+        ),
+        Change(ADD, None, TrieNode(("bar", "xyz"), b"xyz-value")),
+        Change(DELETE, TrieNode(("foo",), b"foo-value"), None),
+    ]
+    assert list(trie.diff(("old",), ("new",), with_unchanged=True)) == [
+        Change(
+            MODIFY,
+            TrieNode(("bar", "baz"), b"baz-value"),
+            TrieNode(("bar", "baz"), b"new-value"),
+        ),
+        Change(
+            UNCHANGED,
+            TrieNode(("bar", "qux"), b"qux-value"),
+            TrieNode(("bar", "qux"), b"qux-value"),
+        ),
+        Change(ADD, None, TrieNode(("bar", "xyz"), b"xyz-value")),
+        Change(DELETE, TrieNode(("foo",), b"foo-value"), None),
+    ]
+
+
+def test_diff_hashes(tmp_path):
+    trie = SQLiteTrie.open(os.fspath(tmp_path / "db"), hashes=True)
+    for root in ("old", "new"):
+        trie[(root, "foo")] = b"foo-value"
+        trie[(root, "bar", "baz")] = b"baz-value"
+        trie[(root, "bar", "qux")] = b"qux-value"
+
+    assert not list(trie.diff(("old",), ("new",)))
+
+    def invalid():
+        return {
+            row["name"]
+            for row in trie._conn.execute("SELECT name FROM nodes WHERE hash IS NULL")
+        }
+
+    assert invalid() == {""}
+
+    trie[("new", "bar", "baz")] = b"new-value"
+    trie[("new", "bar", "xyz")] = b"xyz-value"
+    del trie[("new", "foo")]
+    assert invalid() == {"", "new", "bar", "baz", "xyz", "foo"}
+
+    assert list(trie.diff(("old",), ("new",))) == [
+        Change(
+            MODIFY,
+            TrieNode(("bar", "baz"), b"baz-value"),
+            TrieNode(("bar", "baz"), b"new-value"),
+        ),
+        Change(ADD, None, TrieNode(("bar", "xyz"), b"xyz-value")),
+        Change(DELETE, TrieNode(("foo",), b"foo-value"), None),
+    ]
+    assert invalid() == {""}
+
+
+def test_diff_hashes_locking(tmp_path):
+    path = os.fspath(tmp_path / "db")
+    trie = SQLiteTrie.open(path, hashes=True)
+    for root in ("old", "new"):
+        trie[(root, "foo")] = b"foo-value"
+    trie[("new", "bar")] = b"bar-value"
+    trie.commit()
+
+    assert list(trie.diff(("old",), ("new",))) == [
+        Change(ADD, None, TrieNode(("bar",), b"bar-value")),
+    ]
+    # NOTE: refreshed hashes are committed, not left in an open transaction
+    assert not trie._conn.in_transaction
+
+    other = SQLiteTrie.open(path, hashes=True)
+    other[("new", "bar")] = b"other-value"
+    other.commit()
+    # NOTE: keeping the database locked, so that hashes can't be stored
+    other[("new", "baz")] = b"baz-value"
+
+    assert list(trie.diff(("old",), ("new",))) == [
+        Change(ADD, None, TrieNode(("bar",), b"other-value")),
+    ]
+    assert not trie._conn.in_transaction
+    assert trie._conn.execute(
+        "SELECT COUNT(*) FROM nodes WHERE hash IS NULL"
+    ).fetchone()[0]
+
+    other.rollback()
+    other.close()
+    trie.close()
+
+
+@pytest.mark.parametrize("cls", [SQLiteTrie, PyGTrie, SQLAlchemyTrie])
+def test_diff_structural(cls):
+    trie = cls()
+    for root in ("old", "new"):
+        trie[(root,)] = root.encode()
+        trie[(root, "foo")] = b"foo-value"
+        trie[(root, "bar", "baz")] = b"baz-value"
+        trie[(root, "bar", "qux")] = b"qux-value"
+    trie[("new", "bar", "baz")] = b"new-value"
+    trie[("new", "bar", "xyz", "abc")] = b"abc-value"
+    del trie[("new", "foo")]
+
+    assert list(trie.diff(("old",), ("new",))) == [
+        Change(
+            MODIFY,
+            TrieNode(("bar", "baz"), b"baz-value"),
+            TrieNode(("bar", "baz"), b"new-value"),
+        ),
+        Change(ADD, None, TrieNode(("bar", "xyz", "abc"), b"abc-value")),
+        Change(DELETE, TrieNode(("foo",), b"foo-value"), None),
+    ]
+    assert list(trie.diff(("new",), ("old",))) == [
+        Change(
+            MODIFY,
+            TrieNode(("bar", "baz"), b"new-value"),
+            TrieNode(("bar", "baz"), b"baz-value"),
+        ),
+        Change(DELETE, TrieNode(("bar", "xyz", "abc"), b"abc-value"), None),
+        Change(ADD, None, TrieNode(("foo",), b"foo-value")),
+    ]
+    assert [
+        change.key
+        for change in trie.diff(("old",), ("new",), with_unchanged=True)
+        if change.typ == UNCHANGED
+    ] == [("bar", "qux")]
+    assert not list(trie.diff(("old",), ("old",)))
+    with pytest.raises(KeyError):
+        list(trie.diff(("old",), ("missing",)))
+
+
+def test_async(tmp_path):
+    async def _main():
+        path = os.fspath(tmp_path / "db")
+        async with AsyncSQLiteTrie.open(path, batch_size=2) as trie:
+            await trie.set(("foo",), b"foo-value")
+            await trie.update_many(
+                {("foo", "bar", str(idx)): str(idx).encode() for idx in range(5)}
+            )
+            await trie.commit()
+
+            assert await trie.get(("foo",)) == b"foo-value"
+            assert await trie.has_node(("foo", "bar"))
+            assert await trie.len() == 6
+            assert await trie.longest_prefix(("foo", "baz")) == (
+                ("foo",),
+                b"foo-value",
+            )
+            assert await trie.get_many([("foo", "bar", "1"), ("x",)]) == [b"1", None]
+            assert await trie.has_nodes([("foo", "bar"), ("x",)]) == [True, False]
+            assert await trie.longest_prefix_many([("foo", "baz")]) == [
+                (("foo",), b"foo-value")
+            ]
+            assert [key async for key in trie.ls(("foo",))] == [("foo", "bar")]
+            assert [step async for step in trie.prefixes(("foo", "bar", "0"))] == [
+                (("foo",), b"foo-value"),
+                (("foo", "bar", "0"), b"0"),
+            ]
+
+            async def _lookups():
+                return [await trie.get(("foo", "bar", "1")) for _ in range(3)]
+
+            items, lookups = await asyncio.gather(
+                _collect(trie.items(("foo", "bar"))), _lookups()
+            )
+            assert len(items) == 5
+            assert lookups == [b"1"] * 3
+
+            await trie.delete(("foo",))
+            with pytest.raises(KeyError):
+                await trie.get(("foo",))
+            await trie.rollback()
+            assert await trie.get(("foo",)) == b"foo-value"
+
+            changes = [change async for change in trie.diff(("foo",), ("foo",))]
+            assert not changes
+
+    async def _collect(it):
+        return [entry async for entry in it]
+
+    asyncio.run(_main())
+
+
+def test_sqlalchemy_open(tmp_path):
+    path = os.fspath(tmp_path / "db")
+    trie = SQLAlchemyTrie.open(path)
+    deep = tuple(str(idx) for idx in range(100))
+    trie.update_many({("foo",): b"foo-value", deep: b"deep-value"})
+    trie.commit()
+
+    trie[("foo", "bar")] = b"bar-value"
+    assert trie[("foo", "bar")] == b"bar-value"
+    trie.rollback()
+    assert not trie.has_node(("foo", "bar"))
+    trie.close()
+
+    trie = SQLAlchemyTrie.open(path)
+    assert trie[deep] == b"deep-value"
+    assert trie.longest_prefix((*deep, "missing")) == (deep, b"deep-value")
+    assert len(trie) == 2
+    trie.close()
+
+    # NOTE: SQLiteTrie could take over the database, but not the other way
+    # around, as SQLAlchemyTrie doesn't maintain SQLiteTrie's extra columns.
+    trie = SQLiteTrie.open(path)
+    assert list(trie.items()) == [(deep, b"deep-value"), (("foo",), b"foo-value")]
+    trie.close()
+
+    trie = SQLAlchemyTrie.open(path)
+    with pytest.raises(ValueError, match="created by SQLiteTrie"):
+        len(trie)
+    trie.close()
+
+
+def test_sqlalchemy_order():
+    # NOTE: same order as Python compares keys in, regardless of locale
+    keys = [("a",), ("a", "b"), ("a-b",), ("aB",), ("ab",), ("B",), ("é",), ("\x02",)]
+    trie = SQLAlchemyTrie()
+    trie.update_many((key, b"value") for key in keys)
+    assert [key for key, _ in trie.items()] == sorted(keys)
+    assert list(trie.ls(())) == sorted({key[:1] for key in keys})
+
+    for name in ("\x01", "a\x01b"):
+        with pytest.raises(ValueError, match="not supported"):
+            trie[(name,)] = b"value"
+        with pytest.raises(ValueError, match="not supported"):
+            trie.update_many({("a", name): b"value"})
+        with pytest.raises(ValueError, match="not supported"):
+            trie.view((name,))
+
+    stmt = _items_stmt("postgresql").compile(dialect=postgresql.dialect())
+    assert 'ORDER BY subtree.path COLLATE "C"' in str(stmt)
+    stmt = _children_stmt("mysql").compile(dialect=mysql.dialect())
+    assert "ORDER BY nodes.name COLLATE utf8mb4_bin" in str(stmt)
+
+
+def test_sqlalchemy_open_dedup(tmp_path):
+    path = os.fspath(tmp_path / "db")
+    trie = SQLiteTrie.open(path, dedup=True)
+    trie[("foo",)] = b"foo-value"
+    trie.commit()
+    trie.close()
+
+    trie = SQLAlchemyTrie.open(path)
+    with pytest.raises(ValueError, match="created by SQLiteTrie"):
+        trie[("foo",)]
+    trie.close()
+
+
+def test_sqlalchemy_rollback(tmp_path):
+    trie = SQLAlchemyTrie.open(os.fspath(tmp_path / "db"))
+    items = [(("foo", "bar"), b"bar-value"), (("foo", "baz"), b"baz-value")]
+    trie.update_many(items)
+    trie.commit()
+
+    trie.view(("foo",)).clear()
+    assert not list(trie.items())
+    trie.rollback()
+    assert list(trie.items()) == items
+
+    trie.delete_subtree(("foo",))
+    trie.rollback()
+    assert list(trie.items()) == items
+
+    trie[("qux",)] = b"qux-value"
+    with pytest.raises(StatementError):
+        trie.update_many({("new", "foo"): b"foo-value", ("new", "bar"): object()})
+    assert not trie.has_node(("new",))
+    assert trie[("qux",)] == b"qux-value"
+    trie.commit()
+    assert list(trie.items()) == [*items, (("qux",), b"qux-value")]
+    trie.close()
+
+
+def test_snapshot(tmp_path):
+    path = os.fspath(tmp_path / "snapshot")
+    trie = SQLiteTrie()
+    trie[("foo",)] = b"foo-value"
+    trie[("foo", "bar", "baz")] = b"baz-value"
+    trie[("foo", "bar", "qux")] = b""
+    trie[("foobar",)] = None
+    trie[("old", "foo")] = b"foo-value"
+    trie[("new", "foo")] = b"changed"
+    trie[("new", "bar")] = b"bar-value"
+    SnapshotTrie.write(path, trie)
+
+    snapshot = SnapshotTrie.open(path)
+    assert list(snapshot.items()) == list(trie.items())
+    assert len(snapshot) == 7
+    value = snapshot[("foo",)]
+    assert isinstance(value, memoryview)
+    assert value == b"foo-value"
+    assert snapshot[("foobar",)] is None
+    with pytest.raises(ShortKeyError):
+        snapshot[("foo", "bar")]
+    with pytest.raises(KeyError):
+        snapshot[("missing",)]
+    with pytest.raises(NotImplementedError):
+        snapshot[("foo",)] = b"value"
+
+    assert snapshot.has_node(("foo", "bar"))
+    assert not snapshot.has_node(("foo", "ba"))
+    assert list(snapshot.ls(())) == [("foo",), ("foobar",), ("new",), ("old",)]
+    assert list(snapshot.ls(("foo",), with_values=True)) == [(("foo", "bar"), None)]
+    assert list(snapshot.prefixes(("foo", "bar", "baz", "x"))) == [
+        (("foo",), b"foo-value"),
+        (("foo", "bar", "baz"), b"baz-value"),
+    ]
+    assert snapshot.longest_prefix(("foo", "bar", "qux")) == (
+        ("foo", "bar", "qux"),
+        b"",
+    )
+    assert snapshot.shortest_prefix(("bar",)) is None
+    assert list(snapshot.items(("foo",), shallow=True)) == [(("foo",), b"foo-value")]
+    assert list(snapshot.items(("foo", "bar"))) == [
+        (("foo", "bar", "baz"), b"baz-value"),
+        (("foo", "bar", "qux"), b""),
+    ]
+
+    view = snapshot.view(("foo", "bar"))
+    assert len(view) == 2
+    assert view[("baz",)] == b"baz-value"
+    assert not list(snapshot.view(("missing",)).items())
+
+    def node_factory(path_conv, path, children, *value):
+        return (path_conv(path), value, list(children))
+
+    assert snapshot.traverse(node_factory, prefix=("new",)) == trie.traverse(
+        node_factory, prefix=("new",)
+    )
+    assert list(snapshot.diff(("old",), ("new",))) == [
+        Change(ADD, None, TrieNode(("bar",), b"bar-value")),
+        Change(
+            MODIFY,
+            TrieNode(("foo",), b"foo-value"),
+            TrieNode(("foo",), b"changed"),
+        ),
+    ]
+    with pytest.raises(KeyError):
+        list(snapshot.diff(("missing",), ("new",)))
+    with pytest.raises(KeyError):
+        list(snapshot.diff(("new",), ("missing",)))
+
+    # NOTE: views borrow the mapping, closing them leaves the parent usable
+    view.close()
+    assert list(snapshot.items()) == list(trie.items())
+
+    del value
+    snapshot.close()